@@ -19,23 +19,73 @@
 # under the License.
 
 import collections
-import itertools
+import hashlib
+import os
+import time
 
+import eventlet
+from eventlet import greenpool
 from oslo.config import cfg
 import six
 from six.moves.urllib import parse as urlparse
 from stevedore import extension
 
+from ceilometer import checkpoint
 from ceilometer import coordination
 from ceilometer.openstack.common import context
 from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import service as os_service
 from ceilometer import pipeline as publish_pipeline
+from ceilometer import sample
 from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
+OPTS = [
+    cfg.IntOpt('pollster_workers',
+               default=1,
+               help='Number of green threads used to run the pollsters of a '
+                    'polling task concurrently. With the default of 1 the '
+                    'pollsters are run one after another.'),
+    cfg.FloatOpt('pollster_timeout',
+                 default=0,
+                 help='Maximum number of seconds a single pollster may run '
+                      'within a polling cycle before it is cancelled and '
+                      'its samples discarded. 0 means no timeout. A '
+                      'pollster can only be cancelled while it waits, e.g. '
+                      'on I/O or on a libvirt call, which runs in a native '
+                      'thread; a pollster busy on the CPU runs to the end.'),
+    cfg.FloatOpt('polling_jitter',
+                 default=0,
+                 help='Fraction of the polling interval, between 0 and 1, '
+                      'by which the polling cycles of this agent are '
+                      'shifted. The shift is derived from the host name, so '
+                      'it is stable across restarts and spreads the polling '
+                      'of many agents over the interval. Polling cycles are '
+                      'then aligned on the wall clock so that they do not '
+                      'drift. 0 starts polling when the agent starts.'),
+    cfg.BoolOpt('batch_polled_samples',
+                default=False,
+                help='Inject the samples of each pollster into the '
+                     'pipelines as a columnar batch, which batch capable '
+                     'transformers and publishers handle as a whole.'),
+    cfg.IntOpt('pipeline_polling_interval',
+               default=0,
+               help='Number of seconds between checks of the pipeline '
+                    'config file, the pipelines being reloaded when the '
+                    'file changes. 0 disables the checks, the pipelines '
+                    'are then only reloaded when the agent gets SIGHUP.'),
+    cfg.DictOpt('pollster_phase_offsets',
+                default={},
+                help='Offsets, as fractions of the polling interval, at '
+                     'which some pollsters run within each polling cycle, '
+                     'e.g. "disk.read.bytes:0.5". Other pollsters run at '
+                     'the start of the cycle.'),
+]
+
+cfg.CONF.register_opts(OPTS)
+cfg.CONF.import_opt('host', 'ceilometer.service')
 cfg.CONF.import_opt('heartbeat', 'ceilometer.coordination',
                     group='coordination')
 
@@ -110,56 +160,112 @@ class PollingTask(object):
                 key = Resources.key(source, pollster)
                 self.resources[key].setup(source)
 
+    def _pollster_resources(self, source, pollster, agent_resources,
+                            discovery_cache):
+        pollster_resources = None
+        if pollster.obj.default_discovery:
+            pollster_resources = self.manager.discover(
+                [pollster.obj.default_discovery], discovery_cache)
+        key = Resources.key(source, pollster)
+        source_resources = list(self.resources[key].get(discovery_cache))
+        return source_resources or pollster_resources or agent_resources
+
+    def _poll(self, source, pollster, cache, resources):
+        """Run a single pollster, returning its samples or None on error."""
+        LOG.info(_("Polling pollster %(poll)s in the context of %(src)s"),
+                 dict(poll=pollster.name, src=source.name))
+        timeout = cfg.CONF.pollster_timeout or None
+        try:
+            with eventlet.Timeout(timeout):
+                return list(pollster.obj.get_samples(
+                    manager=self.manager,
+                    cache=cache,
+                    resources=resources
+                ))
+        except eventlet.Timeout:
+            LOG.warning(_('Pollster %(name)s cancelled after %(timeout)s '
+                          'seconds') % ({'name': pollster.name,
+                                         'timeout': timeout}))
+        except Exception as err:
+            LOG.warning(_(
+                'Continue after error from %(name)s: %(error)s')
+                % ({'name': pollster.name, 'error': err}),
+                exc_info=True)
+
+    def _poll_serially(self, agent_resources, cache, discovery_cache):
+        pollster_samples = {}
+        polled = set()
+        for source, pollsters in self.pollster_matches.items():
+            for pollster in pollsters:
+                # some sources share pollsters, do not call them multiple times
+                if pollster.name not in polled:
+                    polled.add(pollster.name)
+                    resources = self._pollster_resources(
+                        source, pollster, agent_resources, discovery_cache)
+                    samples = self._poll(source, pollster, cache, resources)
+                    if samples is not None:
+                        pollster_samples[pollster.name] = samples
+        return pollster_samples
+
+    def _poll_concurrently(self, workers, agent_resources, cache,
+                           discovery_cache):
+        # resources are resolved up-front, in this green thread, so that
+        # each discoverer is still invoked at most once per cycle and the
+        # pollsters only share the sample cache while running
+        jobs = {}
+        for source, pollsters in self.pollster_matches.items():
+            for pollster in pollsters:
+                # some sources share pollsters, do not call them multiple times
+                if pollster.name not in jobs:
+                    resources = self._pollster_resources(
+                        source, pollster, agent_resources, discovery_cache)
+                    jobs[pollster.name] = (source, pollster, resources)
+
+        pool = greenpool.GreenPool(workers)
+        threads = dict((name, pool.spawn(self._poll, source, pollster,
+                                         cache, resources))
+                       for name, (source, pollster, resources)
+                       in six.iteritems(jobs))
+        pool.waitall()
+
+        pollster_samples = {}
+        for name, thread in six.iteritems(threads):
+            samples = thread.wait()
+            if samples is not None:
+                pollster_samples[name] = samples
+        return pollster_samples
+
     def poll_and_publish(self):
         """Polling sample and publish into pipeline."""
         #first we poll every pollster and collect samples
-        pollster_samples = {}
-
         agent_resources = self.manager.discover()
         cache = {}
         discovery_cache = {}
-        for source, pollsters in self.pollster_matches.items():
-            for pollster in pollsters:
-                #some sources share pollsters, do not call them multiple times
-                if not pollster_samples.get(pollster.name):
-                    LOG.info(_("Polling pollster %(poll)s in the context of %(src)s"), 
-                        dict(poll=pollster.name, src=source.name))
-
-                    pollster_resources = None
-                    if pollster.obj.default_discovery:
-                        pollster_resources = self.manager.discover(
-                            [pollster.obj.default_discovery], discovery_cache)
-                    key = Resources.key(source, pollster)
-                    source_resources = list(self.resources[key].get(discovery_cache))
-
-                    try:
-                        samples = list(pollster.obj.get_samples(
-                            manager=self.manager,
-                            cache=cache,
-                            resources=(source_resources or
-                                       pollster_resources or
-                                       agent_resources)
-                        ))
-                        pollster_samples[pollster.name] = samples
-                    except Exception as err:
-                        LOG.warning(_(
-                            'Continue after error from %(name)s: %(error)s')
-                            % ({'name': pollster.name, 'error': err}),
-                            exc_info=True)
+        workers = cfg.CONF.pollster_workers
+        if workers > 1:
+            pollster_samples = self._poll_concurrently(
+                workers, agent_resources, cache, discovery_cache)
+        else:
+            pollster_samples = self._poll_serially(
+                agent_resources, cache, discovery_cache)
 
         #now we publish every sample in each pipeline
         for publisher in self.publishers.values():
+            # for each pipeline, samples of supported meters are injected
+            # in a single call, then the pipeline is flushed
+            samples = []
+            for pollster, polled in pollster_samples.items():
+                if publisher.pipeline.support_meter(pollster):
+                    LOG.info(_("Injecting samples from pollster %(pollster)s"),
+                             {'pollster': pollster})
+                    samples.extend(polled)
+            if cfg.CONF.batch_polled_samples:
+                samples = sample.SampleBatch.from_samples(samples)
             with publisher as p:
                 LOG.info(_("Injecting samples into pipeline %(pipeline)s"), 
                     {'pipeline':publisher.pipeline.name})
-
-                #for each pipeline, samples of supported meters are injected
-                #then, at the end of the iterations, the pipeline is flushed
-                for pollster, samples in pollster_samples.items():
-                    if publisher.pipeline.support_meter(pollster):
-                        LOG.info(_("Injecting samples from pollster %(pollster)s"),
-                            {'pollster':pollster})
-                        p(samples)
+                if samples:
+                    p(samples)
 
 class AgentManager(os_service.Service):
 
@@ -209,10 +315,9 @@ class AgentManager(os_service.Service):
 
     def setup_polling_tasks(self):
         polling_tasks = {}
-        for pipeline, pollster in itertools.product(
-                self.pipeline_manager.pipelines,
-                self.pollster_manager.extensions):
-            if pipeline.support_meter(pollster.name):
+        for pollster in self.pollster_manager.extensions:
+            for pipeline in self.pipeline_manager.pipelines_for_meter(
+                    pollster.name):
                 polling_task = polling_tasks.get(pipeline.get_interval())
                 if not polling_task:
                     polling_task = self.create_polling_task()
@@ -227,7 +332,13 @@ class AgentManager(os_service.Service):
                 if discovery_group_id else None)
 
     def start(self):
-        self.pipeline_manager = publish_pipeline.setup_pipeline()
+        # the service is started again on SIGHUP, in which case the sinks
+        # whose configuration did not change are kept
+        previous = getattr(self, 'pipeline_manager', None)
+        self.pipeline_manager = publish_pipeline.setup_pipeline(
+            previous=previous)
+        if cfg.CONF.checkpoint.state_file and previous is None:
+            checkpoint.restore(self.pipeline_manager)
 
         self.partition_coordinator.start()
         self.join_partitioning_groups()
@@ -235,18 +346,174 @@ class AgentManager(os_service.Service):
         # allow time for coordination if necessary
         delay_start = self.partition_coordinator.is_active()
 
-        for interval, task in six.iteritems(self.setup_polling_tasks()):
-            self.tg.add_timer(interval,
-                              self.interval_task,
-                              initial_delay=interval if delay_start else None,
-                              task=task)
+        self.start_polling_tasks(delay_start)
         self.tg.add_timer(cfg.CONF.coordination.heartbeat,
                           self.partition_coordinator.heartbeat)
+        if cfg.CONF.pipeline_polling_interval > 0:
+            self._pipeline_cfg_mtime = self._get_pipeline_cfg_mtime()
+            self.tg.add_timer(cfg.CONF.pipeline_polling_interval,
+                              self.check_pipeline_cfg)
+        if cfg.CONF.checkpoint.state_file:
+            self.tg.add_timer(cfg.CONF.checkpoint.interval,
+                              self.save_checkpoint)
+
+    def stop(self):
+        if cfg.CONF.checkpoint.state_file:
+            self.save_checkpoint()
+        self.pipeline_manager.stop()
+        super(AgentManager, self).stop()
+
+    def save_checkpoint(self):
+        """Save the state of the transformers, for the next start."""
+        try:
+            checkpoint.save(self.pipeline_manager)
+        except Exception:
+            LOG.exception(_('Unable to save the transformers state'))
+
+    def start_polling_tasks(self, delay_start=False, reloading=False):
+        """Run the polling tasks of the current pipelines periodically."""
+        # the polling tasks currently run
+        self.polling_tasks = set()
+        timers = len(self.tg.timers)
+        scheduled = (cfg.CONF.polling_jitter > 0 or
+                     cfg.CONF.pollster_phase_offsets)
+        for interval, task in six.iteritems(self.setup_polling_tasks()):
+            if scheduled:
+                host_offset = self.host_offset(interval)
+                for phase, phase_task in six.iteritems(
+                        self.split_by_phase(task)):
+                    self.polling_tasks.add(phase_task)
+                    self.tg.add_thread(self.scheduled_task, interval,
+                                       host_offset + phase * interval,
+                                       phase_task, delay_start)
+            else:
+                self.polling_tasks.add(task)
+                self.tg.add_timer(
+                    interval,
+                    self.interval_task,
+                    initial_delay=(interval if delay_start or reloading
+                                   else None),
+                    task=task)
+        self._polling_timers = self.tg.timers[timers:]
+
+    @staticmethod
+    def _get_pipeline_cfg_mtime():
+        try:
+            return os.path.getmtime(publish_pipeline.find_pipeline_cfg_file())
+        except (OSError, TypeError):
+            return None
+
+    def check_pipeline_cfg(self):
+        """Reload the pipelines if their config file changed."""
+        mtime = self._get_pipeline_cfg_mtime()
+        if mtime != self._pipeline_cfg_mtime:
+            self._pipeline_cfg_mtime = mtime
+            LOG.info(_('Pipeline config file changed, reloading pipelines'))
+            self.reload_pipeline()
+
+    def reload_pipeline(self):
+        """Reload the pipelines and swap the polling tasks.
+
+        Unchanged sinks keep the state of their transformers. The old
+        polling tasks are stopped and the new ones started without
+        yielding in between, so no polling cycle runs in the middle.
+        """
+        try:
+            pipeline_manager = publish_pipeline.setup_pipeline(
+                previous=self.pipeline_manager)
+        except Exception:
+            LOG.exception(_('Unable to reload the pipelines, keeping the '
+                            'current ones'))
+            return
+
+        previous = self.pipeline_manager
+        self.pipeline_manager = pipeline_manager
+        for timer in self._polling_timers:
+            timer.stop()
+            self.tg.timers.remove(timer)
+        self.start_polling_tasks(reloading=True)
+        self.join_partitioning_groups()
+        previous.stop(replacement=pipeline_manager)
 
     @staticmethod
     def interval_task(task):
         task.poll_and_publish()
 
+    def host_offset(self, interval):
+        """Return the per host shift of the polling cycles, in seconds."""
+        jitter = min(max(cfg.CONF.polling_jitter, 0.0), 1.0)
+        key = '%s-%s' % (cfg.CONF.host, self.group_prefix)
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        return int(digest[:8], 16) / float(0x100000000) * jitter * interval
+
+    def split_by_phase(self, task):
+        """Split a polling task by the phase offsets of its pollsters.
+
+        :return: a dict of (phase, polling task), phases being fractions of
+                 the polling interval.
+        """
+        offsets = {}
+        for name, offset in six.iteritems(cfg.CONF.pollster_phase_offsets):
+            try:
+                offsets[name] = min(max(float(offset), 0.0), 1.0) % 1.0
+            except ValueError:
+                LOG.warning(_('Invalid phase offset %(offset)s for pollster '
+                              '%(name)s') % {'offset': offset, 'name': name})
+
+        pollsters = {}
+        for matches in task.pollster_matches.values():
+            for pollster in matches:
+                pollsters[pollster.name] = pollster
+        phases = set(offsets.get(name, 0.0) for name in pollsters)
+        if len(phases) <= 1:
+            return {phases.pop() if phases else 0.0: task}
+
+        phase_tasks = {}
+        for name, pollster in six.iteritems(pollsters):
+            phase = offsets.get(name, 0.0)
+            phase_task = phase_tasks.get(phase)
+            if not phase_task:
+                phase_task = self.create_polling_task()
+                phase_tasks[phase] = phase_task
+            for publisher in task.publishers.values():
+                if publisher.pipeline.support_meter(name):
+                    phase_task.add(pollster, publisher.pipeline)
+        return phase_tasks
+
+    @staticmethod
+    def next_run(now, interval, offset):
+        """Return the next time aligned on interval, shifted by offset."""
+        return now + interval - (now - offset) % interval
+
+    def scheduled_task(self, interval, offset, task, delay_start=False):
+        """Run a polling task at fixed points of the wall clock.
+
+        Each cycle is scheduled from the wall clock rather than from the end
+        of the previous cycle, so the polling does not drift and cycles
+        overrunning the interval only skip the missed slots.
+        """
+        run_at = self.next_run(time.time(), interval, offset)
+        if delay_start:
+            run_at += interval
+        while True:
+            eventlet.sleep(max(run_at - time.time(), 0))
+            if task not in self.polling_tasks:
+                # replaced by a pipeline reload
+                return
+            try:
+                self.interval_task(task)
+            except Exception:
+                LOG.exception(_('Polling task failed'))
+            following = self.next_run(time.time(), interval, offset)
+            if following - run_at > interval * 1.5:
+                LOG.warning(_('Polling cycle overran its interval of '
+                              '%(interval)s seconds, skipping '
+                              '%(skipped)d cycles')
+                            % {'interval': interval,
+                               'skipped': round((following - run_at)
+                                                / interval) - 1})
+            run_at = following
+
     @staticmethod
     def _parse_discoverer(url):
         s = urlparse.urlparse(url)
@@ -0,0 +1,139 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Checkpoint the state of the transformers on disk.
+
+The rate of change, aggregator and arithmetic transformers only keep their
+state in memory, so after a restart the first polling cycle has nothing to
+derive its samples from. Their state is periodically saved to a local
+msgpack file, and restored on start-up when it is fresh enough.
+"""
+
+import datetime
+import os
+import time
+
+import msgpack
+from oslo.config import cfg
+import six
+
+from ceilometer.openstack.common.gettextutils import _
+from ceilometer.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.StrOpt('state_file',
+               help='File the state of the transformers is saved to, and '
+                    'restored from when the agent starts. Not set by '
+                    'default, which disables the checkpoints.'),
+    cfg.IntOpt('interval',
+               default=60,
+               help='Number of seconds between two checkpoints of the '
+                    'transformers state.'),
+    cfg.IntOpt('max_age',
+               default=3600,
+               help='Checkpoints older than this number of seconds are not '
+                    'restored.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='checkpoint')
+
+VERSION = 1
+
+
+def _encode(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    return six.text_type(obj)
+
+
+def get_state(pipeline_manager):
+    """Return the state of the transformers, by sink name."""
+    sinks = {}
+    for pipeline in pipeline_manager.pipelines:
+        sink = pipeline.sink
+        states = [[i, t.get_state()]
+                  for i, t in enumerate(sink.transformers)]
+        states = [s for s in states if s[1] is not None]
+        if states:
+            sinks[sink.name] = {'cfg': sink.cfg, 'transformers': states}
+    return sinks
+
+
+def save(pipeline_manager, path=None):
+    """Save the state of the transformers, atomically.
+
+    The state is written to a temporary file first, then renamed, so that
+    an interrupted checkpoint never leaves a truncated file behind.
+    """
+    path = path or cfg.CONF.checkpoint.state_file
+    data = msgpack.dumps({'version': VERSION,
+                          'timestamp': time.time(),
+                          'sinks': get_state(pipeline_manager)},
+                         default=_encode)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+    LOG.debug('Transformers state saved to %(path)s (%(size)d bytes)',
+              {'path': path, 'size': len(data)})
+
+
+def restore(pipeline_manager, path=None):
+    """Restore the state of the transformers from the last checkpoint.
+
+    The state of a sink is only restored if its configuration did not
+    change since the checkpoint.
+
+    :return: the number of transformers restored.
+    """
+    path = path or cfg.CONF.checkpoint.state_file
+    try:
+        with open(path, 'rb') as f:
+            checkpoint = msgpack.loads(f.read(), encoding='utf-8')
+    except IOError:
+        LOG.debug('No transformers state to restore from %s', path)
+        return 0
+    except Exception as err:
+        LOG.warn(_('Unable to read the transformers state from %(path)s: '
+                   '%(err)s'), {'path': path, 'err': err})
+        return 0
+
+    if checkpoint.get('version') != VERSION:
+        LOG.warn(_('Ignoring transformers state of unknown version %s'),
+                 checkpoint.get('version'))
+        return 0
+    age = time.time() - checkpoint['timestamp']
+    if age > cfg.CONF.checkpoint.max_age:
+        LOG.info(_('Ignoring transformers state saved %d seconds ago'), age)
+        return 0
+
+    restored = 0
+    for pipeline in pipeline_manager.pipelines:
+        sink = pipeline.sink
+        saved = checkpoint['sinks'].get(sink.name)
+        if not saved or saved['cfg'] != sink.cfg:
+            continue
+        for i, state in saved['transformers']:
+            try:
+                sink.transformers[i].set_state(state)
+                restored += 1
+            except Exception:
+                LOG.exception(_('Unable to restore the state of '
+                                'transformer %(index)d of sink %(sink)s'),
+                              {'index': i, 'sink': sink.name})
+    LOG.info(_('Restored the state of %d transformers'), restored)
+    return restored
@@ -31,8 +31,11 @@ eventlet.monkey_patch(socket=True, select=True, thread=True)
 from oslo.config import cfg
 from oslo.utils import timeutils
 
+from ceilometer import messaging
 from ceilometer.openstack.common import context
+from ceilometer.openstack.common.gettextutils import _
 from ceilometer import pipeline
+from ceilometer import record_file
 from ceilometer import sample
 from ceilometer import service
 from ceilometer import transformer
@@ -104,3 +107,45 @@ def send_sample():
             timestamp=cfg.CONF.sample_timestamp,
             resource_metadata=cfg.CONF.sample_metadata and eval(
                 cfg.CONF.sample_metadata))])
+
+
+def replay_records():
+    """Send the meters of binary record files to the collector."""
+    cfg.CONF.register_cli_opts([
+        cfg.StrOpt('record-file',
+                   positional=True,
+                   help='Binary file written by the file publisher or '
+                        'dispatcher, replayed with its rotated files.'),
+        cfg.IntOpt('batch-size',
+                   default=1000,
+                   help='Number of meters sent together.'),
+    ])
+    cfg.CONF.import_opt('metering_topic', 'ceilometer.publisher.messaging',
+                        group='publisher_rpc')
+    service.prepare_service()
+
+    client = messaging.get_rpc_client(messaging.get_transport(),
+                                      version='1.0')
+    client = client.prepare(topic=cfg.CONF.publisher_rpc.metering_topic)
+    ctxt = context.get_admin_context()
+
+    def send(meters):
+        client.cast(ctxt, 'record_metering_data', data=meters)
+
+    sent = 0
+    meters = []
+    for path in record_file.segments(cfg.CONF.record_file):
+        for record in record_file.read_records(path):
+            # events are recorded in the same files
+            if 'counter_name' not in record:
+                continue
+            meters.append(record)
+            if len(meters) >= cfg.CONF.batch_size:
+                send(meters)
+                sent += len(meters)
+                meters = []
+    if meters:
+        send(meters)
+        sent += len(meters)
+    print(_('Replayed %(count)d meters from %(path)s') %
+          {'count': sent, 'path': cfg.CONF.record_file})
@@ -17,6 +17,8 @@
 
 import socket
 
+import eventlet
+from eventlet import event
 import msgpack
 from oslo.config import cfg
 import oslo.messaging
@@ -28,6 +30,7 @@ from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common.gettextutils import _LE
 from ceilometer.openstack.common import log
 from ceilometer.openstack.common import service as os_service
+from ceilometer.publisher import utils as publisher_utils
 
 OPTS = [
     cfg.StrOpt('udp_address',
@@ -42,6 +45,16 @@ OPTS = [
                 help='Requeue the sample on the collector sample queue '
                 'when the collector fails to dispatch it. This is only valid '
                 'if the sample come from the notifier publisher'),
+    cfg.IntOpt('batch_size',
+               default=0,
+               help='Number of samples recorded together by the '
+                    'dispatchers. The incoming messages are acknowledged '
+                    'once their samples are recorded. 0 records the '
+                    'samples of each message as it comes.'),
+    cfg.FloatOpt('batch_timeout',
+                 default=1.0,
+                 help='Maximum number of seconds a sample waits for its '
+                      'batch to fill up before being recorded.'),
 ]
 
 cfg.CONF.register_opts(OPTS, group="collector")
@@ -54,14 +67,70 @@ cfg.CONF.import_opt('metering_topic', 'ceilometer.publisher.messaging',
 LOG = log.getLogger(__name__)
 
 
+class SampleBatcher(object):
+    """Group the incoming samples to record them together.
+
+    The samples are recorded once batch_size of them are queued, or when
+    the oldest one has waited for timeout seconds. add() returns an event
+    sent True once the samples are recorded by all the dispatchers, False
+    if one of them failed.
+    """
+
+    def __init__(self, dispatcher_manager, size, timeout):
+        self.dispatcher_manager = dispatcher_manager
+        self.size = size
+        self.timeout = timeout
+        self.samples = []
+        self.waiters = []
+        self.timer = None
+
+    def add(self, samples):
+        done = event.Event()
+        self.samples.extend(samples)
+        self.waiters.append(done)
+        if len(self.samples) >= self.size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = eventlet.spawn_after(self.timeout, self.flush)
+        return done
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        samples, waiters = self.samples, self.waiters
+        self.samples, self.waiters = [], []
+        if not waiters:
+            return
+        recorded = True
+        for ext in self.dispatcher_manager:
+            try:
+                ext.obj.record_metering_data_batch(samples)
+            except Exception:
+                LOG.exception(_LE("Dispatcher %(name)s failed to record "
+                                  "%(count)d samples") %
+                              {'name': ext.name, 'count': len(samples)})
+                recorded = False
+        for done in waiters:
+            done.send(recorded)
+
+
 class CollectorService(os_service.Service):
     """Listener for the collector service."""
+
+    batcher = None
+
     def start(self):
         """Bind the UDP socket and handle incoming data."""
         # ensure dispatcher is configured before starting other services
         self.dispatcher_manager = dispatcher.load_dispatcher_manager()
         self.rpc_server = None
         self.notification_server = None
+        self.batcher = None
+        if cfg.CONF.collector.batch_size > 0:
+            self.batcher = SampleBatcher(self.dispatcher_manager,
+                                         cfg.CONF.collector.batch_size,
+                                         cfg.CONF.collector.batch_timeout)
         super(CollectorService, self).start()
 
         if cfg.CONF.collector.udp_address:
@@ -102,10 +171,16 @@ class CollectorService(os_service.Service):
             except Exception:
                 LOG.warn(_("UDP: Cannot decode data sent by %s"), str(source))
             else:
+                # a datagram holds either a sample, or a batch of samples
+                # from publishers with a max_payload_size
                 try:
                     LOG.debug(_("UDP: Storing %s"), str(sample))
-                    self.dispatcher_manager.map_method('record_metering_data',
-                                                       sample)
+                    if self.batcher:
+                        # nothing to acknowledge over UDP
+                        self.batcher.add(self._as_list(sample))
+                    else:
+                        self.dispatcher_manager.map_method(
+                            'record_metering_data', sample)
                 except Exception:
                     LOG.exception(_("UDP: Unable to store meter"))
 
@@ -115,6 +190,8 @@ class CollectorService(os_service.Service):
             self.rpc_server.stop()
         if self.notification_server:
             self.notification_server.stop()
+        if self.batcher:
+            self.batcher.flush()
         super(CollectorService, self).stop()
 
     def sample(self, ctxt, publisher_id, event_type, payload, metadata):
@@ -124,9 +201,18 @@ class CollectorService(os_service.Service):
         bus, this method receives it.
 
         """
+        if self.batcher:
+            # acknowledge the message once its samples are recorded only
+            if self.batcher.add(self._as_list(self._unpack(payload))).wait():
+                return
+            if cfg.CONF.collector.requeue_sample_on_dispatcher_error:
+                LOG.error(_LE("Dispatcher failed to handle the sample, "
+                              "requeue it."))
+                return oslo.messaging.NotificationResult.REQUEUE
+            return
         try:
             self.dispatcher_manager.map_method('record_metering_data',
-                                               data=payload)
+                                               data=self._unpack(payload))
         except Exception:
             if cfg.CONF.collector.requeue_sample_on_dispatcher_error:
                 LOG.exception(_LE("Dispatcher failed to handle the sample, "
@@ -140,4 +226,20 @@ class CollectorService(os_service.Service):
         When the notification messages are re-published through the
         RPC publisher, this method receives them for processing.
         """
-        self.dispatcher_manager.map_method('record_metering_data', data=data)
+        if self.batcher:
+            self.batcher.add(self._as_list(self._unpack(data))).wait()
+            return
+        self.dispatcher_manager.map_method('record_metering_data',
+                                           data=self._unpack(data))
+
+    @staticmethod
+    def _as_list(data):
+        # We may have receive only one counter on the wire
+        return data if isinstance(data, list) else [data]
+
+    @staticmethod
+    def _unpack(data):
+        """Return the metering messages of the batch envelopes."""
+        if publisher_utils.is_batch(data):
+            return publisher_utils.unpack_batch(data)
+        return data
@@ -15,29 +15,215 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import hashlib
+
 from oslo.config import cfg
+from oslo.utils import timeutils
 
+from ceilometer.openstack.common.gettextutils import _
+from ceilometer.openstack.common import log
 from ceilometer import nova_client
 from ceilometer import plugin
 
+LOG = log.getLogger(__name__)
+
 OPTS = [
     cfg.BoolOpt('workload_partitioning',
                 default=False,
                 help='Enable work-load partitioning, allowing multiple '
-                     'compute agents to be run simultaneously.')
+                     'compute agents to be run simultaneously.'),
+    cfg.IntOpt('resource_update_interval',
+               default=0,
+               help='Number of seconds between two queries to Nova for the '
+                    'instances changed since the previous one. 0 queries '
+                    'Nova on every polling cycle. The instances started or '
+                    'stopped on the host are discovered on the next cycle '
+                    'regardless.'),
+    cfg.IntOpt('resource_cache_expiry',
+               default=3600,
+               help='Number of seconds after which all the instances of the '
+                    'host are discovered again from Nova, rather than only '
+                    'those changed since the previous query.'),
+    cfg.StrOpt('instance_discovery_method',
+               default='nova',
+               help='How the instances of the host are discovered: "nova" '
+                    'queries the Nova API, "libvirt_metadata" lists the '
+                    'libvirt domains and reads the metadata Nova wrote in '
+                    'them, only querying Nova for the flavor ids and the '
+                    'domains without metadata. The instance user metadata '
+                    'is not available with "libvirt_metadata".'),
 ]
 cfg.CONF.register_opts(OPTS, group='compute')
 
 
+class LocalInstance(object):
+    """An instance built from the metadata Nova wrote in its domain.
+
+    It has the attributes of the Nova servers used by the pollsters. The
+    domain metadata only holds the image id: the discovery adds the image
+    name from Nova, and the image has no links, so that the samples have
+    no image_ref_url, as for the instances sent by the Nova notifier.
+    """
+
+    # vm_state -> Nova server status
+    STATUSES = {'active': 'ACTIVE', 'paused': 'PAUSED', 'stopped': 'SHUTOFF'}
+
+    def __init__(self, domain, vm_state, metadata, flavor_id):
+        self.id = domain.UUID
+        self.name = metadata['name']
+        self.status = self.STATUSES.get(vm_state, vm_state.upper())
+        self.user_id = metadata['user_id']
+        self.tenant_id = metadata['project_id']
+        self.hostId = hashlib.sha224(
+            (self.tenant_id or '') + cfg.CONF.host).hexdigest()
+        self.flavor = dict(metadata['flavor'], id=flavor_id)
+        self.image = ({'id': metadata['image_id']}
+                      if metadata['image_id'] else None)
+        self.metadata = {}
+        setattr(self, 'OS-EXT-SRV-ATTR:instance_name', domain.name)
+        setattr(self, 'OS-EXT-STS:vm_state', vm_state)
+
+
 class InstanceDiscovery(plugin.DiscoveryBase):
+    """Discovery of the instances running on the host.
+
+    The instances are cached across polling cycles. After a first full
+    listing, Nova is only asked for the instances changed since the
+    previous query, and the whole listing is done again when the cache
+    expires. The domains running on the hypervisor are checked on every
+    cycle, so that Nova is queried straight away when they change.
+
+    With the libvirt_metadata method, the instances are built from the
+    domains of the hypervisor instead, and Nova is only queried for what
+    the domains lack.
+    """
+
     def __init__(self):
         super(InstanceDiscovery, self).__init__()
         self.nova_cli = nova_client.Client()
+        # instance id -> instance, in the order listed by Nova
+        self.instances = collections.OrderedDict()
+        self.last_run = None
+        self.last_full_run = None
+        self.local_ids = None
+        # flavor name -> flavor id
+        self.flavor_ids = {}
+        self.last_flavor_run = None
+
+    def _local_changes(self, manager):
+        """Check whether domains were started or stopped on the host.
+
+        :return: None if unknown, else a pair of booleans telling if
+                 domains appeared and if domains disappeared.
+        """
+        inspector = getattr(manager, 'inspector', None)
+        if inspector is None:
+            return None
+        try:
+            local_ids = set(i.UUID for i in inspector.inspect_instances())
+        except Exception:
+            return None
+        previous, self.local_ids = self.local_ids, local_ids
+        if previous is None:
+            return None
+        return bool(local_ids - previous), bool(previous - local_ids)
+
+    def _resync(self, now):
+        instances = self.nova_cli.instance_get_all_by_host(cfg.CONF.host)
+        self.instances = collections.OrderedDict((i.id, i) for i in instances)
+        self.last_run = self.last_full_run = now
+
+    def _update(self, now):
+        instances = self.nova_cli.instance_get_all_by_host(
+            cfg.CONF.host, since=self.last_run.isoformat())
+        for instance in instances:
+            if (getattr(instance, 'OS-EXT-STS:vm_state', None) == 'deleted'
+                    or getattr(instance, 'status', None) == 'DELETED'):
+                self.instances.pop(instance.id, None)
+            else:
+                self.instances[instance.id] = instance
+        self.last_run = now
 
     def discover(self, manager, param=None):
         """Discover resources to monitor."""
-        instances = self.nova_cli.instance_get_all_by_host(cfg.CONF.host)
-        return [i for i in instances
+        method = cfg.CONF.compute.instance_discovery_method
+        if method == 'libvirt_metadata':
+            return self._discover_from_domains(manager)
+        if method != 'nova':
+            LOG.warn(_('Instance discovery method is unknown (%s), using '
+                       'nova') % method)
+        return self._discover_from_nova(manager)
+
+    def _flavor_id(self, name):
+        """Return the id of a flavor, listing the flavors if unknown."""
+        now = timeutils.utcnow()
+        if name not in self.flavor_ids and (
+                self.last_flavor_run is None or
+                timeutils.delta_seconds(self.last_flavor_run, now) >=
+                cfg.CONF.compute.resource_cache_expiry):
+            self.last_flavor_run = now
+            try:
+                self.flavor_ids = dict((f.name, f.id) for f
+                                       in self.nova_cli.flavor_get_all())
+            except Exception:
+                LOG.warn(_('Unable to list the flavors from Nova'))
+        return self.flavor_ids.get(name)
+
+    def _discover_from_domains(self, manager):
+        instances = []
+        missing = set()
+        with_image = True
+        for domain, vm_state, metadata in (
+                manager.inspector.inspect_instances_metadata()):
+            if metadata is None:
+                missing.add(domain.UUID)
+                continue
+            instance = LocalInstance(
+                domain, vm_state, metadata,
+                self._flavor_id(metadata['flavor']['name']))
+            if with_image:
+                try:
+                    self.nova_cli.with_image(instance)
+                except Exception:
+                    # do not wait for Nova again for the other instances
+                    with_image = False
+                    LOG.warn(_('Unable to get the images of the instances '
+                               'from Nova'))
+            instances.append(instance)
+        if missing:
+            # domains created by a Nova not writing metadata
+            try:
+                instances.extend(i for i in self._discover_from_nova(manager)
+                                 if i.id in missing)
+            except Exception:
+                LOG.warn(_('Unable to discover %d instances without domain '
+                           'metadata from Nova'), len(missing))
+        return instances
+
+    def _discover_from_nova(self, manager):
+        conf = cfg.CONF.compute
+        now = timeutils.utcnow()
+        changes = self._local_changes(manager)
+        try:
+            if (self.last_full_run is None or
+                    (changes and changes[1]) or
+                    timeutils.delta_seconds(self.last_full_run, now) >=
+                    conf.resource_cache_expiry):
+                # stopped, deleted and migrated instances are not all
+                # reported by the changes-since queries
+                self._resync(now)
+            elif ((changes and changes[0]) or
+                    timeutils.delta_seconds(self.last_run, now) >=
+                    conf.resource_update_interval):
+                self._update(now)
+        except Exception:
+            if self.last_full_run is None:
+                raise
+            LOG.warn(_('Unable to refresh the instances from Nova, using '
+                       'the ones discovered %d seconds ago'),
+                     timeutils.delta_seconds(self.last_run, now))
+        return [i for i in self.instances.values()
                 if getattr(i, 'OS-EXT-STS:vm_state', None) != 'error']
 
     @property
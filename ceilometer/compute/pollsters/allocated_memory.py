@@ -16,13 +16,17 @@ class AllocatedMemoryPollster(plugin.ComputePollster):
         for instance in resources:
             LOG.debug(_('Checking allocated memory for instance %s'), instance.id)
             try:
-                memory_info = manager.inspector.inspect_allocated_memory(
-                    instance)
+                stats = util.domain_stats(manager.inspector, cache, instance)
+                memory_info = (
+                    stats.allocated_memory
+                    if stats is not None and stats.allocated_memory else
+                    manager.inspector.inspect_allocated_memory(instance))
                 LOG.debug(_("ALLOCATED MEMORY: %(instance)s %(allocated)f"),
                           ({'instance': instance.__dict__,
                             'allocated': memory_info.allocated}))
                 yield util.make_sample_from_instance(
                     instance,
+                    cache=cache,
                     name='memory.allocated',
                     type=sample.TYPE_GAUGE,
                     unit='MB',
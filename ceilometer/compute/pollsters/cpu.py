@@ -34,13 +34,16 @@ class CPUPollster(plugin.ComputePollster):
             LOG.debug(_('checking instance %s'), instance.id)
             instance_name = util.instance_name(instance)
             try:
-                cpu_info = manager.inspector.inspect_cpus(instance_name)
+                stats = util.domain_stats(manager.inspector, cache, instance)
+                cpu_info = (stats.cpu if stats is not None else
+                            manager.inspector.inspect_cpus(instance_name))
                 LOG.debug(_("CPUTIME USAGE: %(instance)s %(time)d"),
                           {'instance': instance.__dict__,
                            'time': cpu_info.time})
                 cpu_num = {'cpu_number': cpu_info.number}
                 yield util.make_sample_from_instance(
                     instance,
+                    cache=cache,
                     name='cpu',
                     type=sample.TYPE_CUMULATIVE,
                     unit='ns',
@@ -73,6 +76,7 @@ class CPUUtilPollster(plugin.ComputePollster):
                             'util': cpu_info.util}))
                 yield util.make_sample_from_instance(
                     instance,
+                    cache=cache,
                     name='cpu_util',
                     type=sample.TYPE_GAUGE,
                     unit='%',
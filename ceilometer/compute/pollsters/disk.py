@@ -72,7 +72,10 @@ class _Base(plugin.ComputePollster):
             per_device_read_requests = {}
             per_device_write_bytes = {}
             per_device_write_requests = {}
-            for disk, info in inspector.inspect_disks(instance_name):
+            stats = util.domain_stats(inspector, cache, instance)
+            disks = (stats.disks if stats is not None else
+                     inspector.inspect_disks(instance_name))
+            for disk, info in disks:
                 LOG.debug(self.DISKIO_USAGE_MESSAGE,
                           instance, disk.device, info.read_requests,
                           info.read_bytes, info.write_requests,
@@ -102,7 +105,7 @@ class _Base(plugin.ComputePollster):
         return i_cache[instance_name]
 
     @abc.abstractmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         """Return one or more Sample."""
 
     def get_samples(self, manager, cache, resources):
@@ -115,7 +118,7 @@ class _Base(plugin.ComputePollster):
                     instance,
                     instance_name,
                 )
-                for s in self._get_samples(instance, c_data):
+                for s in self._get_samples(instance, c_data, cache):
                     yield s
             except virt_inspector.InstanceNotFoundException as err:
                 # Instance was deleted while getting samples. Ignore it.
@@ -134,9 +137,10 @@ class _Base(plugin.ComputePollster):
 class ReadRequestsPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.read.requests',
             type=sample.TYPE_CUMULATIVE,
             unit='request',
@@ -149,12 +153,13 @@ class ReadRequestsPollster(_Base):
 class PerDeviceReadRequestsPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         samples = []
         for disk, value in six.iteritems(c_data.per_disk_requests[
                 'read_requests']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.read.requests',
                 type=sample.TYPE_CUMULATIVE,
                 unit='request',
@@ -167,9 +172,10 @@ class PerDeviceReadRequestsPollster(_Base):
 class ReadBytesPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.read.bytes',
             type=sample.TYPE_CUMULATIVE,
             unit='B',
@@ -182,12 +188,13 @@ class ReadBytesPollster(_Base):
 class PerDeviceReadBytesPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         samples = []
         for disk, value in six.iteritems(c_data.per_disk_requests[
                 'read_bytes']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.read.bytes',
                 type=sample.TYPE_CUMULATIVE,
                 unit='B',
@@ -200,9 +207,10 @@ class PerDeviceReadBytesPollster(_Base):
 class WriteRequestsPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.write.requests',
             type=sample.TYPE_CUMULATIVE,
             unit='request',
@@ -215,12 +223,13 @@ class WriteRequestsPollster(_Base):
 class PerDeviceWriteRequestsPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         samples = []
         for disk, value in six.iteritems(c_data.per_disk_requests[
                 'write_requests']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.write.requests',
                 type=sample.TYPE_CUMULATIVE,
                 unit='request',
@@ -233,9 +242,10 @@ class PerDeviceWriteRequestsPollster(_Base):
 class WriteBytesPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.write.bytes',
             type=sample.TYPE_CUMULATIVE,
             unit='B',
@@ -248,12 +258,13 @@ class WriteBytesPollster(_Base):
 class PerDeviceWriteBytesPollster(_Base):
 
     @staticmethod
-    def _get_samples(instance, c_data):
+    def _get_samples(instance, c_data, cache):
         samples = []
         for disk, value in six.iteritems(c_data.per_disk_requests[
                 'write_bytes']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.write.bytes',
                 type=sample.TYPE_CUMULATIVE,
                 unit='B',
@@ -308,7 +319,7 @@ class _DiskRatesPollsterBase(plugin.ComputePollster):
         return i_cache[instance.id]
 
     @abc.abstractmethod
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         """Return one or more Sample."""
 
     def get_samples(self, manager, cache, resources):
@@ -320,7 +331,8 @@ class _DiskRatesPollsterBase(plugin.ComputePollster):
                     cache,
                     instance,
                 )
-                for disk_rate in self._get_samples(instance, disk_rates_info):
+                for disk_rate in self._get_samples(instance, disk_rates_info,
+                                                   cache):
                     yield disk_rate
             except virt_inspector.InstanceNotFoundException as err:
                 # Instance was deleted while getting samples. Ignore it.
@@ -339,9 +351,10 @@ class _DiskRatesPollsterBase(plugin.ComputePollster):
 
 class ReadBytesRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.read.bytes.rate',
             type=sample.TYPE_GAUGE,
             unit='B/s',
@@ -354,12 +367,13 @@ class ReadBytesRatePollster(_DiskRatesPollsterBase):
 
 class PerDeviceReadBytesRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         samples = []
         for disk, value in six.iteritems(disk_rates_info.per_disk_rate[
                 'read_bytes_rate']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.read.bytes.rate',
                 type=sample.TYPE_GAUGE,
                 unit='B/s',
@@ -371,9 +385,10 @@ class PerDeviceReadBytesRatePollster(_DiskRatesPollsterBase):
 
 class ReadRequestsRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.read.requests.rate',
             type=sample.TYPE_GAUGE,
             unit='requests/s',
@@ -386,12 +401,13 @@ class ReadRequestsRatePollster(_DiskRatesPollsterBase):
 
 class PerDeviceReadRequestsRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         samples = []
         for disk, value in six.iteritems(disk_rates_info.per_disk_rate[
                 'read_requests_rate']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.read.requests.rate',
                 type=sample.TYPE_GAUGE,
                 unit='requests/s',
@@ -403,9 +419,10 @@ class PerDeviceReadRequestsRatePollster(_DiskRatesPollsterBase):
 
 class WriteBytesRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.write.bytes.rate',
             type=sample.TYPE_GAUGE,
             unit='B/s',
@@ -418,12 +435,13 @@ class WriteBytesRatePollster(_DiskRatesPollsterBase):
 
 class PerDeviceWriteBytesRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         samples = []
         for disk, value in six.iteritems(disk_rates_info.per_disk_rate[
                 'write_bytes_rate']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.write.bytes.rate',
                 type=sample.TYPE_GAUGE,
                 unit='B/s',
@@ -435,9 +453,10 @@ class PerDeviceWriteBytesRatePollster(_DiskRatesPollsterBase):
 
 class WriteRequestsRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         return [util.make_sample_from_instance(
             instance,
+            cache=cache,
             name='disk.write.requests.rate',
             type=sample.TYPE_GAUGE,
             unit='requests/s',
@@ -450,12 +469,13 @@ class WriteRequestsRatePollster(_DiskRatesPollsterBase):
 
 class PerDeviceWriteRequestsRatePollster(_DiskRatesPollsterBase):
 
-    def _get_samples(self, instance, disk_rates_info):
+    def _get_samples(self, instance, disk_rates_info, cache):
         samples = []
         for disk, value in six.iteritems(disk_rates_info.per_disk_rate[
                 'write_requests_rate']):
             samples.append(util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='disk.device.write.requests.rate',
                 type=sample.TYPE_GAUGE,
                 unit='requests/s',
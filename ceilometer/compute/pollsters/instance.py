@@ -29,6 +29,7 @@ class InstancePollster(plugin.ComputePollster):
         for instance in resources:
             yield util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 name='instance',
                 type=sample.TYPE_GAUGE,
                 unit='instance',
@@ -43,6 +44,7 @@ class InstanceFlavorPollster(plugin.ComputePollster):
         for instance in resources:
             yield util.make_sample_from_instance(
                 instance,
+                cache=cache,
                 # Use the "meter name + variable" syntax
                 name='instance:%s' %
                 instance.flavor['name'],
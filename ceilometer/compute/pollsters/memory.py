@@ -37,6 +37,7 @@ class MemoryUsagePollster(plugin.ComputePollster):
                             'usage': memory_info.usage}))
                 yield util.make_sample_from_instance(
                     instance,
+                    cache=cache,
                     name='memory.usage',
                     type=sample.TYPE_GAUGE,
                     unit='MB',
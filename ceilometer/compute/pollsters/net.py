@@ -69,7 +69,10 @@ class _Base(plugin.ComputePollster):
 
     CACHE_KEY_VNIC = 'vnics'
 
-    def _get_vnic_info(self, inspector, instance):
+    def _get_vnic_info(self, inspector, cache, instance):
+        stats = util.domain_stats(inspector, cache, instance)
+        if stats is not None:
+            return stats.vnics
         instance_name = util.instance_name(instance)
         return inspector.inspect_vnics(instance_name)
 
@@ -86,7 +89,7 @@ class _Base(plugin.ComputePollster):
         i_cache = cache.setdefault(self.CACHE_KEY_VNIC, {})
         if instance_name not in i_cache:
             i_cache[instance_name] = list(
-                self._get_vnic_info(inspector, instance)
+                self._get_vnic_info(inspector, cache, instance)
             )
         return i_cache[instance_name]
 
@@ -128,7 +131,7 @@ class _RateBase(_Base):
 
     CACHE_KEY_VNIC = 'vnic-rates'
 
-    def _get_vnic_info(self, inspector, instance):
+    def _get_vnic_info(self, inspector, cache, instance):
         return inspector.inspect_vnic_rates(instance,
                                             self._inspection_duration)
 
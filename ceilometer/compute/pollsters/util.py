@@ -18,9 +18,17 @@
 # under the License.
 from oslo.utils import timeutils
 
+import ceilometer
 from ceilometer.compute import util as compute_util
+from ceilometer.openstack.common.gettextutils import _
+from ceilometer.openstack.common import log
 from ceilometer import sample
 
+LOG = log.getLogger(__name__)
+
+CACHE_KEY_DOMAIN_STATS = 'domain-stats'
+CACHE_KEY_METADATA = 'resource-metadata'
+
 
 INSTANCE_PROPERTIES = [
     # Identity properties
@@ -74,11 +82,30 @@ def _get_metadata_from_object(instance):
     return compute_util.add_reserved_user_metadata(instance.metadata, metadata)
 
 
+def get_metadata(instance, cache=None):
+    """Return the metadata of the instance for the current polling cycle.
+
+    The metadata of an instance is built once per cycle and kept in the
+    polling cache, so that it is shared by the samples of all the compute
+    pollsters. The returned dict must hence not be modified.
+    """
+    if cache is None:
+        return _get_metadata_from_object(instance)
+    i_cache = cache.setdefault(CACHE_KEY_METADATA, {})
+    try:
+        return i_cache[instance.id]
+    except KeyError:
+        metadata = i_cache[instance.id] = _get_metadata_from_object(instance)
+        return metadata
+
+
 def make_sample_from_instance(instance, name, type, unit, volume,
-                              resource_id=None, additional_metadata=None):
-    additional_metadata = additional_metadata or {}
-    resource_metadata = _get_metadata_from_object(instance)
-    resource_metadata.update(additional_metadata)
+                              resource_id=None, additional_metadata=None,
+                              cache=None):
+    resource_metadata = get_metadata(instance, cache)
+    if additional_metadata:
+        # copy on write, the metadata is shared with the other samples
+        resource_metadata = dict(resource_metadata, **additional_metadata)
     return sample.Sample(
         name=name,
         type=type,
@@ -95,3 +122,26 @@ def make_sample_from_instance(instance, name, type, unit, volume,
 def instance_name(instance):
     """Shortcut to get instance name."""
     return getattr(instance, 'OS-EXT-SRV-ATTR:instance_name', None)
+
+
+def domain_stats(inspector, cache, instance):
+    """Return the DomainStats of the instance for the current polling cycle.
+
+    The stats of all the instances on the host are inspected once per
+    cycle and kept in the polling cache, so that the compute pollsters
+    share a single round-trip to the hypervisor.
+
+    :return: the DomainStats of the instance, or None if the inspector
+             does not support bulk inspection or the instance is missing
+             from the snapshot
+    """
+    if CACHE_KEY_DOMAIN_STATS not in cache:
+        try:
+            cache[CACHE_KEY_DOMAIN_STATS] = inspector.inspect_domain_stats()
+        except ceilometer.NotImplementedError:
+            return None
+        except Exception as err:
+            LOG.warn(_('Unable to inspect domain stats, falling back to '
+                       'per-instance inspection: %s'), err)
+            cache[CACHE_KEY_DOMAIN_STATS] = {}
+    return cache[CACHE_KEY_DOMAIN_STATS].get(instance_name(instance))
@@ -150,6 +150,18 @@ HostMemoryUsage = collections.namedtuple('HostMemoryUsage',
 HostCPUStats = collections.namedtuple('HostCPUStats', 
                                      ['number', 'time'])
 
+# Named tuple representing a snapshot of the statistics of an instance,
+# gathered once per polling cycle and shared by the compute pollsters.
+#
+# cpu: CPUStats of the instance
+# allocated_memory: AllocatedMemoryStats, or None if not available
+# vnics: list of (Interface, InterfaceStats) tuples
+# disks: list of (Disk, DiskStats) tuples
+#
+DomainStats = collections.namedtuple('DomainStats',
+                                     ['cpu', 'allocated_memory',
+                                      'vnics', 'disks'])
+
 
 # Exception types
 #
@@ -170,6 +182,17 @@ class Inspector(object):
         """List the instances on the current host."""
         raise ceilometer.NotImplementedError
 
+    def inspect_instances_metadata(self):
+        """List the instances on the host with the metadata Nova gave them.
+
+        :return: for each instance, the Instance, its state as a Nova
+                 vm_state (active, paused or stopped), and the Nova metadata
+                 found in its domain as a dict with the name, flavor,
+                 user_id, project_id and image_id keys, or None if there is
+                 none
+        """
+        raise ceilometer.NotImplementedError
+
     def inspect_cpus(self, instance_name):
         """Inspect the CPU statistics for an instance.
 
@@ -249,6 +272,13 @@ class Inspector(object):
         """
         raise ceilometer.NotImplementedError
 
+    def inspect_domain_stats(self):
+        """Inspect the statistics of all the instances on the current host.
+
+        :return: a dict mapping instance names to DomainStats
+        """
+        raise ceilometer.NotImplementedError
+
     def inspect_host_memory_usage(self, host_resource_id):
         """Inspect memory usage of current compute host.
 
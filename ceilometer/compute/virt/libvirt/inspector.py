@@ -16,6 +16,9 @@
 # under the License.
 """Implementation of Inspector abstraction for libvirt."""
 
+import collections
+
+from eventlet import tpool
 from lxml import etree
 from oslo.config import cfg
 from oslo.utils import units
@@ -25,6 +28,7 @@ from ceilometer.compute.pollsters import util
 from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log as logging
+from ceilometer import utils
 
 libvirt = None
 
@@ -39,11 +43,25 @@ libvirt_opts = [
                default='',
                help='Override the default libvirt URI '
                     '(which is dependent on libvirt_type).'),
+    cfg.IntOpt('libvirt_device_cache_size',
+               default=1024,
+               help='Maximum number of domains whose interface and disk '
+                    'devices, and Nova metadata, parsed from the domain XML, '
+                    'are cached.'),
+    cfg.IntOpt('libvirt_device_cache_ttl',
+               default=600,
+               help='Number of seconds after which the cached devices and '
+                    'metadata of a domain are parsed again from the domain '
+                    'XML, to pick up devices hot-plugged without a domain '
+                    'restart.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(libvirt_opts)
 
+# namespace of the instance metadata Nova writes in the domain XML
+NOVA_NS = 'http://openstack.org/xmlns/libvirt/nova/1.0'
+
 
 def retry_on_disconnect(function):
     def decorator(self, *args, **kwargs):
@@ -61,6 +79,19 @@ def retry_on_disconnect(function):
     return decorator
 
 
+# Named tuple representing the devices parsed from a domain XML.
+#
+# domain_id: the ID of the domain when its XML was parsed, which changes
+#            whenever the domain is restarted
+# interface_names: the target devices of all the domain interfaces
+# interfaces: the Interface of the inspectable domain interfaces
+# disks: the Disk of the domain disks
+#
+DomainDevices = collections.namedtuple('DomainDevices',
+                                       ['domain_id', 'interface_names',
+                                        'interfaces', 'disks'])
+
+
 class LibvirtInspector(virt_inspector.Inspector):
 
     per_type_uris = dict(uml='uml:///system', xen='xen:///', lxc='lxc:///')
@@ -68,6 +99,12 @@ class LibvirtInspector(virt_inspector.Inspector):
     def __init__(self):
         self.uri = self._get_uri()
         self.connection = None
+        # parsed domain devices, keyed by domain UUID
+        self._devices = utils.LRUCache(CONF.libvirt_device_cache_size,
+                                       ttl=CONF.libvirt_device_cache_ttl)
+        # (domain ID, parsed Nova metadata), keyed by domain UUID
+        self._metadata = utils.LRUCache(CONF.libvirt_device_cache_size,
+                                        ttl=CONF.libvirt_device_cache_ttl)
 
     def _get_uri(self):
         return CONF.libvirt_uri or self.per_type_uris.get(CONF.libvirt_type,
@@ -79,7 +116,11 @@ class LibvirtInspector(virt_inspector.Inspector):
             if libvirt is None:
                 libvirt = __import__('libvirt')
             LOG.debug('Connecting to libvirt: %s', self.uri)
-            self.connection = libvirt.openReadOnly(self.uri)
+            # libvirt calls block in C without yielding to the other green
+            # threads, run them in native threads as Nova does
+            self.connection = tpool.proxy_call(
+                (libvirt.virDomain, libvirt.virConnect),
+                libvirt.openReadOnly, self.uri)
 
         return self.connection
 
@@ -119,20 +160,73 @@ class LibvirtInspector(virt_inspector.Inspector):
                         # Instance was deleted while listing... ignore it
                         pass
 
+    @staticmethod
+    def _parse_nova_metadata(tree):
+        instance = tree.find('metadata/{%s}instance' % NOVA_NS)
+        if instance is None:
+            return None
+
+        def find(path):
+            return instance.find(path, namespaces={'nova': NOVA_NS})
+
+        def number(path):
+            element = find(path)
+            return int(element.text) if element is not None else 0
+
+        name = find('nova:name')
+        flavor = find('nova:flavor')
+        user = find('nova:owner/nova:user')
+        project = find('nova:owner/nova:project')
+        root = find('nova:root')
+        return {
+            'name': name.text if name is not None else None,
+            'flavor': {
+                'name': flavor.get('name') if flavor is not None else None,
+                'vcpus': number('nova:flavor/nova:vcpus'),
+                'ram': number('nova:flavor/nova:memory'),
+                'disk': number('nova:flavor/nova:disk'),
+                'ephemeral': number('nova:flavor/nova:ephemeral'),
+            },
+            'user_id': user.get('uuid') if user is not None else None,
+            'project_id': project.get('uuid') if project is not None else None,
+            'image_id': (root.get('uuid') if root is not None and
+                         root.get('type') == 'image' else None),
+        }
+
+    @retry_on_disconnect
+    def inspect_instances_metadata(self):
+        for domain in self._get_connection().listAllDomains(0):
+            try:
+                instance = virt_inspector.Instance(name=domain.name(),
+                                                   UUID=domain.UUIDString())
+                domain_id = domain.ID()
+                cached = self._metadata.get(instance.UUID)
+                if cached is None or cached[0] != domain_id:
+                    tree = etree.fromstring(domain.XMLDesc(0))
+                    cached = (domain_id, self._parse_nova_metadata(tree))
+                    self._metadata[instance.UUID] = cached
+                state = self._vm_state(domain.info()[0])
+            except libvirt.libvirtError:
+                # Instance was deleted while listing... ignore it
+                continue
+            yield instance, state, cached[1]
+
+    @staticmethod
+    def _vm_state(state):
+        if state == libvirt.VIR_DOMAIN_PAUSED:
+            return 'paused'
+        if state in (libvirt.VIR_DOMAIN_SHUTDOWN, libvirt.VIR_DOMAIN_SHUTOFF,
+                     libvirt.VIR_DOMAIN_CRASHED):
+            return 'stopped'
+        return 'active'
+
     def inspect_cpus(self, instance_name):
         domain = self._lookup_by_name(instance_name)
         dom_info = domain.info()
         return virt_inspector.CPUStats(number=dom_info[3], time=dom_info[4])
 
-    def inspect_vnics(self, instance_name):
-        domain = self._lookup_by_name(instance_name)
-        state = domain.info()[0]
-        if state == libvirt.VIR_DOMAIN_SHUTOFF:
-            LOG.warn(_('Failed to inspect vnics of %(instance_name)s, '
-                       'domain is in state of SHUTOFF'),
-                     {'instance_name': instance_name})
-            return
-        tree = etree.fromstring(domain.XMLDesc(0))
+    @staticmethod
+    def _parse_interfaces(tree):
         for iface in tree.findall('devices/interface'):
             target = iface.find('target')
             if target is not None:
@@ -150,14 +244,77 @@ class LibvirtInspector(virt_inspector.Inspector):
 
             params = dict((p.get('name').lower(), p.get('value'))
                           for p in iface.findall('filterref/parameter'))
-            interface = virt_inspector.Interface(name=name, mac=mac_address,
-                                                 fref=fref, parameters=params)
-            dom_stats = domain.interfaceStats(name)
-            stats = virt_inspector.InterfaceStats(rx_bytes=dom_stats[0],
-                                                  rx_packets=dom_stats[1],
-                                                  tx_bytes=dom_stats[4],
-                                                  tx_packets=dom_stats[5])
-            yield (interface, stats)
+            yield virt_inspector.Interface(name=name, mac=mac_address,
+                                           fref=fref, parameters=params)
+
+    @staticmethod
+    def _parse_disks(tree):
+        for device in filter(
+                bool,
+                [target.get("dev")
+                 for target in tree.findall('devices/disk/target')]):
+            yield virt_inspector.Disk(device=device)
+
+    def _get_devices(self, domain, interface_names=None, disk_names=None):
+        """Return the DomainDevices of a domain, parsing its XML if needed.
+
+        The parsed devices are cached by domain UUID and parsed again when
+        the domain has been restarted since, or when the given interface
+        or disk names, as reported by libvirt, differ from the cached ones.
+        """
+        uuid = domain.UUIDString()
+        domain_id = domain.ID()
+        devices = self._devices.get(uuid)
+        if (devices is None or devices.domain_id != domain_id or
+                (interface_names is not None and
+                 devices.interface_names != frozenset(interface_names)) or
+                (disk_names is not None and
+                 frozenset(d.device for d in devices.disks) !=
+                 frozenset(disk_names))):
+            tree = etree.fromstring(domain.XMLDesc(0))
+            devices = DomainDevices(
+                domain_id=domain_id,
+                interface_names=frozenset(
+                    target.get('dev') for target
+                    in tree.findall('devices/interface/target')),
+                interfaces=list(self._parse_interfaces(tree)),
+                disks=list(self._parse_disks(tree)))
+            self._devices[uuid] = devices
+        return devices
+
+    def _get_interfaces(self, domain):
+        return self._get_devices(domain).interfaces
+
+    def _get_disks(self, domain):
+        return self._get_devices(domain).disks
+
+    @staticmethod
+    def _interface_stats(domain, interface):
+        dom_stats = domain.interfaceStats(interface.name)
+        return virt_inspector.InterfaceStats(rx_bytes=dom_stats[0],
+                                             rx_packets=dom_stats[1],
+                                             tx_bytes=dom_stats[4],
+                                             tx_packets=dom_stats[5])
+
+    @staticmethod
+    def _disk_stats(domain, disk):
+        block_stats = domain.blockStats(disk.device)
+        return virt_inspector.DiskStats(read_requests=block_stats[0],
+                                        read_bytes=block_stats[1],
+                                        write_requests=block_stats[2],
+                                        write_bytes=block_stats[3],
+                                        errors=block_stats[4])
+
+    def inspect_vnics(self, instance_name):
+        domain = self._lookup_by_name(instance_name)
+        state = domain.info()[0]
+        if state == libvirt.VIR_DOMAIN_SHUTOFF:
+            LOG.warn(_('Failed to inspect vnics of %(instance_name)s, '
+                       'domain is in state of SHUTOFF'),
+                     {'instance_name': instance_name})
+            return
+        for interface in self._get_interfaces(domain):
+            yield (interface, self._interface_stats(domain, interface))
 
     def inspect_disks(self, instance_name):
         domain = self._lookup_by_name(instance_name)
@@ -167,19 +324,130 @@ class LibvirtInspector(virt_inspector.Inspector):
                        'domain is in state of SHUTOFF'),
                      {'instance_name': instance_name})
             return
-        tree = etree.fromstring(domain.XMLDesc(0))
-        for device in filter(
-                bool,
-                [target.get("dev")
-                 for target in tree.findall('devices/disk/target')]):
-            disk = virt_inspector.Disk(device=device)
-            block_stats = domain.blockStats(device)
-            stats = virt_inspector.DiskStats(read_requests=block_stats[0],
-                                             read_bytes=block_stats[1],
-                                             write_requests=block_stats[2],
-                                             write_bytes=block_stats[3],
-                                             errors=block_stats[4])
-            yield (disk, stats)
+        for disk in self._get_disks(domain):
+            yield (disk, self._disk_stats(domain, disk))
+
+    def _domain_stats_from_record(self, domain, record):
+        """Build the DomainStats of a domain from a bulk stats record."""
+        cpu = virt_inspector.CPUStats(number=record.get('vcpu.current', 0),
+                                      time=record.get('cpu.time', 0))
+
+        allocated_memory = None
+        if record.get('balloon.current'):
+            # Stat provided from libvirt is in KB, converting it to MB.
+            allocated_memory = virt_inspector.AllocatedMemoryStats(
+                allocated=record['balloon.current'] / units.Ki)
+
+        net_stats = {}
+        for i in range(record.get('net.count', 0)):
+            prefix = 'net.%d.' % i
+            net_stats[record.get(prefix + 'name')] = (
+                virt_inspector.InterfaceStats(
+                    rx_bytes=record.get(prefix + 'rx.bytes', 0),
+                    rx_packets=record.get(prefix + 'rx.pkts', 0),
+                    tx_bytes=record.get(prefix + 'tx.bytes', 0),
+                    tx_packets=record.get(prefix + 'tx.pkts', 0)))
+        disk_names = [record.get('block.%d.name' % i)
+                      for i in range(record.get('block.count', 0))]
+        vnics = []
+        if net_stats or disk_names:
+            # refresh the cached devices on hot-plug
+            devices = self._get_devices(domain, interface_names=net_stats,
+                                        disk_names=disk_names)
+            vnics = [(interface, net_stats[interface.name])
+                     for interface in devices.interfaces
+                     if interface.name in net_stats]
+
+        disks = []
+        for i in range(record.get('block.count', 0)):
+            prefix = 'block.%d.' % i
+            disks.append((
+                virt_inspector.Disk(device=record.get(prefix + 'name')),
+                virt_inspector.DiskStats(
+                    read_requests=record.get(prefix + 'rd.reqs', 0),
+                    read_bytes=record.get(prefix + 'rd.bytes', 0),
+                    write_requests=record.get(prefix + 'wr.reqs', 0),
+                    write_bytes=record.get(prefix + 'wr.bytes', 0),
+                    errors=record.get(prefix + 'errors', -1))))
+
+        return virt_inspector.DomainStats(cpu=cpu,
+                                          allocated_memory=allocated_memory,
+                                          vnics=vnics,
+                                          disks=disks)
+
+    def _domain_stats_from_domain(self, domain):
+        """Build the DomainStats of a domain with per-domain calls."""
+        dom_info = domain.info()
+        cpu = virt_inspector.CPUStats(number=dom_info[3], time=dom_info[4])
+
+        allocated_memory = None
+        try:
+            memory_stats = domain.memoryStats()
+            if memory_stats and memory_stats.get('actual'):
+                allocated_memory = virt_inspector.AllocatedMemoryStats(
+                    allocated=memory_stats['actual'] / units.Ki)
+        except libvirt.libvirtError:
+            # memoryStats is not supported by every hypervisor
+            pass
+
+        vnics = [(interface, self._interface_stats(domain, interface))
+                 for interface in self._get_interfaces(domain)]
+        disks = [(disk, self._disk_stats(domain, disk))
+                 for disk in self._get_disks(domain)]
+        return virt_inspector.DomainStats(cpu=cpu,
+                                          allocated_memory=allocated_memory,
+                                          vnics=vnics,
+                                          disks=disks)
+
+    def _get_all_domain_stats(self):
+        """Fetch the stats records of all the active domains in one call.
+
+        :return: a list of (domain, record) tuples, or None if the bulk
+                 stats API is not supported by libvirt
+        """
+        conn = self._get_connection()
+        try:
+            stats = (libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |
+                     libvirt.VIR_DOMAIN_STATS_BALLOON |
+                     libvirt.VIR_DOMAIN_STATS_VCPU |
+                     libvirt.VIR_DOMAIN_STATS_INTERFACE |
+                     libvirt.VIR_DOMAIN_STATS_BLOCK)
+            records = conn.getAllDomainStats(
+                stats, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE)
+        except AttributeError:
+            # libvirt python bindings older than 1.2.8
+            return None
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_NO_SUPPORT:
+                return None
+            raise
+        # the proxied connection does not wrap the domains returned
+        # within a list, so that their calls would block the hub
+        return [(tpool.Proxy(domain), record) for domain, record in records]
+
+    @retry_on_disconnect
+    def inspect_domain_stats(self):
+        records = self._get_all_domain_stats()
+        if records is not None:
+            return dict((domain.name(),
+                         self._domain_stats_from_record(domain, record))
+                        for domain, record in records)
+
+        LOG.debug('Bulk domain stats not supported, '
+                  'falling back to per-domain inspection')
+        domain_stats = {}
+        conn = self._get_connection()
+        for domain_id in conn.listDomainsID():
+            if domain_id == 0:
+                continue
+            try:
+                domain = conn.lookupByID(domain_id)
+                domain_stats[domain.name()] = (
+                    self._domain_stats_from_domain(domain))
+            except libvirt.libvirtError:
+                # Instance was deleted while listing... ignore it
+                pass
+        return domain_stats
 
     def inspect_allocated_memory(self, instance):
         instance_name = util.instance_name(instance)
@@ -63,6 +63,14 @@ class Base(object):
     def record_metering_data(self, data):
         """Recording metering data interface."""
 
+    def record_metering_data_batch(self, data):
+        """Recording a list of metering data at once.
+
+        Unlike record_metering_data, it raises an exception when the data
+        could not be recorded, so that the collector can requeue them.
+        """
+        self.record_metering_data(data)
+
     @abc.abstractmethod
     def record_events(self, events):
         """Recording events interface."""
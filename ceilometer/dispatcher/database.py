@@ -40,37 +40,62 @@ class DatabaseDispatcher(dispatcher.Base):
         super(DatabaseDispatcher, self).__init__(conf)
         self.storage_conn = storage.get_connection_from_config(conf)
 
+    def _verify(self, meter):
+        """Check the signature of a meter and convert its timestamp.
+
+        The meter is shared with the other dispatchers, so the converted
+        copy is returned, or None when the signature is invalid.
+        """
+        LOG.debug(_(
+            'metering data %(counter_name)s '
+            'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s')
+            % ({'counter_name': meter['counter_name'],
+                'resource_id': meter['resource_id'],
+                'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
+                'counter_volume': meter['counter_volume']}))
+        if not publisher_utils.verify_signature(
+                meter,
+                self.conf.publisher.metering_secret):
+            LOG.warning(_(
+                'message signature invalid, discarding message: %r'),
+                meter)
+            return None
+        # Convert the timestamp to a datetime instance.
+        # Storage engines are responsible for converting
+        # that value to something they can store.
+        meter = dict(meter)
+        if meter.get('timestamp'):
+            ts = timeutils.parse_isotime(meter['timestamp'])
+            meter['timestamp'] = timeutils.normalize_time(ts)
+        return meter
+
     def record_metering_data(self, data):
         # We may have receive only one counter on the wire
         if not isinstance(data, list):
             data = [data]
 
         for meter in data:
-            LOG.debug(_(
-                'metering data %(counter_name)s '
-                'for %(resource_id)s @ %(timestamp)s: %(counter_volume)s')
-                % ({'counter_name': meter['counter_name'],
-                    'resource_id': meter['resource_id'],
-                    'timestamp': meter.get('timestamp', 'NO TIMESTAMP'),
-                    'counter_volume': meter['counter_volume']}))
-            if publisher_utils.verify_signature(
-                    meter,
-                    self.conf.publisher.metering_secret):
-                try:
-                    # Convert the timestamp to a datetime instance.
-                    # Storage engines are responsible for converting
-                    # that value to something they can store.
-                    if meter.get('timestamp'):
-                        ts = timeutils.parse_isotime(meter['timestamp'])
-                        meter['timestamp'] = timeutils.normalize_time(ts)
-                    self.storage_conn.record_metering_data(meter)
-                except Exception as err:
-                    LOG.exception(_('Failed to record metering data: %s'),
-                                  err)
-            else:
-                LOG.warning(_(
-                    'message signature invalid, discarding message: %r'),
-                    meter)
+            try:
+                verified = self._verify(meter)
+                if verified:
+                    self.storage_conn.record_metering_data(verified)
+            except Exception as err:
+                LOG.exception(_('Failed to record metering data: %s'),
+                              err)
+
+    def record_metering_data_batch(self, data):
+        meters = []
+        for meter in data:
+            try:
+                verified = self._verify(meter)
+                if verified:
+                    meters.append(verified)
+            except Exception:
+                # requeuing would not make it valid
+                LOG.exception(_('Discarding invalid metering data: %r'),
+                              meter)
+        # storage errors are raised for the collector to requeue the data
+        self.storage_conn.record_metering_data_batch(meters)
 
     def record_events(self, events):
         if not isinstance(events, list):
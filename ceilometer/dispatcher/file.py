@@ -21,6 +21,7 @@ import logging.handlers
 from oslo.config import cfg
 
 from ceilometer import dispatcher
+from ceilometer import record_file
 
 file_dispatcher_opts = [
     cfg.StrOpt('file_path',
@@ -32,6 +33,18 @@ file_dispatcher_opts = [
     cfg.IntOpt('backup_count',
                default=0,
                help='The max number of the files to keep.'),
+    cfg.StrOpt('format',
+               default='text',
+               help='"text" logs one line per meter, "binary" writes them '
+                    'as msgpack records, which can be replayed with '
+                    'ceilometer-replay-records.'),
+    cfg.IntOpt('max_age',
+               default=0,
+               help='Number of seconds after which the binary file is '
+                    'rotated. 0 disables the time-based rotation.'),
+    cfg.BoolOpt('compress',
+                default=False,
+                help='Compress the rotated binary files with zlib.'),
 ]
 
 cfg.CONF.register_opts(file_dispatcher_opts, group="dispatcher_file")
@@ -52,14 +65,24 @@ class FileDispatcher(dispatcher.Base):
 
     [collector]
     dispatchers = file
+
+    With format = binary, the meters and events are written as msgpack
+    records, see ceilometer.record_file.
     """
 
     def __init__(self, conf):
         super(FileDispatcher, self).__init__(conf)
         self.log = None
-
+        self.writer = None
+
+        conf = self.conf.dispatcher_file
+        if conf.file_path and conf.format == 'binary':
+            self.writer = record_file.RecordWriter(
+                conf.file_path, max_bytes=conf.max_bytes,
+                max_age=conf.max_age, backup_count=conf.backup_count,
+                compress=conf.compress)
         # if the directory and path are configured, then log to the file
-        if self.conf.dispatcher_file.file_path:
+        elif conf.file_path:
             dispatcher_logger = logging.Logger('dispatcher.file')
             dispatcher_logger.setLevel(logging.INFO)
             # create rotating file handler which logs meters
@@ -77,10 +100,17 @@ class FileDispatcher(dispatcher.Base):
             self.log = dispatcher_logger
 
     def record_metering_data(self, data):
-        if self.log:
+        if self.writer:
+            # We may have receive only one counter on the wire
+            if not isinstance(data, list):
+                data = [data]
+            self.writer.write(data)
+        elif self.log:
             self.log.info(data)
 
     def record_events(self, events):
-        if self.log:
+        if self.writer:
+            self.writer.write([event.as_dict() for event in events])
+        elif self.log:
             self.log.info(events)
         return []
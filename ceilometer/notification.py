@@ -72,7 +72,10 @@ class NotificationService(os_service.Service):
         transport = messaging.get_transport()
         messaging.get_notifier(transport, '')
 
-        self.pipeline_manager = pipeline.setup_pipeline()
+        # the service is started again on SIGHUP, in which case the sinks
+        # whose configuration did not change are kept
+        self.pipeline_manager = pipeline.setup_pipeline(
+            previous=getattr(self, 'pipeline_manager', None))
 
         self.notification_manager = self._get_notifications_manager(
             self.pipeline_manager)
@@ -111,4 +114,5 @@ class NotificationService(os_service.Service):
 
     def stop(self):
         map(lambda x: x.stop(), self.listeners)
+        self.pipeline_manager.stop()
         super(NotificationService, self).stop()
@@ -20,12 +20,21 @@ from novaclient.v1_1 import client as nova_client
 from oslo.config import cfg
 
 from ceilometer.openstack.common import log
+from ceilometer import utils
 
 
 nova_opts = [
     cfg.BoolOpt('nova_http_log_debug',
                 default=False,
                 help='Allow novaclient\'s debug log output.'),
+    cfg.IntOpt('nova_metadata_cache_size',
+               default=1000,
+               help='Maximum number of flavors, and of images, whose '
+                    'details are cached across the instance listings.'),
+    cfg.IntOpt('nova_metadata_cache_ttl',
+               default=600,
+               help='Number of seconds the details of a flavor or an image, '
+                    'or the fact that it does not exist, are cached.'),
 ]
 
 service_types_opts = [
@@ -42,6 +51,19 @@ cfg.CONF.import_group('service_credentials', 'ceilometer.service')
 
 LOG = log.getLogger(__name__)
 
+# process-wide caches of the flavors and images, by name
+_CACHES = {}
+_MISSING = object()
+
+
+def _cache(name):
+    cache = _CACHES.get(name)
+    if cache is None:
+        cache = _CACHES[name] = utils.LRUCache(
+            cfg.CONF.nova_metadata_cache_size,
+            cfg.CONF.nova_metadata_cache_ttl)
+    return cache
+
 
 def logged(func):
 
@@ -80,19 +102,24 @@ class Client(object):
             no_cache=True)
 
     def _with_flavor_and_image(self, instances):
-        flavor_cache = {}
-        image_cache = {}
+        flavor_cache = _cache('flavors')
+        image_cache = _cache('images')
         for instance in instances:
             self._with_flavor(instance, flavor_cache)
             self._with_image(instance, image_cache)
 
+        LOG.debug('Flavor cache: %(fhits)d hits, %(fmisses)d misses, '
+                  'image cache: %(ihits)d hits, %(imisses)d misses',
+                  {'fhits': flavor_cache.hits,
+                   'fmisses': flavor_cache.misses,
+                   'ihits': image_cache.hits,
+                   'imisses': image_cache.misses})
         return instances
 
     def _with_flavor(self, instance, cache):
         fid = instance.flavor['id']
-        if fid in cache:
-            flavor = cache.get(fid)
-        else:
+        flavor = cache.get(fid, _MISSING)
+        if flavor is _MISSING:
             try:
                 flavor = self.nova_client.flavors.get(fid)
             except novaclient.exceptions.NotFound:
@@ -118,9 +145,8 @@ class Client(object):
             instance.ramdisk_id = None
             return
 
-        if iid in cache:
-            image = cache.get(iid)
-        else:
+        image = cache.get(iid, _MISSING)
+        if image is _MISSING:
             try:
                 image = self.nova_client.images.get(iid)
             except novaclient.exceptions.NotFound:
@@ -139,9 +165,24 @@ class Client(object):
             setattr(instance, attr, ameta)
 
     @logged
-    def instance_get_all_by_host(self, hostname):
-        """Returns list of instances on particular host."""
+    def with_image(self, instance):
+        """Add the image name, kernel and ramdisk ids to an instance.
+
+        The images are cached as for the instances listed from Nova.
+        """
+        self._with_image(instance, _cache('images'))
+        return instance
+
+    @logged
+    def instance_get_all_by_host(self, hostname, since=None):
+        """Returns list of instances on particular host.
+
+        If since is specified, only instances modified since then are
+        returned, deleted ones included.
+        """
         search_opts = {'host': hostname, 'all_tenants': True}
+        if since:
+            search_opts['changes-since'] = since
         return self._with_flavor_and_image(self.nova_client.servers.list(
             detailed=True,
             search_opts=search_opts))
@@ -154,6 +195,11 @@ class Client(object):
             detailed=True,
             search_opts=search_opts)
 
+    @logged
+    def flavor_get_all(self):
+        """Returns all flavors, private ones included."""
+        return self.nova_client.flavors.list(is_public=None)
+
     @logged
     def floating_ip_get_all(self):
         """Returns all floating ips."""
@@ -21,13 +21,20 @@ import fnmatch
 import itertools
 import operator
 import os
+import re
+import time
 
+import eventlet
+from eventlet import greenpool
 from oslo.config import cfg
+import six
 import yaml
 
 from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log
 from ceilometer import publisher
+from ceilometer.publisher import queued
+from ceilometer import sample as sample_util
 from ceilometer import transformer as xformer
 
 
@@ -36,6 +43,24 @@ OPTS = [
                default="pipeline.yaml",
                help="Configuration file for pipeline definition."
                ),
+    cfg.BoolOpt('parallel_publishing',
+                default=False,
+                help='Send the samples of a sink to all its publishers '
+                     'concurrently instead of one publisher after another.'),
+    cfg.FloatOpt('publisher_timeout',
+                 default=0,
+                 help='Maximum number of seconds a publisher may take to '
+                      'publish the samples of a sink before it is '
+                      'cancelled. 0 means no timeout.'),
+    cfg.BoolOpt('grouped_publishing',
+                default=False,
+                help='Transform all the samples injected into a sink at '
+                     'once and publish them with a single call per '
+                     'publisher, instead of one call per meter.'),
+    cfg.IntOpt('max_publish_batch_size',
+               default=0,
+               help='Maximum number of samples sent to a publisher in one '
+                    'call by grouped publishing. 0 means no limit.'),
 ]
 
 cfg.CONF.register_opts(OPTS)
@@ -104,6 +129,7 @@ class Source(object):
         if not isinstance(self.discovery, list):
             raise PipelineException("Discovery should be a list", cfg)
         self._check_meters()
+        self._compile_meters()
 
     def __str__(self):
         return self.name
@@ -143,26 +169,45 @@ class Source(object):
         else:
             return name
 
-    def support_meter(self, meter_name):
-        meter_name = self._variable_meter_name(meter_name)
-
+    @staticmethod
+    def _compile_patterns(patterns):
+        if not patterns:
+            return None
+        return re.compile('|'.join('(?:%s)' % fnmatch.translate(p)
+                                   for p in patterns))
+
+    def _compile_meters(self):
+        """Compile the meter patterns into one regex per kind of rule."""
+        self._excluded = self._compile_patterns(
+            [meter[1:] for meter in self.meters if meter[0] == '!'])
+        self._included = self._compile_patterns(
+            [meter for meter in self.meters if meter[0] != '!'])
         # Special case: if we only have negation, we suppose the default is
         # allow
-        default = all(meter.startswith('!') for meter in self.meters)
+        self._default = all(meter.startswith('!') for meter in self.meters)
+        # memoized support_meter results, by meter name
+        self._supported = {}
+
+    def _match_meter(self, meter_name):
+        meter_name = self._variable_meter_name(meter_name)
 
         # Support wildcard like storage.* and !disk.*
         # Start with negation, we consider that the order is deny, allow
-        if any(fnmatch.fnmatch(meter_name, meter[1:])
-               for meter in self.meters
-               if meter[0] == '!'):
+        if self._excluded and self._excluded.match(meter_name):
             return False
 
-        if any(fnmatch.fnmatch(meter_name, meter)
-               for meter in self.meters
-               if meter[0] != '!'):
+        if self._included and self._included.match(meter_name):
             return True
 
-        return default
+        return self._default
+
+    def support_meter(self, meter_name):
+        try:
+            return self._supported[meter_name]
+        except KeyError:
+            supported = self._match_meter(meter_name)
+            self._supported[meter_name] = supported
+            return supported
 
     def check_sinks(self, sinks):
         if not self.sinks:
@@ -218,16 +263,20 @@ class Sink(object):
             raise PipelineException("No publisher specified", cfg)
 
         self.publishers = []
+        # last publishing latency, in seconds, by publisher
+        self.publisher_latency = {}
         for p in cfg['publishers']:
             if '://' not in p:
                 # Support old format without URL
                 p = p + "://"
             try:
-                self.publishers.append(publisher.get_publisher(p))
+                self.publishers.append(
+                    queued.wrap(publisher.get_publisher(p)))
             except Exception:
                 LOG.exception(_("Unable to load publisher %s"), p)
 
         self.transformers = self._setup_transformers(cfg, transformer_manager)
+        self.reset_chains()
 
     def __str__(self):
         return self.name
@@ -252,9 +301,40 @@ class Sink(object):
 
         return transformers
 
+    def reset_chains(self):
+        """Forget the transformer chains computed so far."""
+        # dict of ((start, meter name), [(index, transformer)])
+        self._chains = {}
+
+    @staticmethod
+    def _applies_to(transformer, meter_name):
+        applies_to = getattr(transformer, 'applies_to', None)
+        return applies_to(meter_name) if applies_to else True
+
+    def _chain(self, start, meter_name):
+        """Return the transformers, from start, applying to a meter.
+
+        :return: a list of (index, transformer) tuples.
+        """
+        key = (start, meter_name)
+        try:
+            return self._chains[key]
+        except KeyError:
+            chain = [(i, transformer) for i, transformer
+                     in enumerate(self.transformers)
+                     if i >= start and self._applies_to(transformer,
+                                                        meter_name)]
+            self._chains[key] = chain
+            return chain
+
     def _transform_sample(self, start, ctxt, sample):
+        transformer = None
         try:
-            for transformer in self.transformers[start:]:
+            chain = self._chain(start, sample.name)
+            pos = 0
+            while pos < len(chain):
+                i, transformer = chain[pos]
+                meter_name = sample.name
                 sample = transformer.handle_sample(ctxt, sample)
                 if not sample:
                     LOG.debug(_(
@@ -262,6 +342,12 @@ class Sink(object):
                         "transformer %(trans)s") % ({'pipeline': self,
                                                      'trans': transformer}))
                     return
+                if sample.name != meter_name:
+                    # the rest of the chain depends on the new meter name
+                    chain = self._chain(i + 1, sample.name)
+                    pos = 0
+                else:
+                    pos += 1
             return sample
         except Exception as err:
             LOG.warning(_("Pipeline %(pipeline)s: "
@@ -282,6 +368,11 @@ class Sink(object):
 
         """
 
+        transformed_samples = self._transform_samples(start, ctxt, samples)
+        if transformed_samples:
+            self._publish_all(ctxt, transformed_samples)
+
+    def _transform_samples(self, start, ctxt, samples):
         transformed_samples = []
         for sample in samples:
             LOG.debug(_(
@@ -292,36 +383,189 @@ class Sink(object):
             sample = self._transform_sample(start, ctxt, sample)
             if sample:
                 transformed_samples.append(sample)
+        return transformed_samples
 
-        if transformed_samples:
+    def _publish_all(self, ctxt, samples):
+        if cfg.CONF.parallel_publishing and len(self.publishers) > 1:
+            pool = greenpool.GreenPool(len(self.publishers))
             for p in self.publishers:
-                try:
-                    p.publish_samples(ctxt, transformed_samples)
-                except Exception:
-                    LOG.exception(_(
-                        "Pipeline %(pipeline)s: Continue after error "
-                        "from publisher %(pub)s") % ({'pipeline': self,
-                                                      'pub': p}))
+                pool.spawn_n(self._publish, p, ctxt, samples)
+            pool.waitall()
+        else:
+            for p in self.publishers:
+                self._publish(p, ctxt, samples)
+
+    def _publish(self, p, ctxt, samples):
+        """Publish samples with one publisher, isolating its errors."""
+        timeout = cfg.CONF.publisher_timeout or None
+        start = time.time()
+        try:
+            with eventlet.Timeout(timeout):
+                if isinstance(samples, sample_util.SampleBatch):
+                    publish_batch = getattr(p, 'publish_batch', None)
+                    if publish_batch:
+                        publish_batch(ctxt, samples)
+                    else:
+                        p.publish_samples(ctxt, list(samples))
+                else:
+                    p.publish_samples(ctxt, samples)
+        except eventlet.Timeout:
+            LOG.warning(_(
+                "Pipeline %(pipeline)s: Publisher %(pub)s cancelled after "
+                "%(timeout)s seconds") % ({'pipeline': self,
+                                           'pub': p,
+                                           'timeout': timeout}))
+        except Exception:
+            LOG.exception(_(
+                "Pipeline %(pipeline)s: Continue after error "
+                "from publisher %(pub)s") % ({'pipeline': self,
+                                              'pub': p}))
+        finally:
+            latency = time.time() - start
+            self.publisher_latency[str(p)] = latency
+            LOG.debug("Pipeline %(pipeline)s: Publisher %(pub)s took "
+                      "%(latency).3f seconds to publish %(count)d samples",
+                      {'pipeline': self, 'pub': p, 'latency': latency,
+                       'count': len(samples)})
 
     def publish_samples(self, ctxt, samples):
+        if cfg.CONF.grouped_publishing:
+            self._publish_grouped(ctxt, samples)
+            return
         for meter_name, samples in itertools.groupby(
                 sorted(samples, key=operator.attrgetter('name')),
                 operator.attrgetter('name')):
             self._publish_samples(0, ctxt, samples)
 
+    def _publish_grouped(self, ctxt, samples):
+        """Transform all the samples, then publish them in one go."""
+        # group by meter in a single pass, in order of first appearance
+        by_meter = {}
+        meters = []
+        for sample in samples:
+            meter_samples = by_meter.get(sample.name)
+            if meter_samples is None:
+                meter_samples = by_meter[sample.name] = []
+                meters.append(sample.name)
+            meter_samples.append(sample)
+
+        transformed_samples = []
+        for meter_name in meters:
+            transformed_samples.extend(
+                self._transform_samples(0, ctxt, by_meter[meter_name]))
+
+        self._publish_chunks(ctxt, transformed_samples)
+
+    def _publish_chunks(self, ctxt, samples):
+        """Publish samples in chunks of max_publish_batch_size.
+
+        :param samples: a list of samples or a SampleBatch.
+        """
+        if not samples:
+            return
+        size = cfg.CONF.max_publish_batch_size
+        if size <= 0 or size >= len(samples):
+            self._publish_all(ctxt, samples)
+            return
+        for i in six.moves.range(0, len(samples), size):
+            if isinstance(samples, sample_util.SampleBatch):
+                chunk = samples.take(six.moves.range(
+                    i, min(i + size, len(samples))))
+            else:
+                chunk = samples[i:i + size]
+            self._publish_all(ctxt, chunk)
+
+    @staticmethod
+    def _merge(transformed):
+        """Merge transformed batches or lists of samples in one."""
+        if len(transformed) == 1:
+            return transformed[0]
+        if all(isinstance(t, sample_util.SampleBatch) for t in transformed):
+            return sample_util.SampleBatch.concat(transformed)
+        return list(itertools.chain.from_iterable(transformed))
+
+    def _transform_batch(self, start, ctxt, batch, meter_name):
+        """Push a batch of samples of one meter through the transformers.
+
+        Batches go through the transformers as a whole as long as the
+        transformers are batch capable, they are split into samples
+        otherwise.
+
+        :return: a list of transformed batches or lists of samples.
+        """
+        chain = self._chain(start, meter_name)
+        if not all(getattr(transformer, 'batch_capable', False)
+                   for i, transformer in chain):
+            return [self._transform_samples(start, ctxt, list(batch))]
+
+        transformer = None
+        try:
+            for i, transformer in chain:
+                batch = transformer.handle_batch(ctxt, batch)
+                if not batch:
+                    return []
+                if batch.distinct('name') != [meter_name]:
+                    # the rest of the chain depends on the new meter names
+                    transformed = []
+                    for name, renamed in six.iteritems(
+                            batch.split_by('name')):
+                        transformed.extend(self._transform_batch(
+                            i + 1, ctxt, renamed, name))
+                    return transformed
+        except Exception as err:
+            LOG.warning(_("Pipeline %(pipeline)s: "
+                          "Exit after error from transformer "
+                          "%(trans)s for a batch of %(count)d samples")
+                        % ({'pipeline': self,
+                            'trans': transformer,
+                            'count': len(batch)}))
+            LOG.exception(err)
+            return []
+        return [batch]
+
+    def publish_batch(self, ctxt, batch):
+        transformed = []
+        for meter_name, meter_batch in six.iteritems(batch.split_by('name')):
+            transformed.extend(t for t in self._transform_batch(
+                0, ctxt, meter_batch, meter_name) if t)
+        if not transformed:
+            return
+        if cfg.CONF.grouped_publishing:
+            self._publish_chunks(ctxt, self._merge(transformed))
+            return
+        for samples in transformed:
+            self._publish_all(ctxt, samples)
+
     def flush(self, ctxt):
-        """Flush data after all samples have been injected to pipeline."""
+        """Flush data after all samples have been injected to pipeline.
 
+        With grouped publishing, the samples emitted by all the
+        transformers are published in one go.
+        """
+        grouped = cfg.CONF.grouped_publishing
+        flushed = []
         for (i, transformer) in enumerate(self.transformers):
             try:
-                self._publish_samples(i + 1, ctxt,
-                                      list(transformer.flush(ctxt)))
+                samples = list(transformer.flush(ctxt))
+                if grouped:
+                    flushed.extend(self._transform_samples(i + 1, ctxt,
+                                                           samples))
+                else:
+                    self._publish_samples(i + 1, ctxt, samples)
             except Exception as err:
                 LOG.warning(_(
                     "Pipeline %(pipeline)s: Error flushing "
                     "transformer %(trans)s") % ({'pipeline': self,
                                                  'trans': transformer}))
                 LOG.exception(err)
+        self._publish_chunks(ctxt, flushed)
+
+    def stop(self):
+        """Stop the publishers, publishing the samples they queued."""
+        for p in self.publishers:
+            stop = getattr(p, 'stop', None)
+            if stop:
+                stop()
 
 class Pipeline(object):
     """Represents an association between a sink and corresponding sources."""
@@ -332,6 +576,12 @@ class Pipeline(object):
 	#every source in the pipeline must have the same interval
         self.interval = interval
         self.name = str(self)
+        # memoized support_meter results, by meter name
+        self._supported = {}
+
+    def add_source(self, source):
+        self.sources.append(source)
+        self._supported = {}
 
     def __str__(self):
         name = ''
@@ -352,7 +602,13 @@ class Pipeline(object):
 		if source.name == source.name)]
 
     def support_meter(self, meter_name):
-        return any(source.support_meter(meter_name) for source in self.sources)
+        try:
+            return self._supported[meter_name]
+        except KeyError:
+            supported = any(source.support_meter(meter_name)
+                            for source in self.sources)
+            self._supported[meter_name] = supported
+            return supported
 
     @property
     def publishers(self):
@@ -362,6 +618,15 @@ class Pipeline(object):
         self.publish_samples(ctxt, [sample])
 
     def publish_samples(self, ctxt, samples):
+        if isinstance(samples, sample_util.SampleBatch):
+            names = samples.columns['name']
+            supported = [self.support_meter(n) for n in names.values]
+            if not all(supported):
+                samples = samples.take(i for i, code in enumerate(names.codes)
+                                       if supported[code])
+            if samples:
+                self.sink.publish_batch(ctxt, samples)
+            return
         supported = [s for s in samples if self.support_meter(s.name)]
         self.sink.publish_samples(ctxt, supported)
 
@@ -377,7 +642,7 @@ class PipelineManager(object):
 
     """
 
-    def __init__(self, cfg, transformer_manager):
+    def __init__(self, cfg, transformer_manager, previous=None):
         """Setup the pipelines according to config.
 
         The configuration is supported in one of two forms:
@@ -449,6 +714,10 @@ class PipelineManager(object):
         The semantics of the common individual configuration elements
         are identical in the deprecated and decoupled version.
 
+        When the pipelines are reloaded, the previous pipeline manager may
+        be given so that the sources and sinks whose configuration did not
+        change are kept, along with the state of their transformers.
+
         The interval determines the cadence of sample injection into
         the pipeline where samples are produced under the direct control
         of an agent, i.e. via a polling cycle as opposed to incoming
@@ -476,13 +745,17 @@ class PipelineManager(object):
 
         """
         self.pipelines = []
+        # memoized pipelines_for_meter results, by meter name
+        self._routes = {}
         if 'sources' in cfg or 'sinks' in cfg:
             if not ('sources' in cfg and 'sinks' in cfg):
                 raise PipelineException("Both sources & sinks are required",
                                         cfg)
             LOG.info(_('detected decoupled pipeline config format'))
-            sources = [Source(s) for s in cfg.get('sources', [])]
-            sinks = dict((s['name'], Sink(s, transformer_manager))
+            sources = [self._source(previous, s)
+                       for s in cfg.get('sources', [])]
+            sinks = dict((s['name'],
+                          self._sink(previous, s, transformer_manager))
                          for s in cfg.get('sinks', []))
 
             for source in sources:
@@ -503,16 +776,44 @@ class PipelineManager(object):
                             raise PipelineException(
                               ("Cannot associate sink with sources " 
                                "with different intervals"), cfg)
-                        pipeline.sources.append(source)
+                        pipeline.add_source(source)
         else:
             LOG.warning(_('detected deprecated pipeline config format'))
             for pipedef in cfg:
-                source = Source(pipedef)
-                sink = Sink(pipedef, transformer_manager)
+                source = self._source(previous, pipedef)
+                sink = self._sink(previous, pipedef, transformer_manager)
                 self.pipelines.append(Pipeline([source],
                                                 sink, 
                                                 source.interval))
 
+    @staticmethod
+    def _source(previous, source_cfg):
+        if previous:
+            for pipeline in previous.pipelines:
+                for source in pipeline.sources:
+                    if source.cfg == source_cfg:
+                        return source
+        return Source(source_cfg)
+
+    @staticmethod
+    def _sink(previous, sink_cfg, transformer_manager):
+        if previous:
+            for pipeline in previous.pipelines:
+                if pipeline.sink.cfg == sink_cfg:
+                    LOG.debug(_('Keeping unchanged sink %s'), pipeline.sink)
+                    return pipeline.sink
+        return Sink(sink_cfg, transformer_manager)
+
+    def pipelines_for_meter(self, meter_name):
+        """Return the pipelines supporting the given meter."""
+        try:
+            return self._routes[meter_name]
+        except KeyError:
+            pipelines = [pipeline for pipeline in self.pipelines
+                         if pipeline.support_meter(meter_name)]
+            self._routes[meter_name] = pipelines
+            return pipelines
+
     def publishers(self, context):
         """Build a set of Publisher, one for each pipeline.
 
@@ -520,11 +821,34 @@ class PipelineManager(object):
         """
         return [PublishContext(context, pipeline) for pipeline in self.pipelines]
 
-def setup_pipeline(transformer_manager=None):
-    """Setup pipeline manager according to yaml config file."""
+    def stop(self, replacement=None):
+        """Stop the publishers of the sinks.
+
+        :param replacement: the pipeline manager reloaded from this one,
+                            whose sinks keep running.
+        """
+        kept = (set(pipeline.sink for pipeline in replacement.pipelines)
+                if replacement else set())
+        for pipeline in self.pipelines:
+            if pipeline.sink not in kept:
+                pipeline.sink.stop()
+
+
+def find_pipeline_cfg_file():
+    """Return the path of the pipeline yaml config file."""
     cfg_file = cfg.CONF.pipeline_cfg_file
     if not os.path.exists(cfg_file):
         cfg_file = cfg.CONF.find_file(cfg_file)
+    return cfg_file
+
+
+def setup_pipeline(transformer_manager=None, previous=None):
+    """Setup pipeline manager according to yaml config file.
+
+    :param previous: the pipeline manager being replaced when reloading
+                     the config file, whose unchanged sinks are kept.
+    """
+    cfg_file = find_pipeline_cfg_file()
 
     LOG.debug(_("Pipeline config file: %s"), cfg_file)
 
@@ -538,4 +862,5 @@ def setup_pipeline(transformer_manager=None):
                            transformer_manager or
                            xformer.TransformerExtensionManager(
                                'ceilometer.transformer',
-                           ))
+                           ),
+                           previous=previous)
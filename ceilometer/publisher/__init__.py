@@ -45,3 +45,10 @@ class PublisherBase(object):
     @abc.abstractmethod
     def publish_samples(self, context, samples):
         """Publish samples into final conduit."""
+
+    def publish_batch(self, context, batch):
+        """Publish a SampleBatch into final conduit.
+
+        By default the batch is published as a list of samples.
+        """
+        self.publish_samples(context, list(batch))
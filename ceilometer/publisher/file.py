@@ -18,11 +18,14 @@
 import logging
 import logging.handlers
 
+from oslo.config import cfg
 from six.moves.urllib import parse as urlparse
 
 from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log
 from ceilometer import publisher
+from ceilometer.publisher import utils
+from ceilometer import record_file
 
 LOG = log.getLogger(__name__)
 
@@ -52,12 +55,20 @@ class FilePublisher(publisher.PublisherBase):
     or backup_count is missing, FileHandler will be used to save the metering
     data. If max_bytes and backup_count are present, RotatingFileHandler will
     be used to save the metering data.
+
+    With format=binary, the signed metering messages are written as msgpack
+    records instead, see ceilometer.record_file. The file is then rotated
+    when reaching max_bytes or after max_age seconds, the rotated files are
+    compressed when compress=1, and backup_count of them are kept::
+
+        file:///var/test?format=binary&max_bytes=10000000&compress=1
     """
 
     def __init__(self, parsed_url):
         super(FilePublisher, self).__init__(parsed_url)
 
         self.publisher_logger = None
+        self.writer = None
         path = parsed_url.path
         if not path or path.lower() == 'file':
             LOG.error(_('The path for the file publisher is required'))
@@ -69,6 +80,9 @@ class FilePublisher(publisher.PublisherBase):
         # Handling other configuration options in the query string
         if parsed_url.query:
             params = urlparse.parse_qs(parsed_url.query)
+            if params.get('format', ['text'])[-1] == 'binary':
+                self._setup_writer(path, params)
+                return
             if params.get('max_bytes') and params.get('backup_count'):
                 try:
                     max_bytes = int(params.get('max_bytes')[0])
@@ -88,12 +102,39 @@ class FilePublisher(publisher.PublisherBase):
         rfh.setLevel(logging.INFO)
         self.publisher_logger.addHandler(rfh)
 
+    def _setup_writer(self, path, params):
+        try:
+            options = dict((name, int(params.get(name, [0])[-1]))
+                           for name in ('max_bytes', 'max_age',
+                                        'backup_count', 'compress'))
+        except ValueError:
+            LOG.error(_('max_bytes, max_age, backup_count and compress '
+                        'should be numbers.'))
+            return
+        options['compress'] = bool(options['compress'])
+        self.writer = record_file.RecordWriter(path, **options)
+
     def publish_samples(self, context, samples):
         """Send a metering message for publishing
 
         :param context: Execution context from the service or RPC call
         :param samples: Samples from pipeline after transformation
         """
-        if self.publisher_logger:
+        if self.writer:
+            self.writer.write(utils.meter_messages(
+                samples, cfg.CONF.publisher.metering_secret))
+        elif self.publisher_logger:
             for sample in samples:
                 self.publisher_logger.info(sample.as_dict())
+
+    def publish_batch(self, context, batch):
+        """Send the metering messages of a SampleBatch
+
+        :param context: Execution context from the service or RPC call
+        :param batch: SampleBatch from pipeline after transformation
+        """
+        if self.writer:
+            self.writer.write(utils.meter_messages(
+                batch, cfg.CONF.publisher.metering_secret))
+        else:
+            self.publish_samples(context, list(batch))
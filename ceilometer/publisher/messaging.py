@@ -18,8 +18,12 @@
 """
 
 import abc
+import hashlib
 import itertools
 import operator
+import os
+import sys
+import time
 
 from oslo.config import cfg
 import oslo.messaging
@@ -28,9 +32,11 @@ import six
 import six.moves.urllib.parse as urlparse
 
 from ceilometer import messaging
+from ceilometer.openstack.common import context as req_context
 from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log
 from ceilometer import publisher
+from ceilometer.publisher import spool
 from ceilometer.publisher import utils
 
 
@@ -91,6 +97,12 @@ def override_backend_retry_config(value):
 @six.add_metaclass(abc.ABCMeta)
 class MessagingPublisher(publisher.PublisherBase):
 
+    # "legacy" sends lists of metering messages, "batch" the compact
+    # envelopes of publisher.utils.pack_batch, which only the collectors
+    # knowing them can read: it is only used when set in the publisher
+    # URL, once all the collectors of the topic are upgraded
+    WIRE_FORMATS = ('legacy', 'batch')
+
     def __init__(self, parsed_url):
         options = urlparse.parse_qs(parsed_url.query)
         # the values of the option is a list of url params values
@@ -105,7 +117,29 @@ class MessagingPublisher(publisher.PublisherBase):
 
         self.local_queue = []
 
-        if self.policy in ['queue', 'drop']:
+        self.wire_format = options.get('wire_format', ['legacy'])[-1]
+        if self.wire_format not in self.WIRE_FORMATS:
+            LOG.warn(_('Unknown wire format %(format)s for %(publisher)s, '
+                       'using the legacy format') %
+                     {'format': self.wire_format,
+                      'publisher': self.__class__.__name__})
+            self.wire_format = 'legacy'
+
+        self.spool = None
+        self.retry_at = 0
+        self._replaying = False
+        if self.policy == 'spool':
+            conf = cfg.CONF.publisher_spool
+            if conf.spool_dir:
+                self.spool = spool.Spool(
+                    os.path.join(conf.spool_dir, self._spool_name(parsed_url)),
+                    conf.segment_size, conf.max_size, conf.use_mmap)
+            else:
+                LOG.error(_('The spool publishing policy requires a '
+                            'spool_dir, falling back to the queue policy'))
+                self.policy = 'queue'
+
+        if self.policy in ['queue', 'drop', 'spool']:
             LOG.info(_('Publishing policy set to %s, '
                        'override backend retry config to 1') % self.policy)
             override_backend_retry_config(1)
@@ -124,13 +158,19 @@ class MessagingPublisher(publisher.PublisherBase):
 
         """
 
-        meters = [
-            utils.meter_message_from_counter(
-                sample,
-                cfg.CONF.publisher.metering_secret)
-            for sample in samples
-        ]
+        self._publish_meters(context, utils.meter_messages(
+            samples, cfg.CONF.publisher.metering_secret))
+
+    def publish_batch(self, context, batch):
+        """Publish a batch of samples on RPC.
+
+        :param context: Execution context from the service or RPC call.
+        :param batch: SampleBatch from pipeline after transformation.
+        """
+        self._publish_meters(context, utils.meter_messages(
+            batch, cfg.CONF.publisher.metering_secret))
 
+    def _publish_meters(self, context, meters):
         topic = cfg.CONF.publisher_rpc.metering_topic
         self.local_queue.append((context, topic, meters))
 
@@ -146,7 +186,18 @@ class MessagingPublisher(publisher.PublisherBase):
 
         self.flush()
 
+    @staticmethod
+    def _spool_name(parsed_url):
+        # distinct for every publisher of every agent of the host, and
+        # stable across restarts
+        digest = hashlib.sha1(parsed_url.geturl().encode('utf-8'))
+        return '%s-%s' % (os.path.basename(sys.argv[0]),
+                          digest.hexdigest()[:12])
+
     def flush(self):
+        if self.spool is not None:
+            self._flush_spool()
+            return
         # NOTE(sileht):
         # IO of the rpc stuff in handled by eventlet,
         # this is why the self.local_queue, is emptied before processing the
@@ -179,26 +230,118 @@ class MessagingPublisher(publisher.PublisherBase):
         # the default policy just respect the rabbitmq configuration
         # nothing special is done if rabbit_max_retries <= 0
         # and exception is reraised if rabbit_max_retries > 0
-        while queue:
-            context, topic, meters = queue[0]
+        for i, (context, topic, meters) in enumerate(queue):
             try:
                 self._send(context, topic, meters)
             except oslo.messaging._drivers.common.RPCException:
+                queue = queue[i:]
                 samples = sum([len(m) for __, __, m in queue])
                 if policy == 'queue':
                     LOG.warn(_("Failed to publish %d samples, queue them"),
                              samples)
                     return queue
+                elif policy == 'spool':
+                    LOG.warn(_("Failed to publish %d samples, spool them"),
+                             samples)
+                    return queue
                 elif policy == 'drop':
                     LOG.warn(_("Failed to publish %d samples, dropping them"),
                              samples)
                     return []
                 # default, occur only if rabbit_max_retries > 0
                 raise
-            else:
-                queue.pop(0)
         return []
 
+    def _flush_spool(self):
+        """Send the meters, spooling them on disk while the bus is down.
+
+        Once something is spooled, the new meters are spooled too so that
+        they are sent in order, and the spool is replayed at most every
+        retry_interval seconds.
+        """
+        queue = self.local_queue
+        self.local_queue = []
+        spooled = self.spool.depth
+        if not spooled:
+            queue = self._process_queue(queue, self.policy)
+            self.retry_at = time.time() + (
+                cfg.CONF.publisher_spool.retry_interval)
+        for context, topic, meters in queue:
+            ctxt = context.to_dict() if context is not None else {}
+            # the token would have expired before the replay anyway
+            ctxt.pop('auth_token', None)
+            self.spool.append((ctxt, topic, meters))
+        if (spooled and not self._replaying
+                and time.time() >= self.retry_at):
+            self._replaying = True
+            try:
+                self._replay()
+            finally:
+                self._replaying = False
+
+    def _replay(self):
+        """Send the oldest spooled meters, merging consecutive records.
+
+        At most replay_batch_size samples are sent per call, the rest of
+        the spool is left to the next calls so that publishing is not
+        blocked until the whole spool is sent.
+        """
+        batch_size = cfg.CONF.publisher_spool.replay_batch_size
+        replayed = 0
+        # the records are (timestamp, context, topic, meters)
+        records = self.spool.peek(batch_size, weight=lambda r: len(r[3]))
+        i = 0
+        while i < len(records):
+            (__, ctxt, topic, meters), position = records[i]
+            meters = list(meters)
+            j = i + 1
+            while (j < len(records)
+                   and records[j][0][1:3] == [ctxt, topic]
+                   and len(meters) + len(records[j][0][3]) <= batch_size):
+                meters.extend(records[j][0][3])
+                position = records[j][1]
+                j += 1
+            try:
+                self._send(req_context.RequestContext.from_dict(ctxt),
+                           topic, meters)
+            except oslo.messaging._drivers.common.RPCException:
+                self.retry_at = time.time() + (
+                    cfg.CONF.publisher_spool.retry_interval)
+                LOG.warn(_("Failed to replay the spool, %(depth)d "
+                           "messages spooled, the oldest for "
+                           "%(age)d seconds") % self._spool_stats())
+                return
+            self.spool.commit(position, j - i)
+            replayed += len(meters)
+            i = j
+        if replayed:
+            LOG.info(_("Replayed %(count)d spooled samples, %(depth)d "
+                       "messages still spooled, the oldest for %(age)d "
+                       "seconds") % dict(self._spool_stats(), count=replayed))
+
+    def _spool_stats(self):
+        return {'depth': self.spool.depth, 'age': self.spool.age()}
+
+    def stats(self):
+        """Return the counts of the meters waiting to be published.
+
+        :return: a dict with the number of samples in the local queue and,
+                 with the spool policy, the number of spooled messages and
+                 the age in seconds of the oldest one.
+        """
+        stats = {'queued': sum(len(m) for __, __, m in self.local_queue)}
+        if self.spool is not None:
+            spool_stats = self._spool_stats()
+            stats['spooled'] = spool_stats['depth']
+            stats['spool_age'] = spool_stats['age']
+        return stats
+
+    def _payload(self, context, meters):
+        """Return what is sent on the bus for a list of meters."""
+        if self.wire_format == 'batch':
+            return utils.pack_batch(meters)
+        return meters
+
     @abc.abstractmethod
     def _send(self, context, topic, meters):
         """Send the meters to the messaging topic."""
@@ -217,8 +360,8 @@ class RPCPublisher(MessagingPublisher):
         )
 
     def _send(self, context, topic, meters):
-        self.rpc_client.prepare(topic=topic).cast(context, self.target,
-                                                  data=meters)
+        self.rpc_client.prepare(topic=topic).cast(
+            context, self.target, data=self._payload(context, meters))
 
 
 class NotifierPublisher(MessagingPublisher):
@@ -233,4 +376,4 @@ class NotifierPublisher(MessagingPublisher):
 
     def _send(self, context, event_type, meters):
         self.notifier.sample(context.to_dict(), event_type=event_type,
-                             payload=meters)
+                             payload=self._payload(context, meters))
@@ -0,0 +1,226 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Decouple the publishers from the pipelines with a bounded queue.
+"""
+
+import itertools
+import operator
+import time
+
+import eventlet
+from eventlet import queue
+from oslo.config import cfg
+
+from ceilometer.openstack.common.gettextutils import _
+from ceilometer.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.IntOpt('queue_size',
+               default=0,
+               help='Maximum number of sample batches queued for each '
+                    'publisher, which are then published by background '
+                    'workers. 0 disables the queue, publishing samples '
+                    'inline from the pipelines.'),
+    cfg.StrOpt('policy',
+               default='block',
+               help='What to do when the publisher queue is full: '
+                    '"block" waits for room in the queue, "drop" drops '
+                    'the oldest queued batch.'),
+    cfg.IntOpt('batch_size',
+               default=100,
+               help='Number of queued samples published together.'),
+    cfg.FloatOpt('max_batch_age',
+                 default=1.0,
+                 help='Maximum number of seconds a queued sample waits for '
+                      'a batch to fill up before being published.'),
+    cfg.IntOpt('workers',
+               default=1,
+               help='Number of green threads publishing the queued '
+                    'samples of each publisher.'),
+    cfg.FloatOpt('stop_timeout',
+                 default=10.0,
+                 help='Maximum number of seconds to wait, when the service '
+                      'stops or reloads its pipelines, for the queued '
+                      'samples to be published. The samples still queued '
+                      'then are lost.'),
+]
+
+cfg.CONF.register_opts(OPTS, group="publisher_queue")
+
+
+def wrap(publisher):
+    """Put the publisher behind a queue if the queue is enabled."""
+    if cfg.CONF.publisher_queue.queue_size > 0:
+        return QueuedPublisher(publisher)
+    return publisher
+
+
+class QueuedPublisher(object):
+    """Publish samples through a bounded queue drained in background.
+
+    Pipelines only enqueue their samples, so that slow or stalled
+    publishers do not delay the polling and the notification handling.
+    The queued samples are published in batches by background workers.
+    """
+
+    def __init__(self, publisher):
+        conf = cfg.CONF.publisher_queue
+        self.publisher = publisher
+        self.batch_size = conf.batch_size
+        self.max_batch_age = conf.max_batch_age
+        self.workers = conf.workers
+        self.stop_timeout = conf.stop_timeout
+        self.policy = conf.policy
+        if self.policy not in ['block', 'drop']:
+            LOG.warn(_('Publisher queue policy is unknown (%s) force to '
+                       'block') % self.policy)
+            self.policy = 'block'
+        self.queue = queue.LightQueue(conf.queue_size)
+        self._threads = []
+
+        # queue metrics, in samples
+        self.depth = 0
+        self.published = 0
+        self.dropped = 0
+
+    def __str__(self):
+        return 'queued %s' % self.publisher
+
+    def __getattr__(self, name):
+        if name == 'publisher':
+            raise AttributeError(name)
+        return getattr(self.publisher, name)
+
+    def _start(self):
+        if not self._threads:
+            self._threads = [eventlet.spawn(self._run)
+                             for __ in range(self.workers)]
+
+    def publish_samples(self, context, samples):
+        """Queue samples for publishing.
+
+        :param context: Execution context from the service or RPC call.
+        :param samples: Samples from pipeline after transformation.
+        """
+        self._start()
+        item = (context, list(samples))
+        # counted before being queued, so that drain() cannot see the
+        # queue empty while a worker already publishes them
+        self.depth += len(item[1])
+        if self.policy == 'drop':
+            while True:
+                try:
+                    self.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        __, dropped = self.queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    self.depth -= len(dropped)
+                    self.dropped += len(dropped)
+                    LOG.warn(_("Publisher %(pub)s queue is full, "
+                               "dropping %(count)d oldest samples")
+                             % {'pub': self.publisher,
+                                'count': len(dropped)})
+        else:
+            self.queue.put(item)
+
+    def publish_batch(self, context, batch):
+        """Queue a SampleBatch for publishing, as samples."""
+        self.publish_samples(context, batch)
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        count = len(batch[0][1])
+        deadline = time.time() + self.max_batch_age
+        while count < self.batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item[1])
+        return batch
+
+    def _publish(self, batch):
+        for context, items in itertools.groupby(batch,
+                                                operator.itemgetter(0)):
+            samples = list(itertools.chain.from_iterable(
+                s for __, s in items))
+            try:
+                self.publisher.publish_samples(context, samples)
+                self.published += len(samples)
+            except Exception:
+                LOG.exception(_("Publisher %s: Continue after error "
+                                "from queued publishing") % self.publisher)
+            finally:
+                self.depth -= len(samples)
+        stats = self.stats()
+        stats['pub'] = self.publisher
+        LOG.debug('Publisher %(pub)s: %(published)d samples published, '
+                  '%(depth)d queued, %(dropped)d dropped', stats)
+
+    def stats(self):
+        """Return the queue metrics, in samples.
+
+        The metrics of the wrapped publisher, if it has any, are included.
+        """
+        stats = {}
+        if hasattr(self.publisher, 'stats'):
+            stats.update(self.publisher.stats())
+        stats.update({'depth': self.depth,
+                      'published': self.published,
+                      'dropped': self.dropped})
+        return stats
+
+    def _run(self):
+        while True:
+            self._publish(self._next_batch())
+
+    def drain(self, timeout=None):
+        """Wait for all the queued samples to be published.
+
+        :param timeout: maximum number of seconds to wait, forever if None.
+        :return: True if the queue has been drained.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.depth > 0:
+            if deadline is not None and time.time() > deadline:
+                return False
+            eventlet.sleep(0.01)
+        return True
+
+    def stop(self):
+        """Publish the queued samples, then stop the workers.
+
+        The samples which could not be published within stop_timeout
+        seconds are lost.
+        """
+        if not self._threads:
+            return
+        if not self.drain(self.stop_timeout):
+            LOG.warn(_("Publisher %(pub)s stopped, %(count)d queued samples "
+                       "lost") % {'pub': self.publisher, 'count': self.depth})
+            self.dropped += self.depth
+        for thread in self._threads:
+            thread.kill()
+        self._threads = []
+        self.queue = queue.LightQueue(self.queue.maxsize)
+        self.depth = 0
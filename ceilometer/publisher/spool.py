@@ -0,0 +1,264 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Append-only on-disk queue of the messages that could not be published.
+
+The spool is a directory of segment files holding length prefixed msgpack
+records, written in order and read back from a cursor saved next to them.
+Fully read segments are deleted, and the oldest segments are dropped when
+the spool grows over its maximum size.
+"""
+
+import datetime
+import mmap
+import os
+import struct
+import time
+
+import msgpack
+from oslo.config import cfg
+import six
+
+from ceilometer.openstack.common.gettextutils import _
+from ceilometer.openstack.common import log
+
+
+LOG = log.getLogger(__name__)
+
+OPTS = [
+    cfg.StrOpt('spool_dir',
+               help='Directory of the on-disk queues of the messaging '
+                    'publishers using the "spool" policy. Each publisher '
+                    'uses its own sub-directory.'),
+    cfg.IntOpt('segment_size',
+               default=4 * 1024 * 1024,
+               help='Size in bytes from which a new spool segment file is '
+                    'started.'),
+    cfg.IntOpt('max_size',
+               default=1024 * 1024 * 1024,
+               help='Maximum size in bytes of the spool of a publisher, the '
+                    'oldest segments are dropped past it.'),
+    cfg.BoolOpt('use_mmap',
+                default=False,
+                help='Memory map the spool segments when reading them back '
+                     'instead of reading them in memory.'),
+    cfg.IntOpt('replay_batch_size',
+               default=1000,
+               help='Maximum number of spooled samples read back and sent '
+                    'together when the messaging bus is reachable again.'),
+    cfg.IntOpt('retry_interval',
+               default=10,
+               help='Number of seconds between two attempts to replay the '
+                    'spool while the messaging bus is unreachable.'),
+]
+
+cfg.CONF.register_opts(OPTS, group='publisher_spool')
+
+_HEADER = struct.Struct('>I')
+_SUFFIX = '.seg'
+_CURSOR = 'cursor'
+
+
+def _encode(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    return six.text_type(obj)
+
+
+class Spool(object):
+    """Segmented append-only log of records.
+
+    Appending only writes at the end of the last segment, whatever the
+    number of records spooled. Records are read back in order with peek()
+    and removed with commit().
+    """
+
+    def __init__(self, path, segment_size, max_size, use_mmap=False):
+        self.path = path
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.use_mmap = use_mmap
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.segments = sorted(int(name[:-len(_SUFFIX)])
+                               for name in os.listdir(path)
+                               if name.endswith(_SUFFIX))
+        self.head = self._load_cursor()
+        if self.head[0] not in self.segments:
+            self.head = (self.segments[0] if self.segments
+                         else self.head[0]), 0
+        # size in bytes and number of pending records, by segment
+        self.sizes = {}
+        self.counts = {}
+        for seq in list(self.segments):
+            if seq < self.head[0]:
+                self._remove(seq)
+        for seq in self.segments:
+            self._scan(seq)
+        self._writer = None
+        self._head_timestamp = None
+
+    def _segment_path(self, seq):
+        return os.path.join(self.path, '%020d%s' % (seq, _SUFFIX))
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.path, _CURSOR), 'rb') as f:
+                seq, offset = msgpack.loads(f.read())
+            return int(seq), int(offset)
+        except Exception:
+            return (self.segments[0] if self.segments else 0), 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.path, _CURSOR)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(msgpack.dumps(list(self.head)))
+        os.rename(path + '.tmp', path)
+
+    def _remove(self, seq):
+        self.segments.remove(seq)
+        self.sizes.pop(seq, None)
+        self.counts.pop(seq, None)
+        try:
+            os.unlink(self._segment_path(seq))
+        except OSError:
+            pass
+
+    def _read(self, seq, offset):
+        """Yield the (record, end offset) of a segment from offset."""
+        with open(self._segment_path(seq), 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= offset:
+                return
+            if self.use_mmap:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                start = offset
+            else:
+                f.seek(offset)
+                data = f.read()
+                start = 0
+                size -= offset
+            try:
+                while start + _HEADER.size <= size:
+                    length, = _HEADER.unpack_from(data, start)
+                    end = start + _HEADER.size + length
+                    if end > size:
+                        # truncated by an interrupted write
+                        break
+                    yield (data[start + _HEADER.size:end],
+                           end if self.use_mmap else offset + end)
+                    start = end
+            finally:
+                if self.use_mmap:
+                    data.close()
+
+    def _scan(self, seq):
+        offset = self.head[1] if seq == self.head[0] else 0
+        count = 0
+        for __, offset in self._read(seq, offset):
+            count += 1
+        self.counts[seq] = count
+        self.sizes[seq] = offset
+        if offset < os.path.getsize(self._segment_path(seq)):
+            # drop the partial record left by an interrupted write
+            with open(self._segment_path(seq), 'r+b') as f:
+                f.truncate(offset)
+
+    @property
+    def depth(self):
+        """Number of pending records."""
+        return sum(six.itervalues(self.counts))
+
+    def age(self):
+        """Return the number of seconds the oldest record has waited."""
+        if not self.depth:
+            return 0
+        if self._head_timestamp is None:
+            for record, __ in self.peek(1):
+                self._head_timestamp = record[0]
+        return max(0, time.time() - self._head_timestamp)
+
+    def append(self, record):
+        """Append a record, dropping the oldest segments past max_size."""
+        data = msgpack.dumps([time.time()] + list(record), default=_encode)
+        if (self._writer is None
+                or self.sizes[self.segments[-1]] >= self.segment_size):
+            self._roll()
+        self._writer.write(_HEADER.pack(len(data)) + data)
+        self._writer.flush()
+        seq = self.segments[-1]
+        self.sizes[seq] += _HEADER.size + len(data)
+        self.counts[seq] += 1
+        while (len(self.segments) > 1
+               and sum(six.itervalues(self.sizes)) > self.max_size):
+            seq = self.segments[0]
+            LOG.warn(_('Spool %(path)s is full, dropping %(count)d oldest '
+                       'messages') % {'path': self.path,
+                                      'count': self.counts[seq]})
+            self._remove(seq)
+            self.head = (self.segments[0], 0)
+            self._head_timestamp = None
+            self._save_cursor()
+
+    def _roll(self):
+        if self._writer is not None:
+            self._writer.close()
+        if (self._writer is None and self.segments
+                and self.sizes[self.segments[-1]] < self.segment_size):
+            seq = self.segments[-1]
+        else:
+            seq = self.segments[-1] + 1 if self.segments else self.head[0]
+            self.segments.append(seq)
+            self.sizes[seq] = 0
+            self.counts[seq] = 0
+        self._writer = open(self._segment_path(seq), 'ab')
+
+    def peek(self, count, weight=None):
+        """Return up to count (record, position) from the head, in order.
+
+        The position is the one to commit() once the record is handled.
+
+        :param weight: optional function returning the weight of a record,
+                       counted against count instead of 1. At least one
+                       record is returned, whatever its weight.
+        """
+        records = []
+        total = 0
+        seq, offset = self.head
+        for seq in self.segments:
+            if seq < self.head[0]:
+                continue
+            offset = self.head[1] if seq == self.head[0] else 0
+            for data, end in self._read(seq, offset):
+                record = msgpack.loads(data, encoding='utf-8')
+                records.append((record, (seq, end)))
+                total += weight(record) if weight else 1
+                if total >= count:
+                    return records
+        return records
+
+    def commit(self, position, count):
+        """Remove the count records up to position from the spool."""
+        seq, offset = position
+        for head in list(self.segments):
+            if head >= seq:
+                break
+            count -= self.counts[head]
+            self._remove(head)
+        self.counts[seq] -= count
+        self.head = (seq, offset)
+        self._head_timestamp = None
+        if (seq != self.segments[-1] and
+                offset >= self.sizes[seq]):
+            self._remove(seq)
+            self.head = (self.segments[0], 0)
+        self._save_cursor()
@@ -29,12 +29,43 @@ from ceilometer.openstack.common import log
 from ceilometer import publisher
 from ceilometer.publisher import utils
 
+OPTS = [
+    cfg.IntOpt('max_payload_size',
+               default=0,
+               help='Maximum size in bytes of the datagrams batching '
+                    'several samples. 0 sends one sample per datagram, as '
+                    'understood by the collectors of all versions.'),
+]
+
+cfg.CONF.register_opts(OPTS, group="publisher_udp")
 cfg.CONF.import_opt('udp_port', 'ceilometer.collector',
                     group='collector')
 
 LOG = log.getLogger(__name__)
 
 
+def pack_batches(messages, max_size):
+    """Pack the messages into msgpack arrays of at most max_size bytes.
+
+    Each message is only encoded once, the arrays are assembled from the
+    encoded messages. A message larger than max_size is packed alone.
+    """
+    packer = msgpack.Packer()
+    batch = []
+    size = 0
+    for message in messages:
+        data = packer.pack(message)
+        # 5 bytes is the largest array header
+        if batch and size + len(data) + 5 > max_size:
+            yield packer.pack_array_header(len(batch)) + b''.join(batch)
+            batch = []
+            size = 0
+        batch.append(data)
+        size += len(data)
+    if batch:
+        yield packer.pack_array_header(len(batch)) + b''.join(batch)
+
+
 class UDPPublisher(publisher.PublisherBase):
     def __init__(self, parsed_url):
         self.host, self.port = netutils.parse_host_port(
@@ -42,26 +73,47 @@ class UDPPublisher(publisher.PublisherBase):
             default_port=cfg.CONF.collector.udp_port)
         self.socket = socket.socket(socket.AF_INET,
                                     socket.SOCK_DGRAM)
+        self.max_payload_size = cfg.CONF.publisher_udp.max_payload_size
+
+    def _send(self, data):
+        try:
+            self.socket.sendto(data, (self.host, self.port))
+        except Exception as e:
+            LOG.warn(_("Unable to send sample over UDP"))
+            LOG.exception(e)
 
     def publish_samples(self, context, samples):
         """Send a metering message for publishing
 
         :param context: Execution context from the service or RPC call
-        :param samples: Samples from pipeline after transformation
+        :param samples: Samples or SampleBatch from pipeline after
+                        transformation
         """
 
-        for sample in samples:
-            msg = utils.meter_message_from_counter(
-                sample,
-                cfg.CONF.publisher.metering_secret)
+        msgs = utils.meter_messages(samples,
+                                    cfg.CONF.publisher.metering_secret)
+
+        if self.max_payload_size > 0:
+            LOG.debug(_("Publishing %(count)d samples over UDP to "
+                        "%(host)s:%(port)d") % {'count': len(msgs),
+                                                'host': self.host,
+                                                'port': self.port})
+            for data in pack_batches(msgs, self.max_payload_size):
+                self._send(data)
+            return
+
+        for msg in msgs:
             host = self.host
             port = self.port
             LOG.debug(_("Publishing sample %(msg)s over UDP to "
                         "%(host)s:%(port)d") % {'msg': msg, 'host': host,
                                                 'port': port})
-            try:
-                self.socket.sendto(msgpack.dumps(msg),
-                                   (self.host, self.port))
-            except Exception as e:
-                LOG.warn(_("Unable to send sample over UDP"))
-                LOG.exception(e)
+            self._send(msgpack.dumps(msg))
+
+    def publish_batch(self, context, batch):
+        """Send the metering messages of a SampleBatch
+
+        :param context: Execution context from the service or RPC call
+        :param batch: SampleBatch from pipeline after transformation
+        """
+        self.publish_samples(context, batch)
@@ -0,0 +1,152 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Binary record files of the file publisher and dispatcher.
+
+A record file is a sequence of length prefixed msgpack records. The file
+being written is rotated by size or by age, the rotated segments get a
+timestamp suffix and are optionally compressed with zlib, a '.z' suffix
+being appended then.
+"""
+
+import datetime
+import os
+import struct
+import time
+import zlib
+
+import msgpack
+import six
+
+_HEADER = struct.Struct('>I')
+_CHUNK_SIZE = 64 * 1024
+COMPRESSED_SUFFIX = '.z'
+
+
+def _encode(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    return six.text_type(obj)
+
+
+class RecordWriter(object):
+    """Append records to a file, rotating and compressing it.
+
+    Records are written through a buffer flushed once per write() call,
+    rather than once per record.
+
+    :param path: path of the file being written.
+    :param max_bytes: size from which the file is rotated, 0 to disable.
+    :param max_age: number of seconds after which the file is rotated, 0 to
+                    disable.
+    :param backup_count: number of rotated segments kept, 0 to keep them
+                         all.
+    :param compress: compress the rotated segments.
+    """
+
+    def __init__(self, path, max_bytes=0, max_age=0, backup_count=0,
+                 compress=False, buffer_size=_CHUNK_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'ab', self.buffer_size)
+        self.size = self._file.tell()
+        self.opened_at = time.time()
+
+    def write(self, records):
+        for record in records:
+            data = msgpack.dumps(record, default=_encode)
+            self._file.write(_HEADER.pack(len(data)))
+            self._file.write(data)
+            self.size += _HEADER.size + len(data)
+        self._file.flush()
+        if ((self.max_bytes and self.size >= self.max_bytes) or
+                (self.max_age and
+                 time.time() - self.opened_at >= self.max_age)):
+            self.rotate()
+
+    def rotate(self):
+        """Close the file and start a new one, if anything was written."""
+        if not self.size:
+            self.opened_at = time.time()
+            return
+        self._file.close()
+        stamp = datetime.datetime.utcnow()
+        while True:
+            segment = '%s.%s' % (self.path, stamp.strftime('%Y%m%dT%H%M%S%f'))
+            if not (os.path.exists(segment) or
+                    os.path.exists(segment + COMPRESSED_SUFFIX)):
+                break
+            # keep the segments sorted by name when rotating fast
+            stamp += datetime.timedelta(microseconds=1)
+        os.rename(self.path, segment)
+        self._open()
+        if self.compress:
+            _compress(segment)
+        if self.backup_count:
+            for old in segments(self.path)[:-self.backup_count - 1]:
+                os.unlink(old)
+
+    def close(self):
+        self._file.close()
+
+
+def _compress(path):
+    compressor = zlib.compressobj()
+    with open(path, 'rb') as src:
+        with open(path + COMPRESSED_SUFFIX, 'wb') as dst:
+            for chunk in iter(lambda: src.read(_CHUNK_SIZE), b''):
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.flush())
+    os.unlink(path)
+
+
+def segments(path):
+    """Return the rotated segments of a file then the file, oldest first."""
+    directory, name = os.path.split(path)
+    rotated = sorted(os.path.join(directory, f)
+                     for f in os.listdir(directory or os.curdir)
+                     if f.startswith(name + '.'))
+    if os.path.exists(path):
+        rotated.append(path)
+    return rotated
+
+
+def read_records(path):
+    """Yield the records of a file or of a compressed segment.
+
+    A record truncated by an interrupted write ends the file.
+    """
+    with open(path, 'rb') as f:
+        chunks = iter(lambda: f.read(_CHUNK_SIZE), b'')
+        if path.endswith(COMPRESSED_SUFFIX):
+            decompressor = zlib.decompressobj()
+            chunks = (decompressor.decompress(chunk) for chunk in chunks)
+        data = b''
+        for chunk in chunks:
+            data += chunk
+            start = 0
+            while start + _HEADER.size <= len(data):
+                length, = _HEADER.unpack_from(data, start)
+                end = start + _HEADER.size + length
+                if end > len(data):
+                    break
+                yield msgpack.loads(data[start + _HEADER.size:end],
+                                    encoding='utf-8')
+                start = end
+            data = data[start:]
@@ -23,10 +23,15 @@ ensure that all of the appropriate fields have been filled
 in by the plugins that create them.
 """
 
+import array
+import calendar
+import collections
 import copy
 import uuid
 
 from oslo.config import cfg
+from oslo.utils import timeutils
+import six
 
 
 OPTS = [
@@ -54,8 +59,17 @@ cfg.CONF.register_opts(OPTS)
 # Resource ID: the resource ID
 # Timestamp: when the sample has been read
 # Resource metadata: various metadata
+FIELDS = ('name', 'type', 'unit', 'volume', 'user_id', 'project_id',
+          'resource_id', 'timestamp', 'resource_metadata', 'source')
+
+
 class Sample(object):
 
+    # Samples are created by the million, keep them small. The signed
+    # metering message is kept in _message once published, see
+    # ceilometer.publisher.utils.meter_messages.
+    __slots__ = FIELDS + ('_id', '_message')
+
     def __init__(self, name, type, unit, volume, user_id, project_id,
                  resource_id, timestamp, resource_metadata, source=None):
         self.name = name
@@ -68,10 +82,47 @@ class Sample(object):
         self.timestamp = timestamp
         self.resource_metadata = resource_metadata
         self.source = source or cfg.CONF.sample_source
-        self.id = str(uuid.uuid1())
+
+    @property
+    def id(self):
+        # Most samples are transformed or dropped before being published,
+        # so the id is only generated when it is first needed.
+        try:
+            return self._id
+        except AttributeError:
+            self._id = str(uuid.uuid1())
+            return self._id
+
+    @id.setter
+    def id(self, value):
+        self._id = value
+
+    def __getstate__(self):
+        # copies keep the id of the sample, generated now if need be, but
+        # not its signed message, as they may be changed
+        state = dict((f, getattr(self, f)) for f in FIELDS)
+        state['_id'] = self.id
+        state.update(getattr(self, '__dict__', {}))
+        return state
+
+    def __setstate__(self, state):
+        for k, v in six.iteritems(state):
+            setattr(self, k, v)
 
     def as_dict(self):
-        return copy.copy(self.__dict__)
+        return dict(self.as_view())
+
+    def as_view(self):
+        """Return a read-only mapping of the sample fields, without copy."""
+        return SampleView(self)
+
+    @classmethod
+    def from_dict(cls, fields):
+        """Rebuild a sample from the fields returned by as_dict()."""
+        s = cls(**dict((f, fields.get(f)) for f in FIELDS))
+        if fields.get('id'):
+            s.id = fields['id']
+        return s
 
     @classmethod
     def from_notification(cls, name, type, volume, unit,
@@ -91,6 +142,181 @@ class Sample(object):
                    resource_metadata=metadata,
                    source=source)
 
+
+class SampleView(collections.Mapping):
+    """Read-only mapping view of the fields of a sample."""
+
+    __slots__ = ('_sample',)
+
+    _keys = FIELDS + ('id',)
+
+    def __init__(self, sample):
+        self._sample = sample
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return getattr(self._sample, key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class _Column(object):
+    """Dictionary encoded column of often repeated values."""
+
+    __slots__ = ('values', 'codes', '_index')
+
+    def __init__(self):
+        self.values = []
+        self.codes = array.array('l')
+        self._index = {}
+
+    def append(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __len__(self):
+        return len(self.codes)
+
+
+class SampleBatch(object):
+    """Columnar batch of samples.
+
+    The volumes are kept as they are, int or float, so that large counters
+    do not lose precision. The strings repeated from sample to sample
+    (names, resource ids, timestamps...) are stored once per batch and
+    referenced by index. Iterating over a batch yields Sample objects,
+    for the transformers and publishers that only handle samples.
+    """
+
+    ENCODED = ('name', 'type', 'unit', 'user_id', 'project_id',
+               'resource_id', 'timestamp', 'source')
+
+    def __init__(self):
+        self.columns = dict((f, _Column()) for f in self.ENCODED)
+        self.volumes = []
+        self.resource_metadata = []
+        # message ids already generated, None otherwise
+        self.ids = []
+
+    @classmethod
+    def from_samples(cls, samples):
+        batch = cls()
+        for s in samples:
+            batch.append(s)
+        return batch
+
+    def append(self, s):
+        for f in self.ENCODED:
+            self.columns[f].append(getattr(s, f))
+        self.volumes.append(s.volume)
+        self.resource_metadata.append(s.resource_metadata)
+        self.ids.append(getattr(s, '_id', None))
+
+    def __len__(self):
+        return len(self.volumes)
+
+    def __getitem__(self, i):
+        s = Sample(volume=self.volumes[i],
+                   resource_metadata=self.resource_metadata[i],
+                   **dict((f, self.columns[f][i]) for f in self.ENCODED))
+        if self.ids[i] is not None:
+            s.id = self.ids[i]
+        return s
+
+    def __iter__(self):
+        return (self[i] for i in six.moves.range(len(self)))
+
+    def distinct(self, field):
+        """Return the distinct values of an encoded column."""
+        return list(self.columns[field].values)
+
+    def _append_from(self, other, i):
+        for f in self.ENCODED:
+            self.columns[f].append(other.columns[f][i])
+        self.volumes.append(other.volumes[i])
+        self.resource_metadata.append(other.resource_metadata[i])
+        self.ids.append(other.ids[i])
+
+    def take(self, indices):
+        """Return a new batch made of the samples at the given indices."""
+        batch = SampleBatch()
+        for i in indices:
+            batch._append_from(self, i)
+        return batch
+
+    @classmethod
+    def concat(cls, batches):
+        """Return a new batch made of the samples of several batches."""
+        batch = cls()
+        for other in batches:
+            for i in six.moves.range(len(other)):
+                batch._append_from(other, i)
+        return batch
+
+    def split_by(self, field):
+        """Split the batch by the values of an encoded column.
+
+        :return: a dict of (value, batch)
+        """
+        column = self.columns[field]
+        if len(column.values) == 1:
+            return {column.values[0]: self}
+        indices = collections.defaultdict(list)
+        for i, code in enumerate(column.codes):
+            indices[code].append(i)
+        return dict((column.values[code], self.take(idx))
+                    for code, idx in six.iteritems(indices))
+
+    def epochs(self):
+        """Return the timestamps as an array of seconds since the epoch.
+
+        Each distinct timestamp is parsed only once.
+        """
+        column = self.columns['timestamp']
+        parsed = []
+        for value in column.values:
+            ts = timeutils.parse_isotime(value)
+            parsed.append(calendar.timegm(ts.utctimetuple()) +
+                          ts.microsecond / 1e6)
+        return array.array('d', (parsed[c] for c in column.codes))
+
+    def convert(self, scale=None, **values):
+        """Return a new batch with scaled volumes and replaced fields.
+
+        The columns left unchanged are shared with the new batch.
+
+        :param scale: optional multiplicative factor of the volumes
+        :param values: new values of encoded columns, for all the samples
+        """
+        batch = SampleBatch()
+        for f in self.ENCODED:
+            if f in values:
+                column = batch.columns[f]
+                column.append(values[f])
+                column.codes = array.array('l', [0]) * len(self)
+            else:
+                batch.columns[f] = self.columns[f]
+        if scale is None:
+            batch.volumes = self.volumes
+        else:
+            batch.volumes = [v * scale for v in self.volumes]
+        batch.resource_metadata = self.resource_metadata
+        # converted samples are new samples
+        batch.ids = [None] * len(self)
+        return batch
+
+
 TYPE_GAUGE = 'gauge'
 TYPE_DELTA = 'delta'
 TYPE_CUMULATIVE = 'cumulative'
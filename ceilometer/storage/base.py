@@ -193,6 +193,18 @@ class Connection(object):
         raise ceilometer.NotImplementedError(
             'Recording metering data is not implemented')
 
+    def record_metering_data_batch(self, samples):
+        """Write a list of metering data to the backend storage system.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+
+        Drivers able to write them at once should override this method,
+        which records them one by one.
+        """
+        for data in samples:
+            self.record_metering_data(data)
+
     @staticmethod
     def clear_expired_metering_data(ttl):
         """Clear expired data from the backend storage system.
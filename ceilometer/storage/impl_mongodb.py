@@ -480,6 +480,33 @@ class Connection(pymongo_base.Connection):
         :param data: a dictionary such as returned by
                      ceilometer.meter.meter_message_from_counter
         """
+        self._update_resource(data)
+
+        # Record the raw data for the meter. Use a copy so we do not
+        # modify a data structure owned by our caller (the driver adds
+        # a new key '_id').
+        record = copy.copy(data)
+        record['recorded_at'] = timeutils.utcnow()
+        self.db.meter.insert(record)
+
+    def record_metering_data_batch(self, samples):
+        """Write a list of metering data, inserting the meters at once.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        if not samples:
+            return
+        recorded_at = timeutils.utcnow()
+        records = []
+        for data in samples:
+            self._update_resource(data)
+            record = copy.copy(data)
+            record['recorded_at'] = recorded_at
+            records.append(record)
+        self.db.meter.insert(records)
+
+    def _update_resource(self, data):
         # Record the updated resource metadata - we use $setOnInsert to
         # unconditionally insert sample timestamps and resource metadata
         # (in the update case, this must be conditional on the sample not
@@ -528,13 +555,6 @@ class Connection(pymongo_base.Connection):
                 {'$set': {'first_sample_timestamp': data['timestamp']}}
             )
 
-        # Record the raw data for the meter. Use a copy so we do not
-        # modify a data structure owned by our caller (the driver adds
-        # a new key '_id').
-        record = copy.copy(data)
-        record['recorded_at'] = timeutils.utcnow()
-        self.db.meter.insert(record)
-
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
 
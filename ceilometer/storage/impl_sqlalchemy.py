@@ -350,6 +350,43 @@ class Connection(base.Connection):
                          message_signature=data['message_signature'],
                          message_id=data['message_id'])
 
+    def record_metering_data_batch(self, samples):
+        """Write a list of metering data in a single transaction.
+
+        The meters and resources are looked up once per batch, and the
+        samples inserted together.
+
+        :param samples: a list of dictionaries such as returned by
+                        ceilometer.meter.meter_message_from_counter
+        """
+        meters = {}
+        resources = {}
+        rows = []
+        engine = self._engine_facade.get_engine()
+        with engine.begin() as conn:
+            for data in samples:
+                meter_key = (data['counter_name'], data['counter_type'],
+                             data['counter_unit'])
+                if meter_key not in meters:
+                    meters[meter_key] = self._create_meter(conn, *meter_key)
+                resource_key = (data['resource_id'], data['user_id'],
+                                data['project_id'], data['source'],
+                                jsonutils.dumps(data['resource_metadata'],
+                                                sort_keys=True))
+                if resource_key not in resources:
+                    resources[resource_key] = self._create_resource(
+                        conn, data['resource_id'], data['user_id'],
+                        data['project_id'], data['source'],
+                        data['resource_metadata'])
+                rows.append({'meter_id': meters[meter_key],
+                             'resource_id': resources[resource_key],
+                             'timestamp': data['timestamp'],
+                             'volume': data['counter_volume'],
+                             'message_signature': data['message_signature'],
+                             'message_id': data['message_id']})
+            if rows:
+                conn.execute(models.Sample.__table__.insert(), rows)
+
     def clear_expired_metering_data(self, ttl):
         """Clear expired data from the backend storage system.
 
@@ -25,6 +25,7 @@ import abc
 import copy
 import datetime
 
+import eventlet
 import mock
 from oslo.config import fixture as fixture_config
 from oslotest import mockpatch
@@ -50,7 +51,7 @@ class TestSample(sample.Sample):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.as_dict() == other.as_dict()
         return False
 
     def __ne__(self, other):
@@ -286,14 +287,79 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         self.mgr.join_partitioning_groups = mock.MagicMock()
         self.mgr.setup_polling_tasks = mock.MagicMock()
         self.CONF.set_override('heartbeat', 1.0, group='coordination')
+        previous = self.mgr.pipeline_manager
         self.mgr.start()
-        setup_pipeline.assert_called_once_with()
+        setup_pipeline.assert_called_once_with(previous=previous)
         self.mgr.partition_coordinator.start.assert_called_once_with()
         self.mgr.join_partitioning_groups.assert_called_once_with()
         self.mgr.setup_polling_tasks.assert_called_once_with()
         timer_call = mock.call(1.0, self.mgr.partition_coordinator.heartbeat)
         self.assertEqual([timer_call], self.mgr.tg.add_timer.call_args_list)
 
+    @mock.patch('ceilometer.checkpoint.save')
+    @mock.patch('ceilometer.checkpoint.restore')
+    @mock.patch('ceilometer.pipeline.setup_pipeline')
+    def test_start_stop_checkpoint(self, setup_pipeline, restore, save):
+        self.mgr.join_partitioning_groups = mock.MagicMock()
+        self.mgr.setup_polling_tasks = mock.MagicMock()
+        self.CONF.set_override('state_file', '/tmp/state',
+                               group='checkpoint')
+        del self.mgr.pipeline_manager
+        self.mgr.start()
+        restore.assert_called_once_with(setup_pipeline.return_value)
+        self.assertIn(mock.call(60, self.mgr.save_checkpoint),
+                      self.mgr.tg.add_timer.call_args_list)
+
+        # SIGHUP keeps the live state of the transformers
+        self.mgr.start()
+        self.assertEqual(1, restore.call_count)
+
+        self.mgr.stop()
+        save.assert_called_once_with(setup_pipeline.return_value)
+
+    def test_reload_pipeline(self):
+        self.mgr.join_partitioning_groups = mock.MagicMock()
+        self.mgr.tg.timers = []
+        self.mgr.start_polling_tasks()
+        old_tasks = set(self.mgr.polling_tasks)
+        timer = mock.MagicMock()
+        self.mgr.tg.timers = [timer]
+        self.mgr._polling_timers = [timer]
+
+        previous = self.mgr.pipeline_manager
+        self.pipeline_cfg.append({
+            'name': "test_pipeline_2",
+            'interval': 10,
+            'counters': ['testanother'],
+            'resources': [],
+            'transformers': [],
+            'publishers': ["test"],
+        })
+        pipeline_manager = pipeline.PipelineManager(
+            self.pipeline_cfg, self.transformer_manager, previous=previous)
+        with mock.patch('ceilometer.pipeline.setup_pipeline',
+                        return_value=pipeline_manager) as setup_pipeline:
+            self.mgr.reload_pipeline()
+
+        setup_pipeline.assert_called_once_with(previous=previous)
+        self.mgr.join_partitioning_groups.assert_called_once_with()
+        timer.stop.assert_called_once_with()
+        self.assertEqual([], self.mgr.tg.timers)
+        self.assertIs(pipeline_manager, self.mgr.pipeline_manager)
+        self.assertEqual(2, len(self.mgr.polling_tasks))
+        self.assertTrue(self.mgr.polling_tasks.isdisjoint(old_tasks))
+        # the unchanged sink is kept, with its state
+        self.assertIs(previous.pipelines[0].sink,
+                      pipeline_manager.pipelines[0].sink)
+
+    def test_reload_pipeline_error(self):
+        previous = self.mgr.pipeline_manager
+        self.mgr._polling_timers = []
+        with mock.patch('ceilometer.pipeline.setup_pipeline',
+                        side_effect=Exception('bad yaml')):
+            self.mgr.reload_pipeline()
+        self.assertIs(previous, self.mgr.pipeline_manager)
+
     def test_join_partitioning_groups(self):
         self.mgr.discovery_manager = self.create_discovery_manager()
         self.mgr.join_partitioning_groups()
@@ -402,6 +468,119 @@ class BaseAgentManagerTestCase(base.BaseTestCase):
         pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
         self.assertEqual(0, len(pub.samples))
 
+    def test_shared_pollster_without_samples_polled_once(self):
+        self.pipeline_cfg.append({
+            'name': "test_pipeline_2",
+            'interval': 60,
+            'counters': ['test'],
+            'resources': ['test://'] if self.source_resources else [],
+            'transformers': [],
+            'publishers': ["test"],
+        })
+        self.setup_pipeline()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        with mock.patch.object(self.Pollster, 'get_samples',
+                               return_value=[]) as get_samples:
+            self.mgr.interval_task(polling_tasks.get(60))
+        self.assertEqual(1, get_samples.call_count)
+
+    def _assert_one_publish_per_cycle(self):
+        self.CONF.set_override('grouped_publishing', True)
+        self.pipeline_cfg[0]['counters'].append('testanother')
+        self.setup_pipeline()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        self.mgr.interval_task(polling_tasks.get(60))
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(1, pub.calls)
+        self.assertEqual(set(['test', 'testanother']),
+                         set(s.name for s in pub.samples))
+
+    def test_one_publish_per_cycle(self):
+        self._assert_one_publish_per_cycle()
+
+    def test_one_publish_per_cycle_batch(self):
+        self.CONF.set_override('batch_polled_samples', True)
+        self._assert_one_publish_per_cycle()
+
+    def test_concurrent_polling(self):
+        self.CONF.set_override('pollster_workers', 4)
+        self.pipeline_cfg[0]['counters'].append('testanother')
+        self.setup_pipeline()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        self.mgr.interval_task(polling_tasks.get(60))
+        self.assertEqual(1, len(self.Pollster.samples))
+        self.assertEqual(1, len(self.PollsterAnother.samples))
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(set(['test', 'testanother']),
+                         set(s.name for s in pub.samples))
+
+    def test_concurrent_polling_timeout_isolation(self):
+        self.CONF.set_override('pollster_workers', 4)
+        self.CONF.set_override('pollster_timeout', 0.01)
+        self.pipeline_cfg[0]['counters'].append('testanother')
+        self.setup_pipeline()
+        polling_tasks = self.mgr.setup_polling_tasks()
+
+        def slow_get_samples(manager, cache, resources):
+            eventlet.sleep(1)
+            return []
+
+        with mock.patch.object(self.PollsterAnother, 'get_samples',
+                               side_effect=slow_get_samples):
+            self.mgr.interval_task(polling_tasks.get(60))
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(['test'], [s.name for s in pub.samples])
+
+    def test_host_offset(self):
+        self.CONF.set_override('polling_jitter', 0.5)
+        self.CONF.set_override('host', 'compute-1')
+        offset = self.mgr.host_offset(60)
+        self.assertTrue(0 <= offset < 30)
+        self.assertEqual(offset, self.mgr.host_offset(60))
+        self.CONF.set_override('host', 'compute-2')
+        self.assertNotEqual(offset, self.mgr.host_offset(60))
+        self.CONF.set_override('polling_jitter', 0)
+        self.assertEqual(0, self.mgr.host_offset(60))
+
+    def test_next_run(self):
+        self.assertEqual(125, self.mgr.next_run(100, 60, 5))
+        self.assertEqual(185, self.mgr.next_run(125, 60, 5))
+        self.assertEqual(185, self.mgr.next_run(130.5, 60, 5))
+
+    def test_split_by_phase(self):
+        self.pipeline_cfg[0]['counters'].append('testanother')
+        self.setup_pipeline()
+        polling_tasks = self.mgr.setup_polling_tasks()
+        phase_tasks = self.mgr.split_by_phase(polling_tasks[60])
+        self.assertEqual({0.0: polling_tasks[60]}, phase_tasks)
+
+        self.CONF.set_override('pollster_phase_offsets',
+                               {'testanother': '0.5'})
+        phase_tasks = self.mgr.split_by_phase(polling_tasks[60])
+        self.assertEqual(set([0.0, 0.5]), set(phase_tasks))
+        for phase, name in [(0.0, 'test'), (0.5, 'testanother')]:
+            matches = phase_tasks[phase].pollster_matches.values()
+            self.assertEqual([[name]],
+                             [[p.name for p in m] for m in matches])
+        self.mgr.interval_task(phase_tasks[0.5])
+        pub = self.mgr.pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(['testanother'], [s.name for s in pub.samples])
+
+    def test_agent_manager_start_scheduled(self):
+        self.CONF.set_override('polling_jitter', 0.5)
+        mgr = self.create_manager()
+        mgr.pollster_manager = self.mgr.pollster_manager
+        mgr.tg = mock.MagicMock()
+        mgr.join_partitioning_groups = mock.MagicMock()
+        with mock.patch('ceilometer.pipeline.setup_pipeline',
+                        return_value=self.mgr.pipeline_manager):
+            mgr.start()
+        self.assertEqual(1, len(mgr.tg.add_thread.call_args_list))
+        args = mgr.tg.add_thread.call_args[0]
+        self.assertEqual(mgr.scheduled_task, args[0])
+        self.assertEqual(60, args[1])
+        self.assertEqual(mgr.host_offset(60), args[2])
+
     def test_agent_manager_start(self):
         mgr = self.create_manager()
         mgr.pollster_manager = self.mgr.pollster_manager
@@ -20,6 +20,7 @@
 import mock
 from oslotest import mockpatch
 
+import ceilometer
 import ceilometer.tests.base as base
 
 
@@ -29,6 +30,8 @@ class TestPollsterBase(base.BaseTestCase):
         super(TestPollsterBase, self).setUp()
 
         self.inspector = mock.Mock()
+        self.inspector.inspect_domain_stats = mock.Mock(
+            side_effect=ceilometer.NotImplementedError)
         self.instance = mock.MagicMock()
         self.instance.name = 'instance-00000001'
         setattr(self.instance, 'OS-EXT-SRV-ATTR:instance_name',
@@ -23,6 +23,7 @@ import mock
 
 from ceilometer.compute import manager
 from ceilometer.compute.pollsters import cpu
+from ceilometer.compute.pollsters import util
 from ceilometer.compute.virt import inspector as virt_inspector
 from ceilometer.tests.compute.pollsters import base
 
@@ -75,7 +76,28 @@ class TestCPUPollster(base.TestPollsterBase):
         samples = list(pollster.get_samples(mgr, cache, [self.instance]))
         self.assertEqual(1, len(samples))
         self.assertEqual(10 ** 6, samples[0].volume)
-        self.assertEqual(0, len(cache))
+        # only the instance metadata is cached, not the CPU stats
+        self.assertEqual([util.CACHE_KEY_METADATA], list(cache))
+
+    @mock.patch('ceilometer.pipeline.setup_pipeline', mock.MagicMock())
+    def test_get_samples_from_domain_stats(self):
+        cpu_stats = virt_inspector.CPUStats(time=5 * (10 ** 6), number=4)
+        self.inspector.inspect_domain_stats = mock.Mock(return_value={
+            self.instance.name: virt_inspector.DomainStats(
+                cpu=cpu_stats, allocated_memory=None, vnics=[], disks=[])})
+        self.inspector.inspect_cpus = mock.Mock()
+
+        mgr = manager.AgentManager()
+        pollster = cpu.CPUPollster()
+
+        cache = {}
+        samples = list(pollster.get_samples(mgr, cache, [self.instance]))
+        samples.extend(pollster.get_samples(mgr, cache, [self.instance]))
+        self.assertEqual(2, len(samples))
+        self.assertEqual(5 * (10 ** 6), samples[0].volume)
+        self.assertEqual(4, samples[0].resource_metadata.get('cpu_number'))
+        self.inspector.inspect_domain_stats.assert_called_once_with()
+        self.assertFalse(self.inspector.inspect_cpus.called)
 
 
 class TestCPUUtilPollster(base.TestPollsterBase):
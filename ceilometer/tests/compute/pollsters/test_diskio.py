@@ -21,6 +21,7 @@
 import mock
 from oslotest import mockpatch
 
+import ceilometer
 from ceilometer.compute import manager
 from ceilometer.compute.pollsters import disk
 from ceilometer.compute.virt import inspector as virt_inspector
@@ -35,6 +36,8 @@ class TestBaseDiskIO(base.BaseTestCase):
         super(TestBaseDiskIO, self).setUp()
 
         self.inspector = mock.Mock()
+        self.inspector.inspect_domain_stats = mock.Mock(
+            side_effect=ceilometer.NotImplementedError)
         self.instance = self._get_fake_instances()
         patch_virt = mockpatch.Patch(
             'ceilometer.compute.virt.inspector.get_hypervisor_inspector',
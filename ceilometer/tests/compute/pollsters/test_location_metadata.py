@@ -113,3 +113,23 @@ class TestLocationMetadata(base.BaseTestCase):
         md = util._get_metadata_from_object(self.instance)
         self.assertEqual(1, md['image_ref'])
         self.assertIsNone(md['image_ref_url'])
+
+    def test_metadata_cached_per_cycle(self):
+        self.instance.id = 'instance-id'
+        self.instance.user_id = 'user-id'
+        self.instance.tenant_id = 'tenant-id'
+        cache = {}
+        with mock.patch.object(util, '_get_metadata_from_object',
+                               wraps=util._get_metadata_from_object) as get:
+            cpu = util.make_sample_from_instance(
+                self.instance, cache=cache, name='cpu', type='cumulative',
+                unit='ns', volume=1, additional_metadata={'cpu_number': 2})
+            instance = util.make_sample_from_instance(
+                self.instance, cache=cache, name='instance', type='gauge',
+                unit='instance', volume=1)
+            self.assertEqual(1, get.call_count)
+        self.assertIs(cache[util.CACHE_KEY_METADATA]['instance-id'],
+                      instance.resource_metadata)
+        # the additional metadata does not leak into the shared metadata
+        self.assertEqual(2, cpu.resource_metadata['cpu_number'])
+        self.assertNotIn('cpu_number', instance.resource_metadata)
@@ -0,0 +1,177 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/compute/discovery.py
+"""
+
+import datetime
+
+import mock
+from oslo.config import fixture as fixture_config
+from oslo.utils import timeutils
+from oslotest import base
+
+from ceilometer.compute import discovery
+from ceilometer.compute.virt import inspector as virt_inspector
+
+
+class TestInstanceDiscovery(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestInstanceDiscovery, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('host', 'compute-1')
+        self.CONF.set_override('resource_update_interval', 60,
+                               group='compute')
+        self.CONF.set_override('resource_cache_expiry', 3600,
+                               group='compute')
+        with mock.patch('ceilometer.nova_client.Client'):
+            self.discovery = discovery.InstanceDiscovery()
+        self.nova = self.discovery.nova_cli.instance_get_all_by_host
+        self.manager = mock.MagicMock()
+        self.domains = []
+        self.manager.inspector.inspect_instances.side_effect = (
+            lambda: iter(self.domains))
+        self.now = datetime.datetime(2014, 10, 1)
+        timeutils.set_time_override(self.now)
+        self.addCleanup(timeutils.clear_time_override)
+
+    @staticmethod
+    def _instance(id, vm_state='active', status='ACTIVE'):
+        instance = mock.MagicMock(id=id, status=status)
+        setattr(instance, 'OS-EXT-STS:vm_state', vm_state)
+        return instance
+
+    def _domain(self, id):
+        self.domains.append(virt_inspector.Instance(name='instance-%s' % id,
+                                                    UUID=id))
+
+    def _discover(self, seconds=0):
+        timeutils.advance_time_seconds(seconds)
+        return [i.id for i in self.discovery.discover(self.manager)]
+
+    def test_full_then_incremental(self):
+        self.nova.return_value = [self._instance('a'),
+                                  self._instance('b', vm_state='error')]
+        self.assertEqual(['a'], self._discover())
+        self.nova.assert_called_once_with('compute-1')
+
+        # served from the cache until the update interval elapsed
+        self.nova.reset_mock()
+        self.assertEqual(['a'], self._discover(30))
+        self.assertFalse(self.nova.called)
+
+        self.nova.return_value = [self._instance('a', vm_state='deleted',
+                                                 status='DELETED'),
+                                  self._instance('c')]
+        self.assertEqual(['c'], self._discover(30))
+        self.nova.assert_called_once_with('compute-1',
+                                          since=self.now.isoformat())
+
+    def test_cache_expiry(self):
+        self.nova.return_value = [self._instance('a')]
+        self._discover()
+        self.nova.return_value = [self._instance('b')]
+        self.assertEqual(['b'], self._discover(3600))
+        self.nova.assert_called_with('compute-1')
+
+    def test_local_domain_changes(self):
+        self._domain('a')
+        self.nova.return_value = [self._instance('a')]
+        self._discover()
+
+        # a new domain triggers an incremental query
+        self._domain('b')
+        self.nova.return_value = [self._instance('b')]
+        self.assertEqual(['a', 'b'], self._discover(1))
+        self.nova.assert_called_with('compute-1',
+                                     since=self.now.isoformat())
+
+        # a vanished domain triggers a full resync
+        del self.domains[0]
+        self.assertEqual(['b'], self._discover(1))
+        self.nova.assert_called_with('compute-1')
+
+    def test_nova_failure(self):
+        self.nova.side_effect = Exception
+        self.assertRaises(Exception, self._discover)
+
+        self.nova.side_effect = None
+        self.nova.return_value = [self._instance('a')]
+        self._discover()
+        self.nova.side_effect = Exception
+        self.assertEqual(['a'], self._discover(60))
+
+    def test_libvirt_metadata(self):
+        self.CONF.set_override('instance_discovery_method',
+                               'libvirt_metadata', group='compute')
+        metadata = {'name': 'test',
+                    'flavor': {'name': 'm1.tiny', 'vcpus': 1, 'ram': 512,
+                               'disk': 1, 'ephemeral': 0},
+                    'user_id': 'user-id',
+                    'project_id': 'project-id',
+                    'image_id': 'image-id'}
+        self.manager.inspector.inspect_instances_metadata.return_value = [
+            (virt_inspector.Instance(name='instance-1', UUID='a'), 'active',
+             metadata),
+            (virt_inspector.Instance(name='instance-2', UUID='b'), 'paused',
+             None),
+        ]
+        flavor = mock.MagicMock(id='1')
+        flavor.name = 'm1.tiny'
+        flavor_get_all = self.discovery.nova_cli.flavor_get_all
+        flavor_get_all.return_value = [flavor]
+        self.nova.return_value = [self._instance('b', vm_state='paused'),
+                                  self._instance('c')]
+
+        instances = self.discovery.discover(self.manager)
+        self.assertEqual(['a', 'b'], [i.id for i in instances])
+        local = instances[0]
+        self.assertEqual('test', local.name)
+        self.assertEqual('instance-1',
+                         getattr(local, 'OS-EXT-SRV-ATTR:instance_name'))
+        self.assertEqual('ACTIVE', local.status)
+        self.assertEqual('user-id', local.user_id)
+        self.assertEqual('project-id', local.tenant_id)
+        self.assertEqual({'id': '1', 'name': 'm1.tiny', 'vcpus': 1,
+                          'ram': 512, 'disk': 1, 'ephemeral': 0},
+                         local.flavor)
+        self.assertEqual({'id': 'image-id'}, local.image)
+        self.discovery.nova_cli.with_image.assert_called_once_with(local)
+
+        # the flavors are only listed again for unknown ones, once expired
+        self.discovery.discover(self.manager)
+        self.assertEqual(1, flavor_get_all.call_count)
+
+    def test_libvirt_metadata_status_and_image_failure(self):
+        self.CONF.set_override('instance_discovery_method',
+                               'libvirt_metadata', group='compute')
+        metadata = {'name': 'test',
+                    'flavor': {'name': 'm1.tiny'},
+                    'user_id': 'user-id',
+                    'project_id': 'project-id',
+                    'image_id': 'image-id'}
+        self.manager.inspector.inspect_instances_metadata.return_value = [
+            (virt_inspector.Instance(name='instance-1', UUID='a'), 'stopped',
+             metadata),
+            (virt_inspector.Instance(name='instance-2', UUID='b'), 'paused',
+             metadata),
+        ]
+        with_image = self.discovery.nova_cli.with_image
+        with_image.side_effect = Exception
+
+        instances = self.discovery.discover(self.manager)
+        self.assertEqual(['SHUTOFF', 'PAUSED'], [i.status for i in instances])
+        self.assertEqual('stopped',
+                         getattr(instances[0], 'OS-EXT-STS:vm_state'))
+        # Nova is not asked again for the images in the same cycle
+        self.assertEqual(1, with_image.call_count)
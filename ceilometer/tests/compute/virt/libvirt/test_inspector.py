@@ -20,6 +20,7 @@
 
 import contextlib
 
+from eventlet import tpool
 import fixtures
 import mock
 from oslotest import base
@@ -37,6 +38,12 @@ class TestLibvirtInspection(base.BaseTestCase):
         self.inspector.connection = mock.Mock()
         libvirt_inspector.libvirt = mock.Mock()
         libvirt_inspector.libvirt.VIR_DOMAIN_SHUTOFF = 5
+        libvirt_inspector.libvirt.VIR_DOMAIN_STATS_CPU_TOTAL = 2
+        libvirt_inspector.libvirt.VIR_DOMAIN_STATS_BALLOON = 4
+        libvirt_inspector.libvirt.VIR_DOMAIN_STATS_VCPU = 8
+        libvirt_inspector.libvirt.VIR_DOMAIN_STATS_INTERFACE = 16
+        libvirt_inspector.libvirt.VIR_DOMAIN_STATS_BLOCK = 32
+        libvirt_inspector.libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_ACTIVE = 1
         self.domain = mock.Mock()
         self.addCleanup(mock.patch.stopall)
 
@@ -245,6 +252,221 @@ class TestLibvirtInspection(base.BaseTestCase):
             disks = list(self.inspector.inspect_disks(self.instance_name))
             self.assertEqual(disks, [])
 
+    def test_inspect_disks_caches_parsed_xml(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <disk type='file' device='disk'>
+                         <target dev='vda' bus='virtio'/>
+                     </disk>
+                 </devices>
+             </domain>
+        """
+        self.inspector.connection.lookupByName.return_value = self.domain
+        self.domain.UUIDString.return_value = 'uuid'
+        self.domain.ID.return_value = 42
+        self.domain.XMLDesc.return_value = dom_xml
+        self.domain.info.return_value = (0L, 0L, 0L, 2L, 999999L)
+        self.domain.blockStats.return_value = (1L, 2L, 3L, 4L, -1)
+
+        list(self.inspector.inspect_disks(self.instance_name))
+        disks = list(self.inspector.inspect_disks(self.instance_name))
+        self.assertEqual(1, len(disks))
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+
+        # a restarted domain gets a new ID, so its XML is parsed again
+        self.domain.ID.return_value = 43
+        disks = list(self.inspector.inspect_disks(self.instance_name))
+        self.assertEqual(1, len(disks))
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_inspect_disks_hotplug(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <disk type='file' device='disk'>
+                         <target dev='vda' bus='virtio'/>
+                     </disk>
+                     %s
+                 </devices>
+             </domain>
+        """
+        connection = self.inspector.connection
+        connection.lookupByName.return_value = self.domain
+        self.domain.name.return_value = self.instance_name
+        self.domain.UUIDString.return_value = 'uuid'
+        self.domain.ID.return_value = 42
+        self.domain.XMLDesc.return_value = dom_xml % ''
+        self.domain.info.return_value = (0L, 0L, 0L, 2L, 999999L)
+        self.domain.blockStats.return_value = (1L, 2L, 3L, 4L, -1)
+        disks = list(self.inspector.inspect_disks(self.instance_name))
+        self.assertEqual(['vda'], [d.device for d, __ in disks])
+
+        # the bulk stats report the plugged disk
+        self.domain.XMLDesc.return_value = dom_xml % (
+            "<disk type='file' device='disk'>"
+            "<target dev='vdb' bus='virtio'/></disk>")
+        connection.getAllDomainStats.return_value = [(self.domain, {
+            'block.count': 2, 'block.0.name': 'vda',
+            'block.1.name': 'vdb'})]
+        self.inspector.inspect_domain_stats()
+        disks = list(self.inspector.inspect_disks(self.instance_name))
+        self.assertEqual(['vda', 'vdb'], [d.device for d, __ in disks])
+        self.assertEqual(2, self.domain.XMLDesc.call_count)
+
+    def test_inspect_instances_metadata(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <metadata>
+                     <nova:instance xmlns:nova="%s">
+                         <nova:name>test</nova:name>
+                         <nova:flavor name="m1.tiny">
+                             <nova:memory>512</nova:memory>
+                             <nova:disk>1</nova:disk>
+                             <nova:swap>0</nova:swap>
+                             <nova:ephemeral>0</nova:ephemeral>
+                             <nova:vcpus>1</nova:vcpus>
+                         </nova:flavor>
+                         <nova:owner>
+                             <nova:user uuid="user-id">demo</nova:user>
+                             <nova:project uuid="project-id">demo
+                             </nova:project>
+                         </nova:owner>
+                         <nova:root type="image" uuid="image-id"/>
+                     </nova:instance>
+                 </metadata>
+             </domain>
+        """ % libvirt_inspector.NOVA_NS
+        libvirt_inspector.libvirt.VIR_DOMAIN_PAUSED = 3
+        libvirt_inspector.libvirt.VIR_DOMAIN_SHUTDOWN = 4
+        libvirt_inspector.libvirt.VIR_DOMAIN_CRASHED = 6
+        other_domain = mock.Mock()
+        other_domain.XMLDesc.return_value = "<domain type='kvm'/>"
+        other_domain.info.return_value = (5L, 0L, 0L, 2L, 999999L)
+        self.inspector.connection.listAllDomains.return_value = [
+            self.domain, other_domain]
+        self.domain.name.return_value = self.instance_name
+        self.domain.UUIDString.return_value = 'uuid'
+        self.domain.ID.return_value = 42
+        self.domain.XMLDesc.return_value = dom_xml
+        self.domain.info.return_value = (3L, 0L, 0L, 2L, 999999L)
+
+        instances = list(self.inspector.inspect_instances_metadata())
+        self.assertEqual(2, len(instances))
+        instance, state, metadata = instances[0]
+        self.assertEqual('uuid', instance.UUID)
+        self.assertEqual('paused', state)
+        self.assertEqual({'name': 'test',
+                          'flavor': {'name': 'm1.tiny', 'vcpus': 1,
+                                     'ram': 512, 'disk': 1, 'ephemeral': 0},
+                          'user_id': 'user-id',
+                          'project_id': 'project-id',
+                          'image_id': 'image-id'}, metadata)
+        self.assertEqual(('stopped', None), instances[1][1:])
+
+        list(self.inspector.inspect_instances_metadata())
+        self.assertEqual(1, self.domain.XMLDesc.call_count)
+
+    def test_inspect_domain_stats(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <interface type='bridge'>
+                       <mac address='fa:16:3e:71:ec:6d'/>
+                       <source bridge='br100'/>
+                       <target dev='vnet0'/>
+                     </interface>
+                 </devices>
+             </domain>
+        """
+        record = {'cpu.time': 999999L, 'vcpu.current': 2L,
+                  'balloon.current': 2048L,
+                  'net.count': 1, 'net.0.name': 'vnet0',
+                  'net.0.rx.bytes': 1L, 'net.0.rx.pkts': 2L,
+                  'net.0.tx.bytes': 3L, 'net.0.tx.pkts': 4L,
+                  'block.count': 1, 'block.0.name': 'vda',
+                  'block.0.rd.reqs': 1L, 'block.0.rd.bytes': 2L,
+                  'block.0.wr.reqs': 3L, 'block.0.wr.bytes': 4L}
+        self.domain.name.return_value = self.instance_name
+        self.domain.XMLDesc.return_value = dom_xml
+        connection = self.inspector.connection
+        connection.getAllDomainStats.return_value = [(self.domain, record)]
+
+        domain_stats = self.inspector.inspect_domain_stats()
+
+        connection.getAllDomainStats.assert_called_once_with(62, 1)
+
+        self.assertEqual([self.instance_name], list(domain_stats))
+        stats = domain_stats[self.instance_name]
+        self.assertEqual(2L, stats.cpu.number)
+        self.assertEqual(999999L, stats.cpu.time)
+        self.assertEqual(2L, stats.allocated_memory.allocated)
+        self.assertEqual(1, len(stats.vnics))
+        vnic0, info0 = stats.vnics[0]
+        self.assertEqual('vnet0', vnic0.name)
+        self.assertEqual('fa:16:3e:71:ec:6d', vnic0.mac)
+        self.assertEqual(virt_inspector.InterfaceStats(1L, 2L, 3L, 4L),
+                         info0)
+        self.assertEqual(1, len(stats.disks))
+        disk0, info0 = stats.disks[0]
+        self.assertEqual('vda', disk0.device)
+        self.assertEqual(1L, info0.read_requests)
+        self.assertEqual(2L, info0.read_bytes)
+        self.assertEqual(3L, info0.write_requests)
+        self.assertEqual(4L, info0.write_bytes)
+        self.assertFalse(connection.lookupByName.called)
+        self.assertFalse(self.domain.interfaceStats.called)
+        self.assertFalse(self.domain.blockStats.called)
+
+    def test_inspect_domain_stats_proxied_domains(self):
+        self.domain.name.return_value = self.instance_name
+        connection = self.inspector.connection
+        connection.getAllDomainStats.return_value = [(self.domain, {})]
+
+        with mock.patch.object(self.inspector,
+                               '_domain_stats_from_record') as from_record:
+            self.inspector.inspect_domain_stats()
+
+        domain, record = from_record.call_args[0]
+        self.assertIsInstance(domain, tpool.Proxy)
+        self.assertEqual(self.instance_name, domain.name())
+        self.assertEqual({}, record)
+
+    def test_inspect_domain_stats_per_domain_fallback(self):
+        dom_xml = """
+             <domain type='kvm'>
+                 <devices>
+                     <disk type='file' device='disk'>
+                         <target dev='vda' bus='virtio'/>
+                     </disk>
+                 </devices>
+             </domain>
+        """
+        self.domain.name.return_value = self.instance_name
+        self.domain.XMLDesc.return_value = dom_xml
+        self.domain.info.return_value = (0L, 0L, 0L, 2L, 999999L)
+        self.domain.memoryStats.return_value = {'actual': 4096L}
+        self.domain.blockStats.return_value = (1L, 2L, 3L, 4L, -1)
+        connection = self.inspector.connection
+        del connection.getAllDomainStats
+        connection.listDomainsID.return_value = [0, 42]
+        connection.lookupByID.return_value = self.domain
+
+        domain_stats = self.inspector.inspect_domain_stats()
+
+        connection.lookupByID.assert_called_once_with(42)
+        stats = domain_stats[self.instance_name]
+        self.assertEqual(virt_inspector.CPUStats(2L, 999999L), stats.cpu)
+        self.assertEqual(4L, stats.allocated_memory.allocated)
+        self.assertEqual([], stats.vnics)
+        self.assertEqual([(virt_inspector.Disk('vda'),
+                           virt_inspector.DiskStats(read_requests=1L,
+                                                    read_bytes=2L,
+                                                    write_requests=3L,
+                                                    write_bytes=4L,
+                                                    errors=-1))],
+                         stats.disks)
+
 
 class TestLibvirtInspectionWithError(base.BaseTestCase):
 
@@ -15,13 +15,17 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 import datetime
+import os
+import tempfile
 
 import mock
 from oslo.config import fixture as fixture_config
 from oslotest import base
 
 from ceilometer.dispatcher import database
+from ceilometer.dispatcher import file
 from ceilometer.publisher import utils
+from ceilometer import record_file
 
 
 class TestDispatcherDB(base.BaseTestCase):
@@ -109,3 +113,87 @@ class TestDispatcherDB(base.BaseTestCase):
             self.dispatcher.record_metering_data(msg)
 
         record_metering_data.assert_called_once_with(expected)
+
+    def test_timestamp_shared_with_file_dispatcher(self):
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               'timestamp': '2012-09-30T15:31:50.262-08:00',
+               }
+        msg['message_signature'] = utils.compute_signature(
+            msg,
+            self.CONF.publisher.metering_secret,
+        )
+        original = msg.copy()
+
+        filename = os.path.join(tempfile.mkdtemp(), 'meters')
+        self.CONF.set_override('file_path', filename, group='dispatcher_file')
+        self.CONF.set_override('format', 'binary', group='dispatcher_file')
+        file_dispatcher = file.FileDispatcher(self.CONF)
+
+        # dispatchers = database,file
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data'):
+            self.dispatcher.record_metering_data(msg)
+        file_dispatcher.record_metering_data(msg)
+        self.assertEqual(original, msg)
+
+        # the replayed meters still carry a valid signature
+        replayed = list(record_file.read_records(filename))
+        self.assertEqual([original], replayed)
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data') as record_metering_data:
+            self.dispatcher.record_metering_data(replayed)
+        self.assertEqual(1, record_metering_data.call_count)
+
+    def _signed(self, name):
+        msg = {'counter_name': name,
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               }
+        msg['message_signature'] = utils.compute_signature(
+            msg,
+            self.CONF.publisher.metering_secret,
+        )
+        return msg
+
+    def test_batch(self):
+        valid = [self._signed('test1'), self._signed('test2')]
+        invalid = {'counter_name': 'test',
+                   'resource_id': self.id(),
+                   'counter_volume': 1,
+                   'message_signature': 'invalid-signature'}
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data_batch(
+                [valid[0], invalid, valid[1]])
+
+        record_batch.assert_called_once_with(valid)
+
+    def test_batch_timestamp_conversion(self):
+        msg = self._signed('test')
+        msg['timestamp'] = '2012-07-02T13:53:40Z'
+        msg['message_signature'] = utils.compute_signature(
+            msg,
+            self.CONF.publisher.metering_secret,
+        )
+        original = msg.copy()
+
+        expected = msg.copy()
+        expected['timestamp'] = datetime.datetime(2012, 7, 2, 13, 53, 40)
+
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch') as record_batch:
+            self.dispatcher.record_metering_data_batch([msg])
+
+        record_batch.assert_called_once_with([expected])
+        self.assertEqual(original, msg)
+
+    def test_batch_storage_error(self):
+        with mock.patch.object(self.dispatcher.storage_conn,
+                               'record_metering_data_batch',
+                               side_effect=Exception('boom')):
+            self.assertRaises(Exception,
+                              self.dispatcher.record_metering_data_batch,
+                              [self._signed('test')])
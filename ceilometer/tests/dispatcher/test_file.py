@@ -23,6 +23,7 @@ from oslotest import base
 
 from ceilometer.dispatcher import file
 from ceilometer.publisher import utils
+from ceilometer import record_file
 
 
 class TestDispatcherFile(base.BaseTestCase):
@@ -101,3 +102,19 @@ class TestDispatcherFile(base.BaseTestCase):
 
         # The log should be None
         self.assertIsNone(dispatcher.log)
+
+    def test_file_dispatcher_binary(self):
+        filename = os.path.join(tempfile.mkdtemp(), 'meters')
+        self.CONF.dispatcher_file.file_path = filename
+        self.CONF.dispatcher_file.format = 'binary'
+        dispatcher = file.FileDispatcher(self.CONF)
+        self.assertIsNone(dispatcher.log)
+
+        msg = {'counter_name': 'test',
+               'resource_id': self.id(),
+               'counter_volume': 1,
+               }
+        dispatcher.record_metering_data(msg)
+        dispatcher.record_metering_data([msg, msg])
+        self.assertEqual([msg] * 3,
+                         list(record_file.read_records(filename)))
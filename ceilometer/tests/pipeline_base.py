@@ -18,10 +18,13 @@
 # under the License.
 
 import abc
+import copy
 import datetime
 import traceback
 
+import eventlet
 import mock
+from oslo.config import fixture as fixture_config
 from oslo.utils import timeutils
 from oslotest import base
 from oslotest import mockpatch
@@ -73,13 +76,20 @@ class BasePipelineTestCase(base.BaseTestCase):
     def get_publisher(self, url, namespace=''):
         fake_drivers = {'test://': test_publisher.TestPublisher,
                         'new://': test_publisher.TestPublisher,
-                        'except://': self.PublisherClassException}
+                        'except://': self.PublisherClassException,
+                        'slow://': self.PublisherClassSlow}
         return fake_drivers[url](url)
 
     class PublisherClassException(publisher.PublisherBase):
         def publish_samples(self, ctxt, counters):
             raise Exception()
 
+    class PublisherClassSlow(test_publisher.TestPublisher):
+        def publish_samples(self, ctxt, counters):
+            eventlet.sleep(10)
+            super(BasePipelineTestCase.PublisherClassSlow,
+                  self).publish_samples(ctxt, counters)
+
     class TransformerClass(transformer.TransformerBase):
         samples = []
 
@@ -395,6 +405,54 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertTrue(pipeline_manager.pipelines[0].
                         support_meter('instance'))
 
+    def test_variable_counter_compiled_match(self):
+        counter_cfg = ['instance:*', '!disk.*']
+        self._set_pipeline_cfg('counters', counter_cfg)
+        self.assertRaises(pipeline.PipelineException,
+                          pipeline.PipelineManager,
+                          self.pipeline_cfg,
+                          self.transformer_manager)
+        counter_cfg = ['instance:*']
+        self._set_pipeline_cfg('counters', counter_cfg)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        self.assertTrue(pipeline_manager.pipelines[0].
+                        support_meter('instance:m1.tiny'))
+        self.assertFalse(pipeline_manager.pipelines[0].
+                         support_meter('instance'))
+
+    def test_pipelines_for_meter(self):
+        self._augment_pipeline_cfg()
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipelines = pipeline_manager.pipelines
+        self.assertEqual([pipelines[0]],
+                         pipeline_manager.pipelines_for_meter('a'))
+        self.assertEqual([pipelines[1]],
+                         pipeline_manager.pipelines_for_meter('b'))
+        self.assertEqual([], pipeline_manager.pipelines_for_meter('c'))
+
+        # routes are memoized per meter name
+        with mock.patch.object(pipelines[0], 'support_meter') as support:
+            self.assertEqual([pipelines[0]],
+                             pipeline_manager.pipelines_for_meter('a'))
+            self.assertFalse(support.called)
+
+    def test_stop_replaced_sinks(self):
+        self._augment_pipeline_cfg()
+        previous = pipeline.PipelineManager(self.pipeline_cfg,
+                                            self.transformer_manager)
+        replaced, kept = [p.sink for p in previous.pipelines]
+        self.pipeline_cfg = copy.deepcopy(self.pipeline_cfg)
+        self._set_pipeline_cfg('publishers', ['new://'])
+        pipeline_manager = pipeline.PipelineManager(
+            self.pipeline_cfg, self.transformer_manager, previous=previous)
+        with mock.patch.object(kept, 'stop') as stop_kept:
+            with mock.patch.object(replaced, 'stop') as stop_replaced:
+                previous.stop(replacement=pipeline_manager)
+        self.assertFalse(stop_kept.called)
+        stop_replaced.assert_called_once_with()
+
     def test_multiple_pipeline(self):
         self._augment_pipeline_cfg()
 
@@ -618,6 +676,99 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual('a_update',
                          getattr(new_publisher.samples[0], 'name'))
 
+    def test_parallel_publishing_timeout_isolation(self):
+        conf = self.useFixture(fixture_config.Config()).conf
+        conf.set_override('parallel_publishing', True)
+        conf.set_override('publisher_timeout', 0.1)
+        self._set_pipeline_cfg('publishers', ['slow://', 'new://'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        for publish_context in pipeline_manager.publishers(None):
+            with publish_context as p:
+                p([self.test_counter])
+
+        publishers = pipeline_manager.pipelines[0].publishers
+        slow_publisher, new_publisher = publishers
+        self.assertEqual(0, len(slow_publisher.samples))
+        self.assertEqual(1, len(new_publisher.samples))
+        latency = pipeline_manager.pipelines[0].sink.publisher_latency
+        self.assertEqual(2, len(latency))
+        self.assertTrue(all(t < 10 for t in latency.values()))
+
+    def test_grouped_publishing(self):
+        conf = self.useFixture(fixture_config.Config()).conf
+        conf.set_override('grouped_publishing', True)
+        conf.set_override('max_publish_batch_size', 2)
+        self._set_pipeline_cfg('counters', ['a', 'b'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        counters = [
+            sample.Sample(
+                name=name,
+                type=self.test_counter.type,
+                volume=self.test_counter.volume,
+                unit=self.test_counter.unit,
+                user_id=self.test_counter.user_id,
+                project_id=self.test_counter.project_id,
+                resource_id=self.test_counter.resource_id,
+                timestamp=self.test_counter.timestamp,
+                resource_metadata=self.test_counter.resource_metadata,
+            ) for name in ['b', 'a', 'b']
+        ]
+        for publish_context in pipeline_manager.publishers(None):
+            with publish_context as p:
+                p(counters)
+
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(['b_update', 'b_update', 'a_update'],
+                         [s.name for s in publisher.samples])
+        self.assertEqual(2, publisher.calls)
+
+    def test_grouped_publishing_batch(self):
+        conf = self.useFixture(fixture_config.Config()).conf
+        conf.set_override('grouped_publishing', True)
+        self._set_pipeline_cfg('counters', ['a', 'b'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        batch = sample.SampleBatch.from_samples(
+            sample.Sample(
+                name=name,
+                type=self.test_counter.type,
+                volume=self.test_counter.volume,
+                unit=self.test_counter.unit,
+                user_id=self.test_counter.user_id,
+                project_id=self.test_counter.project_id,
+                resource_id=self.test_counter.resource_id,
+                timestamp=self.test_counter.timestamp,
+                resource_metadata=self.test_counter.resource_metadata,
+            ) for name in ['b', 'a', 'b'])
+        for publish_context in pipeline_manager.publishers(None):
+            with publish_context as p:
+                p(batch)
+
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(['a_update', 'b_update', 'b_update'],
+                         sorted(s.name for s in publisher.samples))
+        self.assertEqual(1, publisher.calls)
+
+    def test_reload_keeps_unchanged_sinks(self):
+        previous = pipeline.PipelineManager(copy.deepcopy(self.pipeline_cfg),
+                                            self.transformer_manager)
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    previous=previous)
+        self.assertIs(previous.pipelines[0].sink,
+                      pipeline_manager.pipelines[0].sink)
+        self.assertIs(previous.pipelines[0].sources[0],
+                      pipeline_manager.pipelines[0].sources[0])
+
+        self._set_pipeline_cfg('publishers', ['new://'])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager,
+                                                    previous=previous)
+        self.assertIsNot(previous.pipelines[0].sink,
+                         pipeline_manager.pipelines[0].sink)
+
     def test_multiple_counter_pipeline(self):
         self._set_pipeline_cfg('counters', ['a', 'b'])
         pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
@@ -823,6 +974,67 @@ class BasePipelineTestCase(base.BaseTestCase):
         self.assertEqual(sample.TYPE_CUMULATIVE, getattr(cpu_mins, 'type'))
         self.assertEqual(20, getattr(cpu_mins, 'volume'))
 
+    def _do_test_batch_conversion(self, transformer_cfg):
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        counters = [
+            sample.Sample(
+                name=name,
+                type=sample.TYPE_CUMULATIVE,
+                volume=1200000000,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id='test_resource',
+                timestamp=timeutils.utcnow().isoformat(),
+                resource_metadata={}
+            ) for name in ['cpu', 'cpu', 'disk']
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+
+        pipe.publish_samples(None, sample.SampleBatch.from_samples(counters))
+        pipe.flush(None)
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(2, len(publisher.samples))
+        for cpu_mins in publisher.samples:
+            self.assertEqual('cpu_mins', getattr(cpu_mins, 'name'))
+            self.assertEqual('min', getattr(cpu_mins, 'unit'))
+            self.assertEqual(20, getattr(cpu_mins, 'volume'))
+
+    def test_batch_unit_conversion(self):
+        transformer_cfg = [
+            {
+                'name': 'unit_conversion',
+                'parameters': {
+                    'source': {'unit': 'ns'},
+                    'target': {'name': 'cpu_mins',
+                               'unit': 'min',
+                               'scale': 1.0 / ((10 ** 6) * 60)},
+                }
+            },
+        ]
+        self._do_test_batch_conversion(transformer_cfg)
+        transformer = self.transformer_manager.get_ext(
+            'unit_conversion').plugin(**transformer_cfg[0]['parameters'])
+        self.assertTrue(transformer.batch_capable)
+
+    def test_batch_expression_conversion(self):
+        transformer_cfg = [
+            {
+                'name': 'unit_conversion',
+                'parameters': {
+                    'source': {},
+                    'target': {'name': 'cpu_mins',
+                               'unit': 'min',
+                               'scale': 'volume / ((10**6) * 60)'},
+                }
+            },
+        ]
+        self._do_test_batch_conversion(transformer_cfg)
+
     def test_unit_identified_source_unit_conversion(self):
         transformer_cfg = [
             {
@@ -1047,6 +1259,72 @@ class BasePipelineTestCase(base.BaseTestCase):
         pipe.flush(None)
         self.assertEqual(0, len(publisher.samples))
 
+    def test_rate_of_change_bounded_cache(self):
+        transformer_cfg = [
+            {
+                'name': 'rate_of_change',
+                'parameters': {
+                    'target': {'name': 'cpu_util',
+                               'unit': '%',
+                               'type': sample.TYPE_GAUGE},
+                    'cache_size': 2,
+                }
+            },
+        ]
+        self._set_pipeline_cfg('transformers', transformer_cfg)
+        self._set_pipeline_cfg('counters', ['cpu'])
+        now = timeutils.utcnow()
+        counters = [
+            sample.Sample(
+                name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                volume=1,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id='test_resource_%d' % i,
+                timestamp=now.isoformat(),
+                resource_metadata={}
+            ) for i in range(3)
+        ]
+
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        pipe = pipeline_manager.pipelines[0]
+        pipe.publish_samples(None, counters)
+        rate_of_change = pipe.sink.transformers[0]
+        self.assertEqual(2, rate_of_change.state_usage()['entries'])
+        self.assertTrue(rate_of_change.state_usage()['bytes'] > 0)
+        self.assertNotIn(('cpu', 'test_resource_0'), rate_of_change.cache)
+        self.assertEqual((1, rate_of_change._epoch(now.isoformat())),
+                         rate_of_change.cache.get(('cpu', 'test_resource_2')))
+
+    def test_rate_of_change_shared_keys(self):
+        transformer = conversions.RateOfChangeTransformer(
+            target={'name': 'cpu_util', 'unit': '%'})
+        timestamp = timeutils.utcnow().isoformat()
+        counters = [
+            sample.Sample(
+                name=''.join(['c', 'pu']),
+                type=sample.TYPE_CUMULATIVE,
+                volume=1,
+                unit='ns',
+                user_id='test_user',
+                project_id='test_proj',
+                resource_id='test_resource_%d' % i,
+                timestamp=timestamp,
+                resource_metadata={}
+            ) for i in range(3)
+        ]
+
+        with mock.patch.object(timeutils, 'parse_isotime',
+                               wraps=timeutils.parse_isotime) as parse:
+            for s in counters:
+                transformer.handle_sample(None, s)
+        self.assertEqual(1, parse.call_count)
+        names = set(id(name) for (name, __), __ in transformer.cache.items())
+        self.assertEqual(1, len(names))
+
     def test_resources(self):
         resources = ['test1://', 'test2://']
         self._set_pipeline_cfg('resources', resources)
@@ -1722,6 +2000,45 @@ class BasePipelineTestCase(base.BaseTestCase):
         expected = [50.0]
         self._do_test_arithmetic(expression, scenario, expected)
 
+    def test_arithmetic_transformer_metadata(self):
+        expression = ('100.0 * $(memory.usage) / '
+                      '$(memory).resource_metadata.max')
+        scenario = [
+            dict(name='memory', volume=1024.0, metadata={'max': 2048.0}),
+            dict(name='memory.usage', volume=512.0),
+        ]
+        expected = [25.0]
+        self._do_test_arithmetic(expression, scenario, expected)
+
+    def test_arithmetic_transformer_builtins(self):
+        expression = 'pow($(memory.usage), 2) / sum([$(memory), 1024.0])'
+        scenario = [
+            dict(name='memory', volume=1024.0),
+            dict(name='memory.usage', volume=512.0),
+        ]
+        expected = [128.0]
+        self._do_test_arithmetic(expression, scenario, expected)
+
+    def test_arithmetic_transformer_private_attribute(self):
+        expression = '$(memory).__class__'
+        scenario = [dict(name='memory', volume=1024.0)]
+        expected = []
+        self._do_test_arithmetic(expression, scenario, expected)
+
+    def test_arithmetic_transformer_compiled_forms(self):
+        xformer = arithmetic.ArithmeticTransformer(
+            target={'expr': '100.0 * $(memory.usage) / $(memory)'})
+        self.assertTrue(xformer.volume_only)
+        self.assertTrue(xformer.vectorizable)
+        xformer = arithmetic.ArithmeticTransformer(
+            target={'expr': 'max($(memory.usage), $(memory))'})
+        self.assertTrue(xformer.volume_only)
+        self.assertFalse(xformer.vectorizable)
+        xformer = arithmetic.ArithmeticTransformer(
+            target={'expr': '$(memory).resource_metadata.max'})
+        self.assertFalse(xformer.volume_only)
+        self.assertFalse(xformer.vectorizable)
+
     def test_arithmetic_transformer_cache_cleared(self):
         transformer_cfg = [
             {
@@ -22,10 +22,13 @@ import logging.handlers
 import os
 import tempfile
 
+from oslo.config import cfg
 from oslo.utils import netutils
 from oslotest import base
 
 from ceilometer.publisher import file
+from ceilometer.publisher import utils
+from ceilometer import record_file
 from ceilometer import sample
 
 
@@ -120,3 +123,23 @@ class TestFilePublisher(base.BaseTestCase):
                                   self.test_data)
 
         self.assertIsNone(publisher.publisher_logger)
+
+    def test_file_publisher_binary(self):
+        name = os.path.join(tempfile.mkdtemp(), 'log_file')
+        parsed_url = netutils.urlsplit(
+            'file://%s?format=binary&max_bytes=1&compress=1' % name)
+        publisher = file.FilePublisher(parsed_url)
+        self.assertIsNone(publisher.publisher_logger)
+        publisher.publish_samples(None, self.test_data[:1])
+        publisher.publish_samples(None, self.test_data[1:])
+
+        segments = record_file.segments(name)
+        self.assertEqual(3, len(segments))
+        self.assertTrue(all(s.endswith(record_file.COMPRESSED_SUFFIX)
+                            for s in segments[:2]))
+        records = [r for s in segments for r in record_file.read_records(s)]
+        self.assertEqual([s.name for s in self.test_data],
+                         [r['counter_name'] for r in records])
+        for r in records:
+            self.assertTrue(utils.verify_signature(
+                r, cfg.CONF.publisher.metering_secret))
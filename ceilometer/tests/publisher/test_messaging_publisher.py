@@ -18,6 +18,7 @@
 """Tests for ceilometer/publisher/messaging.py
 """
 import datetime
+import tempfile
 
 import eventlet
 import mock
@@ -30,6 +31,7 @@ import testscenarios.testcase
 from ceilometer import messaging
 from ceilometer.openstack.common import context
 from ceilometer.publisher import messaging as msg_publisher
+from ceilometer.publisher import utils
 from ceilometer import sample
 from ceilometer.tests import base as tests_base
 
@@ -142,6 +144,28 @@ class RpcOnlyPublisherTest(BasePublisherTestCase):
         cast_context.cast.assert_called_once_with(
             mock.ANY, 'custom_procedure_call', data=mock.ANY)
 
+    def test_published_batch_wire_format(self):
+        publisher = msg_publisher.RPCPublisher(
+            netutils.urlsplit('rpc://?wire_format=batch'))
+        with mock.patch.object(publisher.rpc_client, 'prepare') as prepare:
+            publisher.publish_samples(mock.MagicMock(), self.test_data)
+        data = prepare.return_value.cast.call_args[1]['data']
+        self.assertTrue(utils.is_batch(data))
+        self.assertEqual([s.name for s in self.test_data],
+                         [m['counter_name']
+                          for m in utils.unpack_batch(data)])
+
+    def test_published_unknown_wire_format(self):
+        publisher = msg_publisher.RPCPublisher(
+            netutils.urlsplit('rpc://?wire_format=auto'))
+        self.assertEqual('legacy', publisher.wire_format)
+        with mock.patch.object(publisher.rpc_client, 'prepare') as prepare:
+            publisher.publish_samples(mock.MagicMock(), self.test_data)
+        self.assertFalse(prepare.return_value.call.called)
+        data = prepare.return_value.cast.call_args[1]['data']
+        self.assertEqual(len(self.test_data), len(data))
+        self.assertFalse(utils.is_batch(data))
+
     def test_published_with_per_meter_topic(self):
         publisher = msg_publisher.RPCPublisher(
             netutils.urlsplit('rpc://?per_meter_topic=1'))
@@ -338,6 +362,95 @@ class TestPublisher(testscenarios.testcase.WithScenarios,
             publisher.local_queue[2][2][0]['source']
         )
 
+    def test_published_with_policy_spool_and_rpc_down_up(self):
+        self.CONF.set_override('spool_dir', tempfile.mkdtemp(),
+                               group='publisher_spool')
+        self.CONF.set_override('retry_interval', 0, group='publisher_spool')
+        url = netutils.urlsplit('%s://?policy=spool' % self.protocol)
+        publisher = self.publisher_cls(url)
+        ctxt = context.RequestContext()
+        side_effect = oslo.messaging._drivers.common.RPCException()
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = side_effect
+            publisher.publish_samples(ctxt, self.test_data)
+            publisher.publish_samples(ctxt, self.test_data)
+            self.assertEqual(0, len(publisher.local_queue))
+            self.assertEqual(2, publisher.spool.depth)
+            self.assertEqual(2, fake_send.call_count)
+
+        # the spool survives restarts
+        publisher = self.publisher_cls(url)
+        self.assertEqual(2, publisher.spool.depth)
+        with mock.patch.object(publisher, '_send') as fake_send:
+            publisher.publish_samples(ctxt, self.test_data)
+            self.assertEqual(0, publisher.spool.depth)
+            fake_send.assert_called_once_with(
+                mock.ANY, self.CONF.publisher_rpc.metering_topic, mock.ANY)
+            meters = fake_send.call_args[0][2]
+            self.assertEqual(3 * len(self.test_data), len(meters))
+            self.assertEqual(ctxt.request_id,
+                             fake_send.call_args[0][0].request_id)
+
+    def test_published_with_policy_spool_replay_batch_size(self):
+        self.CONF.set_override('spool_dir', tempfile.mkdtemp(),
+                               group='publisher_spool')
+        self.CONF.set_override('retry_interval', 0, group='publisher_spool')
+        self.CONF.set_override('replay_batch_size', 2 * len(self.test_data),
+                               group='publisher_spool')
+        publisher = self.publisher_cls(
+            netutils.urlsplit('%s://?policy=spool' % self.protocol))
+        ctxt = context.RequestContext()
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = (
+                oslo.messaging._drivers.common.RPCException())
+            for i in range(4):
+                publisher.publish_samples(ctxt, self.test_data)
+        self.assertEqual(4, publisher.spool.depth)
+
+        with mock.patch.object(publisher, '_send') as fake_send:
+            publisher.publish_samples(ctxt, self.test_data)
+            # a single batch is replayed per publish, the batch size
+            # counting samples, not spooled records
+            fake_send.assert_called_once_with(
+                mock.ANY, self.CONF.publisher_rpc.metering_topic, mock.ANY)
+            self.assertEqual(2 * len(self.test_data),
+                             len(fake_send.call_args[0][2]))
+            self.assertEqual(3, publisher.spool.depth)
+
+            for i in range(3):
+                publisher.publish_samples(ctxt, self.test_data)
+            self.assertEqual(0, publisher.spool.depth)
+
+    def test_stats(self):
+        publisher = self.publisher_cls(
+            netutils.urlsplit('%s://?policy=queue' % self.protocol))
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = (
+                oslo.messaging._drivers.common.RPCException())
+            publisher.publish_samples(mock.MagicMock(), self.test_data)
+        self.assertEqual({'queued': len(self.test_data)}, publisher.stats())
+
+    def test_stats_spool(self):
+        self.CONF.set_override('spool_dir', tempfile.mkdtemp(),
+                               group='publisher_spool')
+        publisher = self.publisher_cls(
+            netutils.urlsplit('%s://?policy=spool' % self.protocol))
+        with mock.patch.object(publisher, '_send') as fake_send:
+            fake_send.side_effect = (
+                oslo.messaging._drivers.common.RPCException())
+            with mock.patch('time.time', return_value=1000):
+                publisher.publish_samples(context.RequestContext(),
+                                          self.test_data)
+            with mock.patch('time.time', return_value=1042):
+                self.assertEqual({'queued': 0, 'spooled': 1,
+                                  'spool_age': 42}, publisher.stats())
+
+    def test_published_with_policy_spool_without_dir(self):
+        publisher = self.publisher_cls(
+            netutils.urlsplit('%s://?policy=spool' % self.protocol))
+        self.assertEqual('queue', publisher.policy)
+        self.assertIsNone(publisher.spool)
+
     def test_published_with_policy_default_sized_queue_and_rpc_down(self):
         publisher = self.publisher_cls(
             netutils.urlsplit('%s://?policy=queue' % self.protocol))
@@ -0,0 +1,153 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/publisher/queued.py
+"""
+
+import datetime
+
+import mock
+from oslo.config import fixture as fixture_config
+from oslotest import base
+
+from ceilometer.publisher import queued
+from ceilometer.publisher import test as test_publisher
+from ceilometer import sample
+
+
+class TestQueuedPublisher(base.BaseTestCase):
+
+    def _sample(self, i):
+        return sample.Sample(
+            name='test',
+            type=sample.TYPE_CUMULATIVE,
+            unit='',
+            volume=i,
+            user_id='test',
+            project_id='test',
+            resource_id='test_run_tasks',
+            timestamp=datetime.datetime.utcnow().isoformat(),
+            resource_metadata={'name': 'TestPublish'},
+        )
+
+    def setUp(self):
+        super(TestQueuedPublisher, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.CONF.set_override('queue_size', 2, group='publisher_queue')
+        self.CONF.set_override('max_batch_age', 0.01,
+                               group='publisher_queue')
+        self.publisher = test_publisher.TestPublisher('test://')
+
+    def test_wrap_disabled(self):
+        self.CONF.set_override('queue_size', 0, group='publisher_queue')
+        self.assertIs(self.publisher, queued.wrap(self.publisher))
+
+    def test_wrap_enabled(self):
+        wrapped = queued.wrap(self.publisher)
+        self.assertIsInstance(wrapped, queued.QueuedPublisher)
+        self.assertIs(self.publisher.samples, wrapped.samples)
+
+    def test_publish_batched(self):
+        self.CONF.set_override('queue_size', 10, group='publisher_queue')
+        self.CONF.set_override('batch_size', 3, group='publisher_queue')
+        self.CONF.set_override('max_batch_age', 1,
+                               group='publisher_queue')
+        wrapped = queued.QueuedPublisher(self.publisher)
+        for i in range(3):
+            wrapped.publish_samples(None, [self._sample(i)])
+        self.assertTrue(wrapped.drain(timeout=5))
+        self.assertEqual([0, 1, 2],
+                         [s.volume for s in self.publisher.samples])
+        self.assertEqual(1, self.publisher.calls)
+        self.assertEqual(3, wrapped.published)
+        self.assertEqual(0, wrapped.depth)
+        self.assertEqual({'depth': 0, 'published': 3, 'dropped': 0},
+                         wrapped.stats())
+
+    def test_policy_drop(self):
+        self.CONF.set_override('policy', 'drop', group='publisher_queue')
+        wrapped = queued.QueuedPublisher(self.publisher)
+        # Do not start the workers, so that the queue fills up
+        wrapped._threads = [mock.Mock()]
+        for i in range(3):
+            wrapped.publish_samples(None, [self._sample(i)])
+        self.assertEqual({'depth': 2, 'published': 0, 'dropped': 1},
+                         wrapped.stats())
+        self.assertEqual([1, 2],
+                         [s[0].volume for __, s in
+                          [wrapped.queue.get(), wrapped.queue.get()]])
+
+    def test_stats_wrapped_publisher(self):
+        wrapped = queued.QueuedPublisher(self.publisher)
+        with mock.patch.object(self.publisher, 'stats', create=True,
+                               return_value={'queued': 4}):
+            self.assertEqual({'queued': 4, 'depth': 0, 'published': 0,
+                              'dropped': 0},
+                             wrapped.stats())
+
+    def test_policy_unknown(self):
+        self.CONF.set_override('policy', 'foo', group='publisher_queue')
+        wrapped = queued.QueuedPublisher(self.publisher)
+        self.assertEqual('block', wrapped.policy)
+
+    def test_publisher_error(self):
+        wrapped = queued.QueuedPublisher(self.publisher)
+        with mock.patch.object(self.publisher, 'publish_samples',
+                               side_effect=Exception('boom')):
+            wrapped.publish_samples(None, [self._sample(0)])
+            self.assertTrue(wrapped.drain(timeout=5))
+        self.assertEqual(0, wrapped.published)
+        wrapped.publish_samples(None, [self._sample(1)])
+        self.assertTrue(wrapped.drain(timeout=5))
+        self.assertEqual([1], [s.volume for s in self.publisher.samples])
+
+    def test_depth_counted_before_put(self):
+        wrapped = queued.QueuedPublisher(self.publisher)
+        wrapped._threads = [mock.Mock()]
+        depths = []
+        with mock.patch.object(wrapped.queue, 'put',
+                               side_effect=lambda item: depths.append(
+                                   wrapped.depth)):
+            wrapped.publish_samples(None, [self._sample(0)])
+        self.assertEqual([1], depths)
+
+    def test_stop(self):
+        self.CONF.set_override('queue_size', 10, group='publisher_queue')
+        wrapped = queued.QueuedPublisher(self.publisher)
+        for i in range(3):
+            wrapped.publish_samples(None, [self._sample(i)])
+        threads = list(wrapped._threads)
+        wrapped.stop()
+        self.assertEqual([0, 1, 2],
+                         [s.volume for s in self.publisher.samples])
+        self.assertEqual([], wrapped._threads)
+        self.assertTrue(all(t.dead for t in threads))
+
+        # publishing again starts new workers
+        wrapped.publish_samples(None, [self._sample(3)])
+        self.assertTrue(wrapped.drain(timeout=5))
+        self.assertEqual(4, len(self.publisher.samples))
+
+    def test_stop_timeout(self):
+        self.CONF.set_override('stop_timeout', 0.01,
+                               group='publisher_queue')
+        wrapped = queued.QueuedPublisher(self.publisher)
+        # Do not start the workers, so that nothing is published
+        worker = mock.Mock()
+        wrapped._threads = [worker]
+        wrapped.publish_samples(None, [self._sample(0), self._sample(1)])
+        wrapped.stop()
+        worker.kill.assert_called_once_with()
+        self.assertEqual({'depth': 0, 'published': 0, 'dropped': 2},
+                         wrapped.stats())
+        self.assertEqual(0, wrapped.depth)
+        self.assertEqual(0, wrapped.queue.qsize())
@@ -0,0 +1,119 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/publisher/spool.py
+"""
+
+import os
+import tempfile
+
+import mock
+from oslotest import base
+
+from ceilometer.publisher import spool
+
+
+class TestSpool(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSpool, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'spool')
+
+    def _spool(self, segment_size=1024, max_size=10240, use_mmap=False):
+        return spool.Spool(self.path, segment_size, max_size, use_mmap)
+
+    @staticmethod
+    def _record(i):
+        return ({'request_id': 'req-%d' % i}, 'metering',
+                [{'counter_name': 'cpu', 'counter_volume': i}])
+
+    @staticmethod
+    def _volumes(records):
+        return [r[3][0]['counter_volume'] for r, __ in records]
+
+    def _test_append_peek_commit(self, use_mmap):
+        s = self._spool(use_mmap=use_mmap)
+        for i in range(50):
+            s.append(self._record(i))
+        self.assertEqual(50, s.depth)
+        self.assertTrue(len(s.segments) > 1)
+
+        records = s.peek(30)
+        self.assertEqual(list(range(30)), self._volumes(records))
+        s.commit(records[-1][1], 30)
+        self.assertEqual(20, s.depth)
+        self.assertEqual(list(range(30, 50)), self._volumes(s.peek(100)))
+
+        records = s.peek(100)
+        s.commit(records[-1][1], 20)
+        self.assertEqual(0, s.depth)
+        self.assertEqual([], s.peek(100))
+        self.assertEqual(1, len(s.segments))
+
+    def test_append_peek_commit(self):
+        self._test_append_peek_commit(False)
+
+    def test_append_peek_commit_mmap(self):
+        self._test_append_peek_commit(True)
+
+    def test_peek_weight(self):
+        s = self._spool()
+        for i in range(10):
+            s.append(self._record(i))
+        self.assertEqual([0, 1, 2],
+                         self._volumes(s.peek(6, weight=lambda r: 2)))
+        self.assertEqual([0], self._volumes(s.peek(1, weight=lambda r: 5)))
+
+    def test_restart(self):
+        s = self._spool()
+        for i in range(50):
+            s.append(self._record(i))
+        records = s.peek(10)
+        s.commit(records[-1][1], 10)
+
+        s = self._spool()
+        self.assertEqual(40, s.depth)
+        self.assertEqual(list(range(10, 50)), self._volumes(s.peek(100)))
+        s.append(self._record(50))
+        self.assertEqual(list(range(10, 51)), self._volumes(s.peek(100)))
+
+    def test_truncated_record(self):
+        s = self._spool()
+        for i in range(3):
+            s.append(self._record(i))
+        path = s._segment_path(s.segments[-1])
+        size = os.path.getsize(path)
+        with open(path, 'r+b') as f:
+            f.truncate(size - 1)
+
+        s = self._spool()
+        self.assertEqual(2, s.depth)
+        s.append(self._record(3))
+        self.assertEqual([0, 1, 3], self._volumes(s.peek(100)))
+
+    def test_max_size(self):
+        s = self._spool(segment_size=512, max_size=2048)
+        for i in range(200):
+            s.append(self._record(i))
+        self.assertTrue(sum(s.sizes.values()) <= 2048 + 512)
+        volumes = self._volumes(s.peek(1000))
+        self.assertEqual(s.depth, len(volumes))
+        self.assertEqual(list(range(200 - len(volumes), 200)), volumes)
+
+    def test_age(self):
+        s = self._spool()
+        self.assertEqual(0, s.age())
+        with mock.patch('time.time', return_value=1000):
+            s.append(self._record(0))
+        with mock.patch('time.time', return_value=1042):
+            s.append(self._record(1))
+            self.assertEqual(42, s.age())
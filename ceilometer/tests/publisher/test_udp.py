@@ -111,7 +111,8 @@ class TestUDPPublisher(base.BaseTestCase):
     def setUp(self):
         super(TestUDPPublisher, self).setUp()
         self.CONF = self.useFixture(fixture_config.Config()).conf
-        self.CONF.publisher.metering_secret = 'not-so-secret'
+        self.CONF.set_override('metering_secret', 'not-so-secret',
+                               group='publisher')
 
     def test_published(self):
         self.data_sent = []
@@ -139,6 +140,33 @@ class TestUDPPublisher(base.BaseTestCase):
             [utils.meter_message_from_counter(d, "not-so-secret")
              for d in self.test_data]), sorted(sent_counters))
 
+    def test_published_batches(self):
+        self.CONF.set_override('max_payload_size', 1000,
+                               group='publisher_udp')
+        self.data_sent = []
+        with mock.patch('socket.socket',
+                        self._make_fake_socket(self.data_sent)):
+            publisher = udp.UDPPublisher(
+                netutils.urlsplit('udp://somehost'))
+        publisher.publish_samples(None,
+                                  self.test_data)
+
+        self.assertTrue(1 < len(self.data_sent) < 5)
+        sent_counters = []
+        for data, dest in self.data_sent:
+            self.assertTrue(len(data) <= 1000)
+            sent_counters.extend(msgpack.loads(data))
+
+        self.assertEqual(sorted(
+            [utils.meter_message_from_counter(d, "not-so-secret")
+             for d in self.test_data]), sorted(sent_counters))
+
+    def test_pack_batches_large_message(self):
+        messages = [{'a': 'x' * 100}, {'b': 'y'}]
+        batches = list(udp.pack_batches(messages, 50))
+        self.assertEqual([[m] for m in messages],
+                         [msgpack.loads(b) for b in batches])
+
     @staticmethod
     def _raise_ioerror(*args):
         raise IOError
@@ -18,10 +18,17 @@
 # under the License.
 """Tests for ceilometer/publisher/utils.py
 """
+import hashlib
+import hmac
+
+import mock
 from oslo.serialization import jsonutils
 from oslotest import base
+import six
 
 from ceilometer.publisher import utils
+from ceilometer import sample
+from ceilometer import utils as ceilometer_utils
 
 
 class TestSignature(base.BaseTestCase):
@@ -59,6 +66,26 @@ class TestSignature(base.BaseTestCase):
         sig2 = utils.compute_signature(data, 'different-value')
         self.assertNotEqual(sig1, sig2)
 
+    def test_compute_signature_canonical(self):
+        data = {'a': 'A',
+                'b': 1.5,
+                u'c\xe9': u'C\xe9\u0437',
+                'nested': {'a': None,
+                           'b': {'c': ('c', 1)},
+                           'd': ['d', {'z': 'Z', 'y': 'Y'}],
+                           'message_signature': 'nested signature',
+                           },
+                'message_signature': 'signature',
+                }
+        digest_maker = hmac.new('not-so-secret', '', hashlib.sha256)
+        for name, value in ceilometer_utils.recursive_keypairs(data):
+            if name == 'message_signature':
+                continue
+            digest_maker.update(six.text_type(name).encode('utf-8'))
+            digest_maker.update(six.text_type(value).encode('utf-8'))
+        self.assertEqual(digest_maker.hexdigest(),
+                         utils.compute_signature(data, 'not-so-secret'))
+
     def test_verify_signature_signed(self):
         data = {'a': 'A', 'b': 'B'}
         sig1 = utils.compute_signature(data, 'not-so-secret')
@@ -133,3 +160,104 @@ class TestSignature(base.BaseTestCase):
         self.assertFalse(utils.besteffort_compare_digest(hash1, hash3))
         self.assertTrue(utils.besteffort_compare_digest(hash4, hash5))
         self.assertFalse(utils.besteffort_compare_digest(hash4, hash6))
+
+    def test_meter_messages_from_batch(self):
+        samples = [sample.Sample(name='cpu',
+                                 type=sample.TYPE_CUMULATIVE,
+                                 unit='ns',
+                                 volume=i,
+                                 user_id='test_user',
+                                 project_id='test_proj',
+                                 resource_id='test_resource_%d' % i,
+                                 timestamp='2014-10-01T00:00:00',
+                                 resource_metadata={'i': i},
+                                 source='test_source')
+                   for i in range(2)]
+        for s in samples:
+            s.id = 'id-%s' % s.volume
+        batch = sample.SampleBatch.from_samples(samples)
+        messages = utils.meter_messages_from_batch(batch, 'not-so-secret')
+        self.assertEqual(
+            [utils.meter_message_from_counter(s, 'not-so-secret')
+             for s in samples],
+            messages)
+
+    @staticmethod
+    def _samples():
+        return [sample.Sample(name='cpu',
+                              type=sample.TYPE_CUMULATIVE,
+                              unit='ns',
+                              volume=i,
+                              user_id='test_user',
+                              project_id='test_proj',
+                              resource_id='test_resource_%d' % i,
+                              timestamp='2014-10-01T00:00:00',
+                              resource_metadata={'i': i},
+                              source='test_source')
+                for i in range(2)]
+
+    def test_meter_messages_signed_once(self):
+        samples = self._samples()
+        with mock.patch.object(utils, 'compute_signature',
+                               wraps=utils.compute_signature) as sign:
+            messages = utils.meter_messages(samples, 'not-so-secret')
+            again = utils.meter_messages(samples, 'not-so-secret')
+            self.assertEqual(2, sign.call_count)
+            other = utils.meter_messages(samples, 'different-value')
+            self.assertEqual(4, sign.call_count)
+
+            samples[0].source = 'other_source'
+            changed = utils.meter_messages(samples, 'different-value')
+            self.assertEqual(5, sign.call_count)
+
+        # verify_signature computes the signature too, check them unpatched
+        for msg, msg_again in zip(messages, again):
+            self.assertIs(msg, msg_again)
+            self.assertTrue(utils.verify_signature(msg, 'not-so-secret'))
+        self.assertTrue(utils.verify_signature(other[0], 'different-value'))
+        self.assertEqual('other_source', changed[0]['source'])
+        self.assertIs(other[1], changed[1])
+
+    def test_meter_messages_batch_signed_once(self):
+        samples = self._samples()
+        for s in samples:
+            s.id = 'id-%s' % s.volume
+        batch = sample.SampleBatch.from_samples(samples)
+        messages = utils.meter_messages(batch, 'not-so-secret')
+        self.assertIs(messages, utils.meter_messages(batch, 'not-so-secret'))
+        self.assertEqual(
+            utils.meter_messages_from_batch(batch, 'not-so-secret'),
+            messages)
+
+    def test_pack_batch(self):
+        samples = self._samples()
+        # equal but distinct metadata are listed once too
+        samples[1].resource_metadata = {'i': 0}
+        samples.append(samples[0])
+        messages = utils.meter_messages(samples, 'not-so-secret')
+        envelope = utils.pack_batch(messages)
+        self.assertTrue(utils.is_batch(envelope))
+        self.assertEqual(1, len(envelope['metadata']))
+        self.assertEqual(['test_source'], envelope['values']['source'])
+        self.assertEqual(2, len(envelope['values']['resource_id']))
+        self.assertEqual(3, len(envelope['samples']))
+        self.assertTrue(len(jsonutils.dumps(envelope)) <
+                        len(jsonutils.dumps(messages)))
+
+        unpacked = utils.unpack_batch(jsonutils.loads(
+            jsonutils.dumps(envelope)))
+        self.assertEqual(messages, unpacked)
+        for msg in unpacked:
+            self.assertTrue(utils.verify_signature(msg, 'not-so-secret'))
+
+    def test_pack_batch_unknown_keys(self):
+        messages = utils.meter_messages(self._samples(), 'not-so-secret')
+        messages[0] = dict(messages[0], recorded_at='2014-10-01T00:00:00')
+        self.assertIs(messages, utils.pack_batch(messages))
+        self.assertFalse(utils.is_batch(messages))
+
+    def test_unpack_batch_newer_version(self):
+        envelope = utils.pack_batch(
+            utils.meter_messages(self._samples(), 'not-so-secret'))
+        envelope['ceilometer_batch'] = utils.BATCH_VERSION + 1
+        self.assertRaises(ValueError, utils.unpack_batch, envelope)
@@ -192,3 +192,39 @@ class TestDecoupledPipeline(pipeline_base.BasePipelineTestCase):
         self.assertEqual(len(transformed_samples), 2)
         self.assertEqual([getattr(s, 'name') for s in transformed_samples],
                          ['a', 'b'])
+
+    def test_selective_transformer_chain(self):
+        self._set_pipeline_cfg('counters', ['a', 'b'])
+        self._set_pipeline_cfg('transformers', [
+            {'name': 'unit_conversion',
+             'parameters': {'apply_to': ['a*'],
+                            'target': {'name': 'a_scaled'}}},
+            {'name': 'update', 'parameters': {}},
+        ])
+        pipeline_manager = pipeline.PipelineManager(self.pipeline_cfg,
+                                                    self.transformer_manager)
+        counter_b = sample.Sample(
+            name='b',
+            type=self.test_counter.type,
+            volume=self.test_counter.volume,
+            unit=self.test_counter.unit,
+            user_id=self.test_counter.user_id,
+            project_id=self.test_counter.project_id,
+            resource_id=self.test_counter.resource_id,
+            timestamp=self.test_counter.timestamp,
+            resource_metadata=self.test_counter.resource_metadata,
+        )
+
+        for publisher in pipeline_manager.publishers(None):
+            with publisher as p:
+                p([self.test_counter, counter_b])
+
+        publisher = pipeline_manager.pipelines[0].publishers[0]
+        self.assertEqual(['a_scaled_update', 'b_update'],
+                         [getattr(s, 'name') for s in publisher.samples])
+
+        sink = pipeline_manager.pipelines[0].sink
+        self.assertEqual([0, 1], [i for i, t in sink._chain(0, 'a')])
+        self.assertEqual([1], [i for i, t in sink._chain(0, 'b')])
+        sink.reset_chains()
+        self.assertEqual({}, sink._chains)
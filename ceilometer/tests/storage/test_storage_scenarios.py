@@ -2302,6 +2302,54 @@ class CounterDataTypeTest(DBTestBase,
         self.assertEqual(results[0].counter_volume, 1938495037.53697)
 
 
+class RecordBatchTest(DBTestBase,
+                      tests_db.MixinTestsWithBackendScenarios):
+    def prepare_data(self):
+        self.msgs = []
+        for i in range(6):
+            s = sample.Sample(
+                'instance' if i % 2 else 'cpu',
+                sample.TYPE_CUMULATIVE,
+                unit='',
+                volume=i,
+                user_id='user-id',
+                project_id='project-id',
+                resource_id='resource-id-%d' % (i % 3),
+                timestamp=datetime.datetime(2012, 7, 2, 10, 40 + i),
+                resource_metadata={'display_name': 'test-server',
+                                   'tag': 'counter-%d' % i},
+                source='test-1',
+            )
+            self.msgs.append(utils.meter_message_from_counter(
+                s, self.CONF.publisher.metering_secret))
+        self.conn.record_metering_data_batch(self.msgs)
+
+    def test_get_samples(self):
+        results = list(self.conn.get_samples(storage.SampleFilter()))
+        self.assertEqual(6, len(results))
+        self.assertEqual(set(m['message_id'] for m in self.msgs),
+                         set(r.message_id for r in results))
+
+        results = list(self.conn.get_samples(storage.SampleFilter(
+            meter='cpu', resource='resource-id-1')))
+        self.assertEqual(1, len(results))
+        self.assertEqual(4, results[0].counter_volume)
+        self.assertEqual({'display_name': 'test-server',
+                          'tag': 'counter-4'}, results[0].resource_metadata)
+
+    def test_get_resources(self):
+        resources = dict((r.resource_id, r)
+                         for r in self.conn.get_resources())
+        self.assertEqual(set(['resource-id-0', 'resource-id-1',
+                              'resource-id-2']), set(resources))
+        resource = resources['resource-id-2']
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 42),
+                         resource.first_sample_timestamp)
+        self.assertEqual(datetime.datetime(2012, 7, 2, 10, 45),
+                         resource.last_sample_timestamp)
+        self.assertEqual('counter-5', resource.metadata['tag'])
+
+
 class AlarmTestBase(DBTestBase):
     def add_some_alarms(self):
         alarms = [alarm_models.Alarm(alarm_id='r3d',
@@ -0,0 +1,135 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/checkpoint.py
+"""
+
+import os
+import tempfile
+
+import mock
+from oslo.config import fixture as fixture_config
+from oslotest import base
+
+from ceilometer import checkpoint
+from ceilometer import sample
+from ceilometer.transformer import arithmetic
+from ceilometer.transformer import conversions
+
+
+class TestCheckpoint(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestCheckpoint, self).setUp()
+        self.CONF = self.useFixture(fixture_config.Config()).conf
+        self.path = os.path.join(tempfile.mkdtemp(), 'state')
+        self.CONF.set_override('state_file', self.path, group='checkpoint')
+
+    @staticmethod
+    def _sample(name, volume, timestamp='2014-10-01T00:00:00',
+                resource_id='test_resource'):
+        return sample.Sample(
+            name=name,
+            type=sample.TYPE_CUMULATIVE,
+            unit='ns',
+            volume=volume,
+            user_id='test_user',
+            project_id='test_proj',
+            resource_id=resource_id,
+            timestamp=timestamp,
+            resource_metadata={'cpu_number': 2},
+            source='test_source')
+
+    @staticmethod
+    def _pipeline_manager(transformers, sink_cfg=None):
+        sink = mock.Mock(transformers=transformers,
+                         cfg=sink_cfg or {'name': 'test_sink'})
+        sink.name = 'test_sink'
+        return mock.Mock(pipelines=[mock.Mock(sink=sink)])
+
+    def _restart(self, manager, transformer, sink_cfg=None):
+        checkpoint.save(manager)
+        restored = self._pipeline_manager([transformer], sink_cfg)
+        return checkpoint.restore(restored)
+
+    def test_rate_of_change(self):
+        transformer = conversions.RateOfChangeTransformer()
+        transformer.handle_sample(None, self._sample('cpu', 10 ** 9))
+        new_transformer = conversions.RateOfChangeTransformer()
+        self.assertEqual(1, self._restart(
+            self._pipeline_manager([transformer]), new_transformer))
+        s = new_transformer.handle_sample(
+            None, self._sample('cpu', 2 * 10 ** 9, '2014-10-01T00:00:10'))
+        self.assertEqual(10 ** 8, s.volume)
+
+    def test_aggregator(self):
+        transformer = conversions.AggregatorTransformer(size=3)
+        transformer.handle_sample(None, self._sample('cpu', 1))
+        transformer.handle_sample(None, self._sample('cpu', 2))
+        new_transformer = conversions.AggregatorTransformer(size=3)
+        self.assertEqual(1, self._restart(
+            self._pipeline_manager([transformer]), new_transformer))
+        new_transformer.handle_sample(None, self._sample('cpu', 3))
+        samples = new_transformer.flush(None)
+        self.assertEqual(1, len(samples))
+        self.assertEqual(3, samples[0].volume)
+
+    def test_arithmetic(self):
+        target = {'name': 'cpu_ns_per_cpu',
+                  'expr': '$(cpu) / $(cpu).resource_metadata.cpu_number'}
+        transformer = arithmetic.ArithmeticTransformer(target=target)
+        transformer.handle_sample(None, self._sample('cpu', 10))
+        new_transformer = arithmetic.ArithmeticTransformer(target=target)
+        self.assertEqual(1, self._restart(
+            self._pipeline_manager([transformer]), new_transformer))
+        samples = new_transformer.flush(None)
+        self.assertEqual(1, len(samples))
+        self.assertEqual(5, samples[0].volume)
+
+    def test_changed_sink(self):
+        transformer = conversions.RateOfChangeTransformer()
+        transformer.handle_sample(None, self._sample('cpu', 10 ** 9))
+        new_transformer = conversions.RateOfChangeTransformer()
+        self.assertEqual(0, self._restart(
+            self._pipeline_manager([transformer]), new_transformer,
+            {'name': 'test_sink', 'publishers': ['test://']}))
+        self.assertEqual(0, len(new_transformer.cache))
+
+    def test_stale_checkpoint(self):
+        transformer = conversions.RateOfChangeTransformer()
+        transformer.handle_sample(None, self._sample('cpu', 10 ** 9))
+        with mock.patch('time.time', return_value=1000):
+            checkpoint.save(self._pipeline_manager([transformer]))
+        new_transformer = conversions.RateOfChangeTransformer()
+        with mock.patch('time.time', return_value=1000 + 3601):
+            self.assertEqual(0, checkpoint.restore(
+                self._pipeline_manager([new_transformer])))
+        self.assertEqual(0, len(new_transformer.cache))
+
+    def test_atomic_save(self):
+        transformer = conversions.RateOfChangeTransformer()
+        transformer.handle_sample(None, self._sample('cpu', 10 ** 9))
+        checkpoint.save(self._pipeline_manager([transformer]))
+        with mock.patch('os.rename', side_effect=OSError):
+            self.assertRaises(OSError, checkpoint.save,
+                              self._pipeline_manager([]))
+        new_transformer = conversions.RateOfChangeTransformer()
+        self.assertEqual(1, checkpoint.restore(
+            self._pipeline_manager([new_transformer])))
+
+    def test_missing_or_corrupted_file(self):
+        manager = self._pipeline_manager(
+            [conversions.RateOfChangeTransformer()])
+        self.assertEqual(0, checkpoint.restore(manager))
+        with open(self.path, 'wb') as f:
+            f.write(b'\xc1garbage')
+        self.assertEqual(0, checkpoint.restore(manager))
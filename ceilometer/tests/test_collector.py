@@ -132,6 +132,14 @@ class TestCollector(tests_base.BaseTestCase):
         mock_dispatcher.record_metering_data.assert_called_once_with(
             data=self.counter)
 
+    def test_record_metering_data_batch(self):
+        mock_dispatcher = self._setup_fake_dispatcher()
+        self.srv.dispatcher_manager = dispatcher.load_dispatcher_manager()
+        self.srv.record_metering_data(
+            None, utils.pack_batch([self.utf8_msg, self.utf8_msg]))
+        mock_dispatcher.record_metering_data.assert_called_once_with(
+            data=[self.utf8_msg, self.utf8_msg])
+
     def test_udp_receive_base(self):
         self._setup_messaging(False)
         mock_dispatcher = self._setup_fake_dispatcher()
@@ -151,6 +159,19 @@ class TestCollector(tests_base.BaseTestCase):
         mock_dispatcher.record_metering_data.assert_called_once_with(
             self.counter)
 
+    def test_udp_receive_batch(self):
+        self._setup_messaging(False)
+        mock_dispatcher = self._setup_fake_dispatcher()
+        self.counter['source'] = 'mysource'
+        batch = [self.counter, dict(self.counter, volume=2)]
+
+        udp_socket = self._make_fake_socket(batch)
+
+        with mock.patch('socket.socket', return_value=udp_socket):
+            self.srv.start()
+
+        mock_dispatcher.record_metering_data.assert_called_once_with(batch)
+
     def test_udp_receive_storage_error(self):
         self._setup_messaging(False)
         mock_dispatcher = self._setup_fake_dispatcher()
@@ -254,3 +275,76 @@ class TestCollector(tests_base.BaseTestCase):
                                side_effect=FakeException('boom')):
             self.assertRaises(FakeException, self.srv.sample, {}, 'pub_id',
                               'event', {}, {})
+
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_batch(self, udp_start, rpc_start):
+        mock_dispatcher = self._setup_fake_dispatcher()
+        self.CONF.set_override('batch_size', 2, group='collector')
+        self.srv.start()
+        with mock.patch('eventlet.spawn_after'):
+            self.srv.batcher.add([self.counter])
+            self.assertIsNone(self.srv.sample({}, 'pub_id', 'event',
+                                              [self.utf8_msg], {}))
+        mock_dispatcher.record_metering_data_batch.assert_called_once_with(
+            [self.counter, self.utf8_msg])
+        self.assertFalse(mock_dispatcher.record_metering_data.called)
+
+    @mock.patch.object(oslo.messaging.MessageHandlingServer, 'start')
+    @mock.patch.object(collector.CollectorService, 'start_udp')
+    def test_collector_batch_requeue(self, udp_start, rpc_start):
+        mock_dispatcher = self._setup_fake_dispatcher()
+        mock_dispatcher.record_metering_data_batch.side_effect = (
+            Exception('boom'))
+        self.CONF.set_override('batch_size', 1, group='collector')
+        self.CONF.set_override('requeue_sample_on_dispatcher_error', True,
+                               group='collector')
+        self.srv.start()
+        ret = self.srv.sample({}, 'pub_id', 'event', self.utf8_msg, {})
+        self.assertEqual(oslo.messaging.NotificationResult.REQUEUE, ret)
+
+
+class TestSampleBatcher(tests_base.BaseTestCase):
+    def setUp(self):
+        super(TestSampleBatcher, self).setUp()
+        self.plugin = mock.MagicMock()
+        self.manager = extension.ExtensionManager.make_test_instance([
+            extension.Extension('test', None, None, self.plugin),
+        ])
+        self.spawn_after = self.useFixture(mockpatch.Patch(
+            'eventlet.spawn_after')).mock
+
+    def test_flush_on_size(self):
+        batcher = collector.SampleBatcher(self.manager, 3, 1.0)
+        first = batcher.add([{'counter_volume': 1}])
+        self.spawn_after.assert_called_once_with(1.0, batcher.flush)
+        self.assertFalse(self.plugin.record_metering_data_batch.called)
+        second = batcher.add([{'counter_volume': 2}, {'counter_volume': 3}])
+        self.plugin.record_metering_data_batch.assert_called_once_with(
+            [{'counter_volume': 1}, {'counter_volume': 2},
+             {'counter_volume': 3}])
+        self.spawn_after.return_value.cancel.assert_called_once_with()
+        self.assertTrue(first.wait())
+        self.assertTrue(second.wait())
+        self.assertEqual([], batcher.samples)
+
+    def test_flush_on_timeout(self):
+        batcher = collector.SampleBatcher(self.manager, 100, 0.5)
+        done = batcher.add([{'counter_volume': 1}])
+        batcher.add([{'counter_volume': 2}])
+        self.spawn_after.assert_called_once_with(0.5, batcher.flush)
+        # the timer fires
+        batcher.flush()
+        self.plugin.record_metering_data_batch.assert_called_once_with(
+            [{'counter_volume': 1}, {'counter_volume': 2}])
+        self.assertTrue(done.wait())
+
+    def test_flush_empty(self):
+        batcher = collector.SampleBatcher(self.manager, 100, 0.5)
+        batcher.flush()
+        self.assertFalse(self.plugin.record_metering_data_batch.called)
+
+    def test_dispatcher_failure(self):
+        self.plugin.record_metering_data_batch.side_effect = Exception('boom')
+        batcher = collector.SampleBatcher(self.manager, 1, 0.5)
+        self.assertFalse(batcher.add([{'counter_volume': 1}]).wait())
@@ -31,6 +31,8 @@ class TestNovaClient(base.BaseTestCase):
         super(TestNovaClient, self).setUp()
         self._flavors_count = 0
         self._images_count = 0
+        self.useFixture(mockpatch.Patch('ceilometer.nova_client._CACHES',
+                                        {}))
         self.nv = nova_client.Client()
         self.useFixture(mockpatch.PatchObject(
             self.nv.nova_client.flavors, 'get',
@@ -96,6 +98,17 @@ class TestNovaClient(base.BaseTestCase):
         self.assertEqual(11, instances[0].kernel_id)
         self.assertEqual(21, instances[0].ramdisk_id)
 
+    def test_instance_get_all_by_host_since(self):
+        with mock.patch.object(
+                self.nv.nova_client.servers, 'list',
+                side_effect=self.fake_servers_list) as servers_list:
+            self.nv.instance_get_all_by_host('foobar',
+                                             since='2014-10-01T00:00:00')
+        servers_list.assert_called_once_with(
+            detailed=True,
+            search_opts={'host': 'foobar', 'all_tenants': True,
+                         'changes-since': '2014-10-01T00:00:00'})
+
     def test_instance_get_all(self):
         with mock.patch.object(self.nv.nova_client.servers, 'list',
                                side_effect=self.fake_servers_list):
@@ -238,6 +251,31 @@ class TestNovaClient(base.BaseTestCase):
             self.assertIsNone(instance.kernel_id)
             self.assertIsNone(instance.ramdisk_id)
 
+    def test_with_flavor_and_image_cache_across_calls(self):
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(2, self._flavors_count)
+        self.assertEqual(2, self._images_count)
+        flavors = nova_client._CACHES['flavors']
+        self.assertEqual(2, flavors.hits)
+        self.assertEqual(2, flavors.misses)
+
+    def test_with_flavor_and_image_unknown_image_cache_across_calls(self):
+        self.nv._with_flavor_and_image(self.fake_servers_list_unknown_image())
+        results = self.nv._with_flavor_and_image(
+            self.fake_servers_list_unknown_image())
+        self.assertEqual(1, self._images_count)
+        self.assertEqual('unknown-id-666', results[0].image['name'])
+
+    def test_with_flavor_and_image_cache_ttl(self):
+        self.CONF.set_override('nova_metadata_cache_ttl', 60)
+        with mock.patch('time.time', return_value=1000):
+            self.nv._with_flavor_and_image(self.fake_servers_list())
+        with mock.patch('time.time', return_value=1061):
+            self.nv._with_flavor_and_image(self.fake_servers_list())
+        self.assertEqual(4, self._flavors_count)
+        self.assertEqual(4, self._images_count)
+
     def test_with_missing_image_instance(self):
         instances = self.fake_instance_image_missing()
         results = self.nv._with_flavor_and_image(instances)
@@ -246,6 +284,15 @@ class TestNovaClient(base.BaseTestCase):
         self.assertIsNone(instance.image)
         self.assertIsNone(instance.ramdisk_id)
 
+    def test_with_image(self):
+        instance = mock.MagicMock(image={'id': 1})
+        self.assertIs(instance, self.nv.with_image(instance))
+        self.assertEqual('ubuntu-12.04-x86', instance.image['name'])
+        self.assertEqual(11, instance.kernel_id)
+        self.assertEqual(21, instance.ramdisk_id)
+        self.nv.with_image(mock.MagicMock(image={'id': 1}))
+        self.assertEqual(1, self._images_count)
+
     def test_with_nova_http_log_debug(self):
         self.CONF.set_override("nova_http_log_debug", True)
         self.nv = nova_client.Client()
@@ -0,0 +1,94 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/record_file.py
+"""
+
+import datetime
+import os
+import tempfile
+
+import mock
+from oslotest import base
+
+from ceilometer import record_file
+
+
+class TestRecordFile(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestRecordFile, self).setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'meters')
+
+    @staticmethod
+    def _records(start, count):
+        return [{'counter_name': 'cpu', 'counter_volume': i,
+                 'timestamp': datetime.datetime(2014, 10, 1)}
+                for i in range(start, start + count)]
+
+    def _read_all(self):
+        return [r['counter_volume']
+                for s in record_file.segments(self.path)
+                for r in record_file.read_records(s)]
+
+    def test_write_read(self):
+        writer = record_file.RecordWriter(self.path)
+        writer.write(self._records(0, 3))
+        writer.write(self._records(3, 2))
+        writer.close()
+        records = list(record_file.read_records(self.path))
+        self.assertEqual(list(range(5)),
+                         [r['counter_volume'] for r in records])
+        self.assertEqual('2014-10-01T00:00:00', records[0]['timestamp'])
+
+        # writing goes on at the end of an existing file
+        writer = record_file.RecordWriter(self.path)
+        writer.write(self._records(5, 1))
+        self.assertEqual(list(range(6)), self._read_all())
+
+    def test_rotate_by_size(self):
+        writer = record_file.RecordWriter(self.path, max_bytes=100)
+        for i in range(10):
+            writer.write(self._records(i * 5, 5))
+        self.assertEqual(11, len(record_file.segments(self.path)))
+        self.assertEqual(list(range(50)), self._read_all())
+
+    def test_rotate_by_age(self):
+        with mock.patch('time.time', return_value=1000):
+            writer = record_file.RecordWriter(self.path, max_age=60)
+            writer.write(self._records(0, 1))
+        self.assertEqual([self.path], record_file.segments(self.path))
+        with mock.patch('time.time', return_value=1060):
+            writer.write(self._records(1, 1))
+        self.assertEqual(2, len(record_file.segments(self.path)))
+        self.assertEqual(0, writer.size)
+        self.assertEqual([0, 1], self._read_all())
+
+    def test_compress_and_backup_count(self):
+        writer = record_file.RecordWriter(self.path, max_bytes=1,
+                                          backup_count=3, compress=True)
+        for i in range(5):
+            writer.write(self._records(i * 100, 100))
+        segments = record_file.segments(self.path)
+        self.assertEqual(4, len(segments))
+        for s in segments[:-1]:
+            self.assertTrue(s.endswith(record_file.COMPRESSED_SUFFIX))
+        self.assertTrue(os.path.getsize(segments[0]) < writer.buffer_size)
+        self.assertEqual(list(range(200, 500)), self._read_all())
+
+    def test_truncated_record(self):
+        writer = record_file.RecordWriter(self.path)
+        writer.write(self._records(0, 3))
+        writer.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        self.assertEqual([0, 1], self._read_all())
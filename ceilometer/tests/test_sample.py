@@ -0,0 +1,143 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Tests for ceilometer/sample.py
+"""
+
+import copy
+import operator
+import pickle
+
+import mock
+from oslotest import base
+
+from ceilometer import sample
+
+
+class TestSample(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSample, self).setUp()
+        self.sample = sample.Sample(
+            name='cpu',
+            type=sample.TYPE_CUMULATIVE,
+            unit='ns',
+            volume=1,
+            user_id='test_user',
+            project_id='test_proj',
+            resource_id='test_resource',
+            timestamp='2014-10-01T00:00:00',
+            resource_metadata={'name': 'vm'},
+            source='test_source')
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.sample, '__dict__'))
+        self.assertRaises(AttributeError, setattr, self.sample, 'foo', 1)
+
+    def test_lazy_id(self):
+        with mock.patch('uuid.uuid1', return_value='an-id') as uuid1:
+            self.assertFalse(uuid1.called)
+            self.assertEqual('an-id', self.sample.id)
+            self.assertEqual('an-id', self.sample.id)
+            self.assertEqual(1, uuid1.call_count)
+        self.sample.id = 'another-id'
+        self.assertEqual('another-id', self.sample.id)
+
+    def test_as_dict(self):
+        self.sample.id = 'an-id'
+        d = self.sample.as_dict()
+        self.assertEqual(set(sample.FIELDS + ('id',)), set(d))
+        self.assertEqual('an-id', d['id'])
+        d['volume'] = 2
+        self.assertEqual(1, self.sample.volume)
+
+    def test_as_view(self):
+        view = self.sample.as_view()
+        self.assertEqual(self.sample.as_dict(), dict(view))
+        self.sample.volume = 2
+        self.assertEqual(2, view['volume'])
+        self.assertRaises(KeyError, view.__getitem__, '_id')
+        self.assertRaises(TypeError, operator.setitem, view, 'volume', 3)
+
+    def test_copy_keeps_id(self):
+        for c in (copy.copy(self.sample), copy.deepcopy(self.sample),
+                  pickle.loads(pickle.dumps(self.sample, 2))):
+            self.assertEqual(self.sample.as_dict(), c.as_dict())
+
+
+class TestSampleBatch(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSampleBatch, self).setUp()
+        self.samples = [sample.Sample(
+            name='cpu' if i % 2 else 'memory',
+            type=sample.TYPE_GAUGE,
+            unit='B',
+            volume=i,
+            user_id='test_user',
+            project_id='test_proj',
+            resource_id='test_resource_%d' % (i % 3),
+            timestamp='2014-10-01T00:00:0%d' % (i % 2),
+            resource_metadata={'i': i},
+            source='test_source') for i in range(6)]
+        self.samples[0].id = 'an-id'
+        self.batch = sample.SampleBatch.from_samples(self.samples)
+
+    def test_adapter(self):
+        self.assertEqual(6, len(self.batch))
+        self.assertEqual([s.as_dict() for s in self.samples[:1]],
+                         [s.as_dict() for s in list(self.batch)[:1]])
+        self.assertEqual([s.volume for s in self.samples],
+                         [s.volume for s in self.batch])
+
+    def test_large_int_volumes(self):
+        volume = 2 ** 53 + 1
+        batch = sample.SampleBatch.from_samples(
+            [self.samples[0], sample.Sample(
+                name='cpu', type=sample.TYPE_CUMULATIVE, unit='ns',
+                volume=volume, user_id='test_user', project_id='test_proj',
+                resource_id='test_resource', timestamp='2014-10-01T00:00:00',
+                resource_metadata={})])
+        self.assertEqual(volume, batch[1].volume)
+        self.assertIsInstance(batch[0].volume, int)
+        self.assertEqual(volume, batch.take([1]).volumes[0])
+
+    def test_encoded_columns(self):
+        self.assertEqual(['memory', 'cpu'], self.batch.distinct('name'))
+        self.assertEqual(3, len(self.batch.distinct('resource_id')))
+        self.assertEqual(['test_proj'], self.batch.distinct('project_id'))
+
+    def test_split_by(self):
+        batches = self.batch.split_by('name')
+        self.assertEqual(set(['cpu', 'memory']), set(batches))
+        self.assertEqual([1, 3, 5], [s.volume for s in batches['cpu']])
+        self.assertEqual(['cpu'], batches['cpu'].distinct('name'))
+
+    def test_concat(self):
+        batches = self.batch.split_by('name')
+        batch = sample.SampleBatch.concat([batches['memory'],
+                                           batches['cpu']])
+        self.assertEqual([0, 2, 4, 1, 3, 5], [s.volume for s in batch])
+        self.assertEqual(['memory', 'cpu'], batch.distinct('name'))
+
+    def test_epochs(self):
+        self.assertEqual([1412121600.0, 1412121601.0],
+                         list(self.batch.epochs()[:2]))
+
+    def test_convert(self):
+        converted = self.batch.convert(scale=2, name='memory_kb')
+        self.assertEqual(['memory_kb'], converted.distinct('name'))
+        self.assertEqual([2 * s.volume for s in self.samples],
+                         list(converted.volumes))
+        self.assertEqual([None] * 6, converted.ids)
+        self.assertEqual(self.batch.distinct('unit'),
+                         converted.distinct('unit'))
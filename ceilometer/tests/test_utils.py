@@ -21,6 +21,7 @@
 import datetime
 import decimal
 
+import mock
 from oslotest import base
 
 from ceilometer import utils
@@ -187,3 +188,92 @@ class TestUtils(base.BaseTestCase):
             assignments[k] -= n
         reassigned = len([c for c in assignments if c != 0])
         self.assertTrue(reassigned < num_keys / num_nodes)
+
+
+class TestLRUCache(base.BaseTestCase):
+
+    def test_eviction(self):
+        cache = utils.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        # touching 'a' makes 'b' the least recently used entry
+        self.assertEqual(1, cache.get('a'))
+        cache['c'] = 3
+        self.assertEqual(2, len(cache))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_ttl(self):
+        cache = utils.LRUCache(10, ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            cache['a'] = 1
+        with mock.patch('time.time', return_value=1060):
+            self.assertEqual(1, cache.get('a'))
+        with mock.patch('time.time', return_value=1061):
+            self.assertIsNone(cache.get('a'))
+            self.assertEqual(0, len(cache))
+
+    def test_hits_and_misses(self):
+        cache = utils.LRUCache(10)
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('b')
+        self.assertIn('a', cache)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_pop(self):
+        cache = utils.LRUCache(10)
+        cache['a'] = 1
+        self.assertEqual(1, cache.pop('a'))
+        self.assertIsNone(cache.pop('a'))
+        self.assertEqual(0, len(cache))
+
+    def test_expire(self):
+        cache = utils.LRUCache(10, ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            cache['a'] = 1
+        with mock.patch('time.time', return_value=1030):
+            cache['b'] = 2
+        with mock.patch('time.time', return_value=1070):
+            self.assertEqual(1, cache.expire())
+        self.assertEqual(['b'], list(cache._data))
+
+    def test_expire_recently_used(self):
+        cache = utils.LRUCache(10, ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            cache['a'] = 1
+        with mock.patch('time.time', return_value=1030):
+            cache['b'] = 2
+            # 'b' becomes the least recently used entry
+            cache.get('a')
+        with mock.patch('time.time', return_value=1070):
+            self.assertEqual(1, cache.expire())
+        self.assertEqual(['b'], list(cache._data))
+
+    def test_expire_rewritten(self):
+        cache = utils.LRUCache(10, ttl=60)
+        with mock.patch('time.time', return_value=1000):
+            cache['a'] = 1
+        with mock.patch('time.time', return_value=1030):
+            cache['b'] = 2
+        with mock.patch('time.time', return_value=1040):
+            cache['a'] = 3
+        with mock.patch('time.time', return_value=1095):
+            self.assertEqual(1, cache.expire())
+        self.assertEqual([('a', 3)], cache.items())
+        self.assertEqual(['a'], list(cache._stamps))
+
+    def test_memory_usage(self):
+        cache = utils.LRUCache(10)
+        empty = cache.memory_usage()
+        cache[('cpu', 'resource')] = (1.0, 1000.0)
+        self.assertTrue(cache.memory_usage() > empty)
+
+    def test_items(self):
+        cache = utils.LRUCache(10)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        self.assertEqual([('b', 2), ('a', 1)], cache.items())
@@ -17,10 +17,14 @@
 
 import abc
 import collections
+import fnmatch
+import re
 
 import six
 from stevedore import extension
 
+from ceilometer import sample as sample_util
+
 
 class TransformerExtensionManager(extension.ExtensionManager):
 
@@ -41,6 +45,13 @@ class TransformerExtensionManager(extension.ExtensionManager):
 class TransformerBase(object):
     """Base class for plugins that transform the sample."""
 
+    # whether handle_batch processes whole batches rather than samples
+    batch_capable = False
+
+    # transformers not calling __init__ apply to every meter
+    apply_to = ['*']
+    _apply_to = re.compile(fnmatch.translate('*'))
+
     def __init__(self, **kwargs):
         """Setup transformer.
 
@@ -54,6 +65,8 @@ class TransformerBase(object):
         super(TransformerBase, self).__init__()
         #raise exception if something's wrong with defined meters
         self.apply_to = kwargs.get('apply_to') or ['*']
+        self._apply_to = re.compile('|'.join('(?:%s)' % fnmatch.translate(m)
+                                             for m in self.apply_to))
 
     @abc.abstractmethod
     def handle_sample(self, context, sample):
@@ -65,6 +78,17 @@ class TransformerBase(object):
         :param sample: A sample.
         """
 
+    def handle_batch(self, context, batch):
+        """Transform a batch of samples of a single meter.
+
+        By default the samples of the batch are handled one by one.
+
+        :param context: Passed from the data collector.
+        :param batch: A SampleBatch.
+        """
+        return sample_util.SampleBatch.from_samples(
+            s for s in (self.handle_sample(context, s) for s in batch) if s)
+
     def flush(self, context):
         """Flush samples cached previously.
 
@@ -72,6 +96,28 @@ class TransformerBase(object):
         """
         return []
 
+    def get_state(self):
+        """Return the state cached by the transformer, if any.
+
+        The state is checkpointed on disk, so it must be made of basic
+        types only: numbers, strings, lists and dicts with string keys.
+        """
+        return None
+
+    def set_state(self, state):
+        """Restore a state previously returned by get_state().
+
+        :param state: The checkpointed state.
+        """
+
+    def applies_to(self, meter_name):
+        """Check if the transformer must be applied to a meter.
+
+        :param meter_name: the meter name, matched against the (possibly
+                           wildcarded) meter names in apply_to.
+        """
+        return self._apply_to.match(meter_name) is not None
+
     def must_apply(self, sample):
         """Check if the sample must be tranformed.
 
@@ -81,7 +127,7 @@ class TransformerBase(object):
         :sample: the sample to check.
         """
 
-        return "*" in self.apply_to or sample.name in self.apply_to
+        return self.applies_to(sample.name)
 
 
 class Namespace(object):
@@ -92,17 +138,25 @@ class Namespace(object):
     and missing attributes to yield false when used in a boolean expression.
     """
     def __init__(self, seed):
-        self.__dict__ = collections.defaultdict(lambda: Namespace({}))
-        self.__dict__.update(seed)
-        for k, v in six.iteritems(self.__dict__):
-            if isinstance(v, dict):
-                self.__dict__[k] = Namespace(v)
+        # the seed mapping is wrapped rather than copied, nested mappings
+        # are only wrapped when they are looked up
+        self._seed = seed
 
     def __getattr__(self, attr):
-        return self.__dict__[attr]
+        if attr == '_seed' or attr.startswith('__'):
+            raise AttributeError(attr)
+        return self[attr]
 
     def __getitem__(self, key):
-        return self.__dict__[key]
+        try:
+            value = self._seed[key]
+        except KeyError:
+            return Namespace({})
+        if isinstance(value, collections.Mapping):
+            return Namespace(value)
+        return value
 
     def __nonzero__(self):
-        return len(self.__dict__) > 0
+        return len(self._seed) > 0
+
+    __bool__ = __nonzero__
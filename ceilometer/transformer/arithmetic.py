@@ -15,6 +15,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import ast
 import collections
 import keyword
 import math
@@ -22,6 +23,11 @@ import re
 
 import six
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log
 from ceilometer import sample
@@ -29,6 +35,13 @@ from ceilometer import transformer
 
 LOG = log.getLogger(__name__)
 
+# The expressions may refer to the builtins besides the meters.
+EXPR_GLOBALS = {'__builtins__': six.moves.builtins}
+
+# Nodes of an expression which can be evaluated over NumPy arrays.
+VECTORIZABLE_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Num,
+                      ast.Name, ast.expr_context, ast.operator, ast.unaryop)
+
 
 class ArithmeticTransformer(transformer.TransformerBase):
     """Multi meter arithmetic transformer.
@@ -53,10 +66,55 @@ class ArithmeticTransformer(transformer.TransformerBase):
             self.required_meters = set(self.required_meters)
             self.cache = collections.defaultdict(dict)
             self.latest_timestamp = None
+            try:
+                self._compile()
+            except Exception as e:
+                LOG.warn(_('Unable to compile expression %(expr)s: %(exc)s'),
+                         {'expr': self.expr, 'exc': six.text_type(e)})
+                self.misconfigured = True
         else:
             LOG.warn(_('Arithmetic transformer must use at least one'
                        ' meter in expression \'%s\''), self.expr)
 
+    def _compile(self):
+        """Compile the expression once, for every later evaluation.
+
+        If the meters are only ever used for their volume, a second form of
+        the expression is compiled where each meter name stands directly
+        for its volume, which can be evaluated without building a
+        Namespace per resource, or over NumPy arrays of volumes at once.
+        """
+        tree = ast.parse(self.expr_escaped, mode='eval')
+        volume_refs = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Attribute):
+                if node.attr.startswith('_'):
+                    raise ValueError(_('access to private attribute %s')
+                                     % node.attr)
+                if (isinstance(node.value, ast.Name) and
+                        node.value.id in self.required_meters and
+                        node.attr == 'volume'):
+                    volume_refs.add(node.value)
+        self.code = compile(tree, '<arithmetic>', 'eval')
+
+        names = [node for node in ast.walk(tree)
+                 if isinstance(node, ast.Name)]
+        self.volume_only = all(
+            (node in volume_refs if node.id in self.required_meters
+             else hasattr(six.moves.builtins, node.id))
+            for node in names)
+        self.volume_code = None
+        self.vectorizable = False
+        if self.volume_only:
+            volume_tree = _VolumeRewriter(self.required_meters).visit(tree)
+            ast.fix_missing_locations(volume_tree)
+            self.volume_code = compile(volume_tree, '<arithmetic>', 'eval')
+            self.vectorizable = all(
+                isinstance(node, VECTORIZABLE_NODES) and
+                (not isinstance(node, ast.Name) or
+                 node.id in self.required_meters)
+                for node in ast.walk(volume_tree))
+
     def _update_cache(self, _sample):
         """Update the cache with the latest sample."""
         escaped_name = self.escaped_names.get(_sample.name, '')
@@ -68,13 +126,36 @@ class ArithmeticTransformer(transformer.TransformerBase):
         """Check if all the required meters are available in the cache."""
         return len(self.cache[resource_id]) == len(self.required_meters)
 
-    def _calculate(self, resource_id):
-        """Evaluate the expression and return a new sample if successful."""
-        ns_dict = dict((m, s.as_dict()) for m, s
+    def _evaluate(self, resource_id):
+        """Evaluate the expression for a single resource."""
+        if self.volume_only:
+            ns = dict((m, s.volume) for m, s
+                      in six.iteritems(self.cache[resource_id]))
+            return eval(self.volume_code, EXPR_GLOBALS, ns)
+        ns_dict = dict((m, s.as_view()) for m, s
                        in six.iteritems(self.cache[resource_id]))
         ns = transformer.Namespace(ns_dict)
+        return eval(self.code, EXPR_GLOBALS, ns)
+
+    def _evaluate_batch(self, resource_ids):
+        """Evaluate the expression for all the resources at once.
+
+        :return: an array of the new volumes, in the order of resource_ids
+        """
+        columns = dict((m, numpy.array([self.cache[r][m].volume
+                                        for r in resource_ids]))
+                       for m in self.required_meters)
+        with numpy.errstate(all='raise'):
+            return eval(self.volume_code, EXPR_GLOBALS, columns)
+
+    def _calculate(self, resource_id, new_volume=None):
+        """Evaluate the expression and return a new sample if successful.
+
+        :param new_volume: the volume already evaluated in a batch, if any
+        """
         try:
-            new_volume = eval(self.expr_escaped, {}, ns)
+            if new_volume is None:
+                new_volume = self._evaluate(resource_id)
             if math.isnan(new_volume):
                 raise ArithmeticError(_('Expression evaluated to '
                                         'a NaN value!'))
@@ -93,7 +174,7 @@ class ArithmeticTransformer(transformer.TransformerBase):
             )
         except Exception as e:
             LOG.warn(_('Unable to evaluate expression %(expr)s: %(exc)s'),
-                     {'expr': self.expr, 'exc': str(e)})
+                     {'expr': self.expr, 'exc': six.text_type(e)})
 
     def handle_sample(self, context, _sample):
         if not self.must_apply(_sample):
@@ -105,16 +186,52 @@ class ArithmeticTransformer(transformer.TransformerBase):
     def flush(self, context):
         new_samples = []
         if not self.misconfigured:
+            resource_ids = []
             for resource_id in self.cache:
                 if self._check_requirements(resource_id):
-                    new_samples.append(self._calculate(resource_id))
+                    resource_ids.append(resource_id)
                 else:
                     LOG.warn(_('Unable to perform calculation, not all of '
                                '{%s} are present'),
                              ', '.join(self.required_meters))
+
+            volumes = [None] * len(resource_ids)
+            if self.vectorizable and numpy and len(resource_ids) > 1:
+                try:
+                    volumes = list(self._evaluate_batch(resource_ids))
+                except Exception as e:
+                    # evaluate resource by resource to isolate the failure
+                    LOG.debug(_('Batch evaluation of %(expr)s failed: '
+                                '%(exc)s'), {'expr': self.expr,
+                                             'exc': six.text_type(e)})
+
+            for resource_id, volume in six.moves.zip(resource_ids, volumes):
+                if volume is not None and math.isnan(volume):
+                    volume = None
+                new_sample = self._calculate(resource_id, volume)
+                if new_sample:
+                    new_samples.append(new_sample)
             self.cache.clear()
         return new_samples
 
+    def get_state(self):
+        if self.misconfigured or not self.cache:
+            return None
+        cache = dict((resource_id,
+                      dict((m, s.as_dict()) for m, s in six.iteritems(meters)))
+                     for resource_id, meters in six.iteritems(self.cache))
+        return {'cache': cache, 'latest_timestamp': self.latest_timestamp}
+
+    def set_state(self, state):
+        if self.misconfigured:
+            return
+        for resource_id, meters in six.iteritems(state['cache']):
+            for m, fields in six.iteritems(meters):
+                if m in self.required_meters:
+                    self.cache[resource_id][m] = sample.Sample.from_dict(
+                        fields)
+        self.latest_timestamp = state['latest_timestamp']
+
     @classmethod
     def parse_expr(cls, expr):
         """Transforms meter names in the expression into valid identifiers.
@@ -158,3 +275,17 @@ class ArithmeticTransformer(transformer.TransformerBase):
         replacer = Replacer(expr)
         expr = re.sub(cls.meter_name_re, replacer, expr)
         return expr, replacer.escaped_map
+
+
+class _VolumeRewriter(ast.NodeTransformer):
+    """Replaces the volume accesses of meters with the bare meter names."""
+
+    def __init__(self, meters):
+        self.meters = meters
+
+    def visit_Attribute(self, node):
+        if (isinstance(node.value, ast.Name) and
+                node.value.id in self.meters and node.attr == 'volume'):
+            return ast.copy_location(ast.Name(id=node.value.id,
+                                              ctx=ast.Load()), node)
+        return self.generic_visit(node)
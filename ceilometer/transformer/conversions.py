@@ -15,6 +15,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import calendar
 import collections
 import re
 
@@ -25,6 +26,7 @@ from ceilometer.openstack.common.gettextutils import _
 from ceilometer.openstack.common import log
 from ceilometer import sample
 from ceilometer import transformer
+from ceilometer import utils
 
 LOG = log.getLogger(__name__)
 
@@ -56,7 +58,7 @@ class ScalingTransformer(transformer.TransformerBase):
 
         Either a straight multiplicative factor or else a string to be eval'd.
         """
-        ns = transformer.Namespace(s.as_dict())
+        ns = transformer.Namespace(s.as_view())
 
         scale = self.scale
         return ((eval(scale, {}, ns) if isinstance(scale, six.string_types)
@@ -100,6 +102,29 @@ class ScalingTransformer(transformer.TransformerBase):
             LOG.debug(_('converted to: %s'), (s,))
         return s
 
+    @property
+    def batch_capable(self):
+        # expressions and mappings are evaluated sample by sample
+        return (not isinstance(self.scale, six.string_types) and
+                not self.source.get('map_from'))
+
+    def handle_batch(self, context, batch):
+        """Handle a batch of samples, converting the whole batch at once."""
+        if not batch:
+            return batch
+        if (not self.batch_capable or
+                not self.applies_to(batch.distinct('name')[0])):
+            return super(ScalingTransformer, self).handle_batch(context,
+                                                                batch)
+        unit = self.source.get('unit')
+        if unit is not None and batch.distinct('unit') != [unit]:
+            return super(ScalingTransformer, self).handle_batch(context,
+                                                                batch)
+        values = dict((f, self.target[f]) for f in ('name', 'unit', 'type')
+                      if f in self.target)
+        LOG.debug(_('converting batch of %d samples'), len(batch))
+        return batch.convert(scale=self.scale or None, **values)
+
 
 class RateOfChangeTransformer(ScalingTransformer):
     """Transformer based on the rate of change of a sample volume.
@@ -108,11 +133,36 @@ class RateOfChangeTransformer(ScalingTransformer):
     and producing a gauge value based on the proportion of some maximum used.
     """
 
-    def __init__(self, **kwargs):
-        """Initialize transformer with configured parameters."""
+    batch_capable = False
+
+    def __init__(self, cache_size=100000, cache_ttl=None, **kwargs):
+        """Initialize transformer with configured parameters.
+
+        :param cache_size: maximum number of (meter, resource) previous
+                           volumes kept, least recently seen ones are
+                           evicted first
+        :param cache_ttl: optional number of seconds after which a
+                          previous volume is forgotten
+        """
         super(RateOfChangeTransformer, self).__init__(**kwargs)
-        self.cache = {}
+        # (name, resource_id) -> (volume, epoch timestamp)
+        self.cache = utils.LRUCache(
+            int(cache_size), float(cache_ttl) if cache_ttl else None)
         self.scale = self.scale or '1'
+        # one instance of each meter name, shared by all the cache keys
+        self._names = {}
+        # the samples of a polling cycle share their timestamp
+        self._last_epoch = (None, None)
+
+    def _key(self, name, resource_id):
+        return (self._names.setdefault(name, name), resource_id)
+
+    def _epoch(self, timestamp):
+        if timestamp != self._last_epoch[0]:
+            ts = timeutils.parse_isotime(timestamp)
+            self._last_epoch = (timestamp, calendar.timegm(ts.utctimetuple())
+                                + ts.microsecond / 1e6)
+        return self._last_epoch[1]
 
     def handle_sample(self, context, s):
         """Handle a sample, converting if necessary."""
@@ -120,15 +170,14 @@ class RateOfChangeTransformer(ScalingTransformer):
             return s
 
         LOG.debug(_('handling sample %s'), (s,))
-        key = s.name + s.resource_id
+        key = self._key(s.name, s.resource_id)
         prev = self.cache.get(key)
-        timestamp = timeutils.parse_isotime(s.timestamp)
+        timestamp = self._epoch(s.timestamp)
         self.cache[key] = (s.volume, timestamp)
 
         if prev:
-            prev_volume = prev[0]
-            prev_timestamp = prev[1]
-            time_delta = timeutils.delta_seconds(prev_timestamp, timestamp)
+            prev_volume, prev_timestamp = prev
+            time_delta = timestamp - prev_timestamp
             # we only allow negative deltas for noncumulative samples, whereas
             # for cumulative we assume that a reset has occurred in the interim
             # so that the current volume gives a lower bound on growth
@@ -147,6 +196,27 @@ class RateOfChangeTransformer(ScalingTransformer):
             s = None
         return s
 
+    def flush(self, context):
+        expired = self.cache.expire()
+        if expired:
+            LOG.debug('rate of change transformer forgot %d expired '
+                      'previous volumes', expired)
+        return super(RateOfChangeTransformer, self).flush(context)
+
+    def get_state(self):
+        return {'previous': [[name, resource_id, volume, timestamp]
+                             for (name, resource_id), (volume, timestamp)
+                             in self.cache.items()]}
+
+    def set_state(self, state):
+        for name, resource_id, volume, timestamp in state['previous']:
+            self.cache[self._key(name, resource_id)] = (volume, timestamp)
+
+    def state_usage(self):
+        """Return the number of previous volumes kept and their size."""
+        return {'entries': len(self.cache),
+                'bytes': self.cache.memory_usage()}
+
 
 class AggregatorTransformer(ScalingTransformer):
     """Transformer that aggregates samples.
@@ -167,6 +237,8 @@ class AggregatorTransformer(ScalingTransformer):
                               resource_metadata='drop')
     """
 
+    batch_capable = False
+
     def __init__(self, size=1, retention_time=None,
                  project_id=None, user_id=None, resource_metadata="last",
                  **kwargs):
@@ -254,3 +326,21 @@ class AggregatorTransformer(ScalingTransformer):
             self.initial_timestamp = None
             return x
         return []
+
+    def get_state(self):
+        if not self.initial_timestamp:
+            return None
+        return {'samples': dict((key, s.as_dict())
+                                for key, s in six.iteritems(self.samples)),
+                'counts': dict(self.counts),
+                'initial_timestamp': self.initial_timestamp.isoformat(),
+                'aggregated_samples': self.aggregated_samples}
+
+    def set_state(self, state):
+        self.samples = dict((key, sample.Sample.from_dict(fields))
+                            for key, fields
+                            in six.iteritems(state['samples']))
+        self.counts.update(state['counts'])
+        self.initial_timestamp = timeutils.parse_isotime(
+            state['initial_timestamp'])
+        self.aggregated_samples = state['aggregated_samples']
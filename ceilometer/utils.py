@@ -26,6 +26,13 @@ import decimal
 import hashlib
 import multiprocessing
 import struct
+import sys
+import time
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
 
 from ceilometer.openstack.common import processutils
 from oslo.config import cfg
@@ -238,3 +245,102 @@ class HashRing(object):
             return None
         pos = self._get_position_on_ring(key)
         return self._ring[self._sorted_keys[pos]]
+
+
+class LRUCache(object):
+    """A bounded mapping evicting its least recently used entries.
+
+    :param max_size: maximum number of entries kept in the cache
+    :param ttl: optional number of seconds after which an entry expires
+    """
+
+    _marker = object()
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> value, least recently used first
+        self._data = OrderedDict()
+        # key -> time of the last write, oldest first
+        self._stamps = OrderedDict()
+        # lookups done through get()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        value = self._data.pop(key, self._marker)
+        if value is self._marker:
+            return value
+        if self.ttl is not None and time.time() - self._stamps[key] > self.ttl:
+            del self._stamps[key]
+            return self._marker
+        # re-insert to mark the entry as the most recently used
+        self._data[key] = value
+        return value
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        if value is self._marker:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._stamps.pop(key, None)
+        self._data[key] = value
+        self._stamps[key] = time.time()
+        while len(self._data) > self.max_size:
+            key, __ = self._data.popitem(last=False)
+            del self._stamps[key]
+
+    def pop(self, key, default=None):
+        self._stamps.pop(key, None)
+        return self._data.pop(key, default)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not self._marker
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+        self._stamps.clear()
+
+    def items(self):
+        """Return the (key, value) pairs, least recently used first."""
+        return list(six.iteritems(self._data))
+
+    def expire(self):
+        """Drop the expired entries.
+
+        The write times are kept in order, so this stops at the first
+        entry that has not expired.
+        """
+        if self.ttl is None:
+            return 0
+        limit = time.time() - self.ttl
+        expired = 0
+        while self._stamps:
+            key = next(iter(self._stamps))
+            if self._stamps[key] >= limit:
+                break
+            del self._data[key]
+            del self._stamps[key]
+            expired += 1
+        return expired
+
+    def memory_usage(self):
+        """Return an estimate of the memory held by the entries, in bytes."""
+        size = sys.getsizeof(self._data) + sys.getsizeof(self._stamps)
+        for key, value in six.iteritems(self._data):
+            # the key is shared by both mappings, the write time is a float
+            size += sys.getsizeof(key) + sys.getsizeof(0.0)
+            for item in (key if isinstance(key, tuple) else ()):
+                size += sys.getsizeof(item)
+            size += sys.getsizeof(value)
+            for item in (value if isinstance(value, tuple) else ()):
+                size += sys.getsizeof(item)
+        return size
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the time spent per polling cycle by the compute pollsters.
+
+A fake host runs the instance, cpu, memory and disk pollsters over fake
+instances, with the instance metadata built once per cycle in the polling
+cache, and once per sample as it was before.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_compute_metadata.py --instances 200
+"""
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+from ceilometer.compute.pollsters import allocated_memory
+from ceilometer.compute.pollsters import cpu
+from ceilometer.compute.pollsters import disk
+from ceilometer.compute.pollsters import instance as instance_pollsters
+from ceilometer.compute.pollsters import memory
+from ceilometer.compute.pollsters import util
+from ceilometer.compute.virt import inspector as virt_inspector
+
+
+class FakeInstance(object):
+
+    def __init__(self, i):
+        self.id = 'instance-%d' % i
+        self.name = 'display name %d' % i
+        self.user_id = 'user'
+        self.tenant_id = 'project'
+        self.hostId = 'host'
+        self.status = 'ACTIVE'
+        self.architecture = 'x86_64'
+        self.os_type = 'linux'
+        self.kernel_id = None
+        self.ramdisk_id = None
+        self.reservation_id = 'r-%d' % i
+        self.flavor = {'id': 1, 'name': 'm1.small', 'vcpus': 1, 'ram': 2048,
+                       'disk': 20, 'ephemeral': 0}
+        self.image = {'id': 1, 'name': 'cirros',
+                      'links': [{'rel': 'bookmark', 'href': 'image-1'}]}
+        self.metadata = {'metering.stack': 'stack-%d' % (i % 10)}
+        setattr(self, 'OS-EXT-SRV-ATTR:instance_name', 'instance-%08x' % i)
+        setattr(self, 'OS-EXT-AZ:availability_zone', 'nova')
+
+
+class FakeInspector(virt_inspector.Inspector):
+
+    def inspect_cpus(self, instance_name):
+        return virt_inspector.CPUStats(number=1, time=10 ** 9)
+
+    def inspect_memory_usage(self, instance, duration=None):
+        return virt_inspector.MemoryUsageStats(usage=512)
+
+    def inspect_allocated_memory(self, instance):
+        return virt_inspector.AllocatedMemoryStats(allocated=2048)
+
+    def inspect_disks(self, instance_name):
+        return [(virt_inspector.Disk(device='vda'),
+                 virt_inspector.DiskStats(read_bytes=1, read_requests=1,
+                                          write_bytes=1, write_requests=1,
+                                          errors=0))]
+
+
+class FakeManager(object):
+    inspector = FakeInspector()
+
+
+class Forgetful(dict):
+    """A metadata cache which never keeps anything."""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+POLLSTERS = [instance_pollsters.InstancePollster(),
+             instance_pollsters.InstanceFlavorPollster(),
+             cpu.CPUPollster(),
+             memory.MemoryUsagePollster(),
+             allocated_memory.AllocatedMemoryPollster(),
+             disk.ReadBytesPollster(),
+             disk.ReadRequestsPollster(),
+             disk.WriteBytesPollster(),
+             disk.WriteRequestsPollster()]
+
+
+def poll(instances, memoized):
+    cache = {}
+    if not memoized:
+        cache[util.CACHE_KEY_METADATA] = Forgetful()
+    count = 0
+    for pollster in POLLSTERS:
+        for s in pollster.get_samples(FakeManager(), cache, instances):
+            count += 1
+    return count
+
+
+def benchmark(instances, cycles, memoized):
+    start = time.time()
+    for __ in range(cycles):
+        count = poll(instances, memoized)
+    elapsed = (time.time() - start) / cycles
+    print('%-12s %6d samples/cycle  %8.2f ms/cycle  %6.2f us/sample'
+          % ('memoized' if memoized else 'per sample', count,
+             elapsed * 10 ** 3, elapsed / count * 10 ** 6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--instances', type=int, default=200,
+                        help='number of instances on the fake host')
+    parser.add_argument('--cycles', type=int, default=20,
+                        help='number of polling cycles')
+    args = parser.parse_args()
+    instances = [FakeInstance(i) for i in range(args.instances)]
+    for memoized in (False, True):
+        benchmark(instances, args.cycles, memoized)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the memory and time spent per sample.
+
+The slotted Sample is compared with the former __dict__ based one, both
+alone and run through a rate of change pipeline publishing in memory.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_samples.py --count 100000
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import sys
+import time
+import uuid
+
+from oslo.utils import timeutils
+
+from ceilometer import pipeline
+from ceilometer import sample
+from ceilometer import transformer
+
+
+class DictSample(object):
+    """The Sample as it was before it got slots."""
+
+    def __init__(self, name, type, unit, volume, user_id, project_id,
+                 resource_id, timestamp, resource_metadata, source=None):
+        self.name = name
+        self.type = type
+        self.unit = unit
+        self.volume = volume
+        self.user_id = user_id
+        self.project_id = project_id
+        self.resource_id = resource_id
+        self.timestamp = timestamp
+        self.resource_metadata = resource_metadata
+        self.source = source or 'openstack'
+        self.id = str(uuid.uuid1())
+
+    def as_dict(self):
+        return copy.copy(self.__dict__)
+
+    # the pipeline works on views of the samples
+    as_view = as_dict
+
+
+def make_samples(cls, count):
+    timestamp = timeutils.utcnow().isoformat()
+    return [cls(name='cpu',
+                type=sample.TYPE_CUMULATIVE,
+                unit='ns',
+                volume=i * 10 ** 9,
+                user_id='user',
+                project_id='project',
+                resource_id='resource-%d' % (i % 1000),
+                timestamp=timestamp,
+                resource_metadata={'cpu_number': 1})
+            for i in range(count)]
+
+
+def sample_size(s):
+    size = sys.getsizeof(s)
+    if hasattr(s, '__dict__'):
+        size += sys.getsizeof(s.__dict__)
+    return size
+
+
+def run_pipeline(samples):
+    cfg = {
+        'sources': [{'name': 'cpu_source',
+                     'interval': 600,
+                     'meters': ['cpu'],
+                     'sinks': ['cpu_sink']}],
+        'sinks': [{'name': 'cpu_sink',
+                   'transformers': [
+                       {'name': 'rate_of_change',
+                        'parameters': {
+                            'target': {
+                                'name': 'cpu_util',
+                                'unit': '%',
+                                'type': sample.TYPE_GAUGE,
+                                'scale': '100.0 / (10**9 * '
+                                         '(resource_metadata.cpu_number '
+                                         'or 1))'}}}],
+                   'publishers': ['test://']}],
+    }
+    manager = pipeline.PipelineManager(
+        cfg, transformer.TransformerExtensionManager('ceilometer.transformer'))
+    for publisher in manager.publishers(None):
+        with publisher as p:
+            p(samples)
+    return manager.pipelines[0].publishers[0].samples
+
+
+def benchmark(cls, count):
+    start = time.time()
+    samples = make_samples(cls, count)
+    created = time.time() - start
+
+    size = sum(sample_size(s) for s in samples) / float(count)
+
+    start = time.time()
+    for s in samples:
+        s.as_view()['volume']
+    viewed = time.time() - start
+
+    start = time.time()
+    published = run_pipeline(samples)
+    for s in published:
+        s.id
+    piped = time.time() - start
+
+    print('%-12s %8.0f B/sample  create %6.2f us  view %6.2f us  '
+          'pipeline %6.2f us' % (cls.__name__, size,
+                                 created / count * 10 ** 6,
+                                 viewed / count * 10 ** 6,
+                                 piped / count * 10 ** 6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=100000,
+                        help='number of samples')
+    args = parser.parse_args()
+    for cls in (DictSample, sample.Sample):
+        benchmark(cls, args.count)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Measure the cost of signing the metering messages.
+
+The signature of a typical compute sample is computed with the former
+recursive_keypairs based routine and with compute_signature, checking
+that both give the same digest. Then the messages of a batch of samples
+are built once per publisher, and once for all the publishers of a sink.
+
+Usage:
+
+source .tox/py27/bin/activate
+./tools/benchmark_signature.py --samples 1000 --publishers 3
+"""
+from __future__ import print_function
+
+import argparse
+import hashlib
+import hmac
+import sys
+import time
+
+import six
+
+from ceilometer.publisher import utils as publisher_utils
+from ceilometer import sample
+from ceilometer import utils
+
+SECRET = 'not-so-secret'
+
+
+def reference_signature(message, secret):
+    digest_maker = hmac.new(secret, '', hashlib.sha256)
+    for name, value in utils.recursive_keypairs(message):
+        if name == 'message_signature':
+            continue
+        digest_maker.update(six.text_type(name).encode('utf-8'))
+        digest_maker.update(six.text_type(value).encode('utf-8'))
+    return digest_maker.hexdigest()
+
+
+def make_samples(count):
+    return [sample.Sample(
+        name='cpu',
+        type=sample.TYPE_CUMULATIVE,
+        unit='ns',
+        volume=i * 10 ** 9,
+        user_id='a1d5d7bd7e4b4c5a9bd0b1f0fd3e5a58',
+        project_id='2e1b9ec2f1b34da4a3f16a6a7d5c2c0e',
+        resource_id='5b0c7d6e-1f3a-4c8b-9d2e-%012d' % i,
+        timestamp='2014-10-01T00:00:00.000000',
+        resource_metadata={
+            'display_name': 'instance %d' % i,
+            'host': 'compute-1',
+            'instance_type': 'm1.small',
+            'flavor': {'id': '2', 'name': 'm1.small', 'vcpus': 1,
+                       'ram': 2048, 'disk': 20, 'ephemeral': 0},
+            'image': {'id': 'cirros', 'links': [
+                {'rel': 'bookmark', 'href': 'http://glance/cirros'}]},
+            'status': 'active',
+            'cpu_number': 1,
+        },
+        source='openstack') for i in six.moves.range(count)]
+
+
+def timed(label, count, func, *args):
+    start = time.time()
+    func(*args)
+    elapsed = time.time() - start
+    print('%-28s %8.2f ms  %6.2f us/message'
+          % (label, elapsed * 10 ** 3, elapsed / count * 10 ** 6))
+
+
+def sign_all(messages, compute):
+    for msg in messages:
+        compute(msg, SECRET)
+
+
+def per_publisher(samples, publishers):
+    for __ in six.moves.range(publishers):
+        [publisher_utils.meter_message_from_counter(s, SECRET)
+         for s in samples]
+
+
+def shared(samples, publishers):
+    for __ in six.moves.range(publishers):
+        publisher_utils.meter_messages(samples, SECRET)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='number of samples')
+    parser.add_argument('--publishers', type=int, default=3,
+                        help='number of publishers of the sink')
+    args = parser.parse_args()
+
+    messages = [publisher_utils.meter_message_from_counter(s, SECRET)
+                for s in make_samples(args.samples)]
+    for msg in messages:
+        if (reference_signature(msg, SECRET) !=
+                publisher_utils.compute_signature(msg, SECRET)):
+            print('Signature mismatch for %s' % msg)
+            return 1
+    timed('recursive_keypairs', len(messages), sign_all, messages,
+          reference_signature)
+    timed('compute_signature', len(messages), sign_all, messages,
+          publisher_utils.compute_signature)
+
+    count = args.samples * args.publishers
+    timed('signed per publisher', count, per_publisher,
+          make_samples(args.samples), args.publishers)
+    timed('signed once per sink', count, shared,
+          make_samples(args.samples), args.publishers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())